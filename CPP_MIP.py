@@ -12,6 +12,7 @@ def callback_shadow_constraints(model, where):
     """
     Callback function to add lazy constraints for shadow constraints during the optimization.
     Triggered during the MIPSOL phase where a feasible integer solution is found.
+    The shadow constraints are an Instance.ShadowConstraintIndex, so only the partners of the pairs set to 1 are checked.
 
     Parameters:
         model: The Gurobi model object.
@@ -19,14 +20,14 @@ def callback_shadow_constraints(model, where):
     """
     if where == GRB.Callback.MIPSOL:
         violated_constraints = 0
-        for (i, k, j, l) in model._shadow_constraints:
-            # Ensure both sets of keys exist in the model dictionary to avoid key errors
-            if (i, k) in model._x and (j, l) in model._x:
-                # Retrieve the solution values directly to minimize callback overhead
-                x_ik = model.cbGetSolution(model._x[i, k])
-                x_jl = model.cbGetSolution(model._x[j, l])
-                # Check if both variables are set to 1 (or rounded to 1), indicating a violation
-                if x_ik > 0.5 and x_jl > 0.5:
+        # only pairs (i, k) set to 1 can violate a shadow constraint: look up their partners in the index
+        values = model.cbGetSolution(model._sc_vars)
+        assigned = [key for key, value in zip(model._sc_keys, values) if value > 0.5]
+        assigned_set = set(assigned)
+        for (i, k) in assigned:
+            for (j, l) in model._shadow_constraints.partners(i, k):
+                # a violated constraint is found from both sides: add it once
+                if (j, l) in assigned_set and (i, k) < (j, l):
                     # Add a lazy constraint to enforce that these two activities cannot overlap
                     model.cbLazy(model._x[i, k] + model._x[j, l] <= 1)
                     violated_constraints += 1
@@ -35,8 +36,17 @@ def callback_shadow_constraints(model, where):
         if violated_constraints > 0:
             print(f"{violated_constraints} constraints were violated and addressed.")
 
+def set_shadow_constraint_callback_data(model, x, shadow_constraints):
+    """ Store the shadow constraint index and the variables of all (activity, gate) pairs it contains on the model. """
+    model._shadow_constraints = shadow_constraints
+    model._sc_keys = [key for key in shadow_constraints.keys() if key in x]
+    model._sc_vars = [x[key] for key in model._sc_keys]
+
 
-def build_cpp_model(weights, shadow_constraints):
+def build_cpp_model(weights, shadow_constraints, vertex_names=None):
+    '''weights and shadow_constraints use integer vertex IDs (see Instance.build_integer_ids); vertex_names is only
+    used to print the resulting edges.
+    '''
     print("Solving with CCP: ")
 
     # Initialize the model
@@ -46,7 +56,8 @@ def build_cpp_model(weights, shadow_constraints):
 
     # Decision variables: x[i, j] = 1 if i and j are in the same clique, 0 otherwise
 
-    no_nodes = len(weights)
+    nodes = list(weights.keys())
+    no_nodes = len(nodes)
     x = {}
     for node_i in weights:
         for node_j in weights:
@@ -64,11 +75,11 @@ def build_cpp_model(weights, shadow_constraints):
     print("-----------------------------------------------------")
     print(f"Start, no_nodes = {no_nodes}")
     for i in range(no_nodes):
-        node_i = list(weights.keys())[i]
+        node_i = nodes[i]
         for j in range(i + 1, no_nodes):
-            node_j = list(weights.keys())[j]
+            node_j = nodes[j]
             for k in range(j + 1, no_nodes):
-                node_k = list(weights.keys())[k]
+                node_k = nodes[k]
                 model.addConstr(x[(node_i, node_j)] + x[(node_j, node_k)] - x[(node_i, node_k)] <= 1)
                 model.addConstr(x[(node_i, node_j)] - x[(node_j, node_k)] + x[(node_i, node_k)] <= 1)
                 model.addConstr(-x[(node_i, node_j)] + x[(node_j, node_k)] + x[(node_i, node_k)] <= 1)
@@ -78,13 +89,15 @@ def build_cpp_model(weights, shadow_constraints):
 
     # Store variables and constraints for the callback
     model._x = x
-    model._shadow_constraints = shadow_constraints
+    set_shadow_constraint_callback_data(model, x, shadow_constraints)
     model.optimize(callback_shadow_constraints)  # Optimize with the callback function to add lazy constraints
 
     # Process results
     if model.status == GRB.Status.OPTIMAL:
         print("Optimal solution found with total score:", model.objVal)
-        solution = {f"x[{i},{j}]": x[i, j].X for (i,j) in x if
+        if vertex_names is None:
+            vertex_names = {node: node for node in nodes}
+        solution = {f"x[{vertex_names[i]},{vertex_names[j]}]": x[i, j].X for (i,j) in x if
                     x[i, j].X > 0.5}
         print("Solution edges:", solution)
     else:
@@ -0,0 +1,427 @@
+import numpy as np
+import time
+import io
+import contextlib
+import multiprocessing
+import Instance
+import vertices_weights as vw
+import Heuristic
+from Heuristic import NO_GATE
+
+# Decompositions of an instance into smaller sub-instances (Instance.subset_integer_ids) that are solved with the
+# existing solvers and combined into one solution of the full instance. int_data is the integer-indexed instance of
+# Instance.build_integer_ids; the sub-instances have their own vertex IDs, 'activity_ids'/'gate_ids' map them back.
+
+def pair_time_diff(near_pairs, i, j):
+    """ T[max(i, j), min(i, j)], the time difference that determines the weight of the pair (see
+    vertices_weights.get_weight_array), None if the pair is not in near_pairs (i.e. T >= near_pairs.bound) """
+    row, col = max(i, j), min(i, j)
+    neighbours = near_pairs.neighbours_of(row)
+    k = np.searchsorted(neighbours, col)
+    if k < len(neighbours) and neighbours[k] == col:
+        return near_pairs.time_diff[near_pairs.indptr[row] + k].item()
+    return None
+
+def fix_boundary_activities(int_data, sub, near_pairs, fixed_gate, alpha3, t_max):
+    """ Takes the activities that are already assigned outside of the sub-instance into account (fixed_gate[a]: gate
+    vertex of activity a in the full instance, NO_GATE if it is not assigned yet or at the dummy gate):
+    - a gate is removed from the valid gates of a flight of the sub-instance if one of its activities overlaps a fixed
+      activity at this gate, or if a shadow constraint forbids it together with a fixed activity at its gate
+    - the buffer penalties towards fixed activities are returned as weights between the activities and gates of the
+      sub-instance (sub activities x sub gates), to be added to the weights of the sub-instance
+    Restrictions apply to whole flights, as the valid gates are given per flight. Changes sub in place. """
+    shadow_index = int_data['shadow_index']
+    sub_activities = sub['num_activities']
+    local_gate = {gate: sub_activities + k for k, gate in enumerate(sub['gate_ids'].tolist())}
+    blocked = [set() for _ in range(sub['num_flights'])]
+    gate_weights = np.zeros((sub_activities, sub['num_gates']), dtype=np.float64)
+
+    for local_act, act in enumerate(sub['activity_ids'].tolist()):
+        flight = sub['act_flight'][local_act]
+        # overlaps and buffer time deficits towards fixed activities close in time
+        row = slice(near_pairs.indptr[act], near_pairs.indptr[act + 1])
+        for other, T_row in zip(near_pairs.neighbours[row].tolist(), near_pairs.time_diff[row].tolist()):
+            gate = fixed_gate[other]
+            if gate == NO_GATE or gate not in local_gate:
+                continue
+            T_pair = pair_time_diff(near_pairs, act, other)
+            if T_row < 0 or (T_pair is not None and T_pair < 0):
+                blocked[flight].add(local_gate[gate])
+            elif T_pair is not None and T_pair < t_max:
+                gate_weights[local_act, local_gate[gate] - sub_activities] -= alpha3 * (t_max - T_pair)
+
+        # shadow constraints with a fixed activity at the other gate
+        for local_gate_id in sub['valid_gates'][flight]:
+            gate = sub['gate_ids'][local_gate_id - sub_activities].item()
+            for (other, other_gate) in shadow_index.partners(act, gate):
+                if fixed_gate[other] == other_gate:
+                    blocked[flight].add(local_gate_id)
+                    break
+
+    for flight, gates in enumerate(blocked):
+        for gate in gates:
+            sub['valid_gates'][flight].discard(gate)
+            sub['preferences'][flight].pop(gate, None)
+            sub['valid_gate_matrix'][flight, gate - sub_activities] = False
+    num_blocked = sum(len(gates) for gates in blocked)
+    return gate_weights, num_blocked
+
+def window_weights(sub, gate_weights, alpha1, alpha2, alpha3, t_max, large_negative):
+    """ weight array and NearPairIndex of a sub-instance, incl. the weights towards fixed activities outside of it """
+    sub_activities = sub['num_activities']
+    near_pairs = Instance.build_near_pair_index(sub['time_diff'], t_max)
+    weights = vw.get_weight_array(sub_activities, sub['num_gates'], sub['act_flight'], sub['time_diff'], sub['preferences'],
+                                  sub['act_successor'], sub['valid_gates'], alpha1, alpha2, alpha3, t_max, large_negative,
+                                  near_pairs)
+    # only the valid gates: the others keep large_negative
+    valid = sub['valid_gate_matrix'][sub['act_flight']]
+    gate_weights = np.where(valid, gate_weights, 0)
+    if not (np.issubdtype(weights.dtype, np.integer) and np.array_equal(gate_weights, np.round(gate_weights))):
+        weights = weights.astype(np.float64)
+    gate_weights = gate_weights.astype(weights.dtype)
+    weights[:sub_activities, sub_activities:] += gate_weights
+    weights[sub_activities:, :sub_activities] += gate_weights.T
+    return weights, near_pairs
+
+def restore_consistency(state, M_validGate, activities_to_flights, flights_to_activities, bitsets, act_start, num_activities):
+    """ Checks a combined solution with the feasibility rules of the refinement (Heuristic.is_move_feasible_new): the
+    activities at gates are taken out and put back in order of start time, and a flight with an activity that cannot
+    be put back is moved to an empty cluster (the dummy gate). Needs one empty cluster to hold the activities.
+    Returns the state and the number of flights moved. """
+    at_gate = [act for act in range(num_activities) if state.gate[state.cluster_of[act]] != NO_GATE]
+    at_gate.sort(key=lambda act: act_start[act])
+    target = {act: state.cluster_of[act] for act in at_gate}
+    holding_cluster_id = state.empty_cluster()
+    for act in at_gate:
+        state.move(act, holding_cluster_id)
+
+    num_moved = 0
+    for act in at_gate:
+        if state.cluster_of[act] != holding_cluster_id:     # moved together with an activity of the same flight
+            continue
+        if Heuristic.is_move_feasible_new(act, state, target[act], bitsets, M_validGate, activities_to_flights, num_activities):
+            state.move(act, target[act])
+        else:
+            Heuristic.move_flight_to_empty_cluster(state, flights_to_activities[activities_to_flights[act]])
+            num_moved += 1
+    return state, num_moved
+
+def flight_start_times(int_data):
+    """ start time of the first activity of each flight """
+    act_start = int_data['act_start']
+    return np.array([act_start[activities].min() if len(activities) else 0 for activities in int_data['flight_activities']])
+
+def rolling_window_gate_optimization(int_data, near_pairs, alpha1, alpha2, alpha3, t_max, large_negative,
+                                     window_length, window_overlap, time_limit=None, verbose=False):
+    """ Rolling time-window decomposition of iterative_refinement_gate_optimization for long (multi-day) horizons.
+    The flights are grouped into windows of window_length minutes by the start of their first activity. Window k is
+    solved together with the flights of window k + 1 that start less than window_overlap minutes after its end
+    (look-ahead), with the flights of the previous windows fixed (see fix_boundary_activities); then only the flights
+    of window k are kept. Each window is a sub-instance of its own size (weights, constraints and near pairs), and its
+    constraints are read from the rows of the shadow constraint index, so the cost of the windows grows linearly with
+    the horizon. The windows are stitched into one solution of the full instance (one cluster per gate, the gate-less
+    clusters of the windows), followed by restore_consistency on the full instance as a final consistency pass. Both
+    this pass and the score of the stitched solution (vertices_weights.solution_score) are linear in the number of
+    activities, near pairs and constraints: the weight array of the full instance is never built.
+    near_pairs: Instance.NearPairIndex of the full instance for t_max. time_limit (seconds) is shared among the windows.
+    Returns the solution {cluster ID: vertex IDs}, its score and a list of statistics per window. """
+    t1 = time.time()
+    deadline = t1 + time_limit if time_limit is not None else None
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    flight_start = flight_start_times(int_data)
+    horizon_start = flight_start.min()
+    flight_window = (flight_start - horizon_start) // window_length
+    num_windows = int(flight_window.max()) + 1
+
+    fixed_gate = [NO_GATE] * num_activities     # gate of the activities of the solved windows
+    gateless_groups = []                        # activities of the solved windows that share a cluster without gate
+    window_stats = []
+    for window in range(num_windows):
+        window_flights = np.nonzero(flight_window == window)[0]
+        if not len(window_flights):
+            continue
+        window_end = horizon_start + (window + 1) * window_length
+        lookahead = np.nonzero((flight_window == window + 1) & (flight_start < window_end + window_overlap))[0]
+        t2 = time.time()
+
+        sub = Instance.subset_integer_ids(int_data, np.concatenate([window_flights, lookahead]))
+        gate_weights, num_blocked = fix_boundary_activities(int_data, sub, near_pairs, fixed_gate, alpha3, t_max)
+        sub_weights, sub_near_pairs = window_weights(sub, gate_weights, alpha1, alpha2, alpha3, t_max, large_negative)
+        window_time_limit = None if deadline is None else max(deadline - time.time(), 0) / (num_windows - window)
+        with contextlib.redirect_stdout(io.StringIO()) if not verbose else contextlib.nullcontext():
+            solution, score = Heuristic.iterative_refinement_gate_optimization(
+                sub['num_activities'], sub['num_gates'], sub_weights, sub['act_successor'], sub['valid_gates'],
+                sub['preferences'], sub['shadow_index'], sub['num_flights'], sub['act_flight'], sub['act_kind'],
+                sub['flight_activities'], large_negative, sub['gate_kind'], sub_near_pairs, time_limit=window_time_limit,
+                act_start=sub['act_start'])
+
+        # keep the activities of the window's own flights, in the global IDs
+        kept = np.isin(sub['flight_ids'][sub['act_flight']], window_flights)
+        for cluster_id in solution:
+            gate = NO_GATE
+            activities = []
+            for vertex in solution[cluster_id]:
+                if Heuristic.vertex_is_act(vertex, sub['num_activities']):
+                    if kept[vertex]:
+                        activities.append(sub['activity_ids'][vertex].item())
+                else:
+                    gate = sub['gate_ids'][vertex - sub['num_activities']].item()
+            if gate != NO_GATE:
+                for act in activities:
+                    fixed_gate[act] = gate
+            elif activities:
+                gateless_groups.append(activities)
+
+        window_stats.append({'window': window, 'start': horizon_start + window * window_length,
+                             'flights': len(window_flights), 'lookahead': len(lookahead),
+                             'activities': sub['num_activities'], 'blocked': num_blocked, 'score': score,
+                             'runtime': time.time() - t2})
+        print(f" • Window {window}: {len(window_flights)} flights (+{len(lookahead)} look-ahead), "
+              f"{sub['num_activities']} activities, {num_blocked} gates blocked by fixed activities, "
+              f"value {Heuristic.readable_score(score)}, {time.time() - t2:.2f} seconds")
+
+    # stitch: cluster g - num_activities holds gate g, the gate-less groups get empty clusters
+    state = Heuristic.ClusterState(num_activities, num_activities + num_gates, num_activities + num_gates + 1)
+    for gate in range(num_activities, num_activities + num_gates):
+        state.add(gate, gate - num_activities)
+    for act in range(num_activities):
+        if fixed_gate[act] != NO_GATE:
+            state.add(act, fixed_gate[act] - num_activities)
+    for activities in gateless_groups:
+        cluster_id = state.empty_cluster()
+        for act in activities:
+            state.add(act, cluster_id)
+
+    # final consistency pass on the full instance
+    bitsets = Heuristic.FeasibilityBitsets(num_activities, int_data['shadow_index'], int_data['act_flight'],
+                                           int_data['flight_activities'], near_pairs)
+    state, num_moved = restore_consistency(state, int_data['valid_gates'], int_data['act_flight'], int_data['flight_activities'],
+                                           bitsets, int_data['act_start'], num_activities)
+    print(f"Consistency pass: {num_moved} flights moved to the dummy gate")
+    solution = state.to_solution()
+    score, _, no_unassigned_activities = vw.solution_score(solution, num_activities, num_gates, int_data['act_flight'],
+                                                           int_data['preferences'], int_data['act_successor'],
+                                                           int_data['valid_gates'], alpha1, alpha2, alpha3, t_max,
+                                                           large_negative, near_pairs)
+    print(f"Stitched {len(window_stats)} windows: {Heuristic.readable_score(score)}, "
+          f"{no_unassigned_activities} unassigned activities. Runtime: {time.time() - t1} seconds.")
+
+    return solution, score, window_stats
+
+def gate_groups(int_data, Gates_N):
+    """ Groups of gates that interact through shadow constraints: the connected components of the neighbour matrix
+    Gates_N (gates g1, g2 with Gates_N = 1 or -1, as in Instance.build_ShadowConstraint_arrays). Gates of different
+    groups only interact through flights that are valid at both. Returns the group of each gate (index g - num_activities)
+    and the gate vertex IDs of each group. """
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    gate_names = int_data['vertex_names'][num_activities:]
+    neighbours = Instance.gate_neighbours(Gates_N, gate_names)
+
+    gate_group = np.full(num_gates, -1, dtype=np.int64)
+    groups = []
+    for first_gate in range(num_gates):
+        if gate_group[first_gate] >= 0:
+            continue
+        gate_group[first_gate] = len(groups)
+        component = [first_gate]
+        stack = [first_gate]
+        while stack:
+            gate = stack.pop()
+            for other in np.nonzero(neighbours[gate] | neighbours[:, gate])[0].tolist():
+                if gate_group[other] < 0:
+                    gate_group[other] = len(groups)
+                    component.append(other)
+                    stack.append(other)
+        groups.append(sorted(num_activities + gate for gate in component))
+    return gate_group, groups
+
+def flight_gate_groups(int_data, gate_group, num_groups):
+    """ The groups in which each flight has a valid gate (by gate compatibility), and its home group: among the groups
+    of its most preferred valid gates, the one with the least occupied time per gate so far (flights in order of start
+    time). Flights without valid gate have home group -1. """
+    num_activities = int_data['num_activities']
+    act_duration = int_data['act_end'] - int_data['act_start']
+    group_size = np.bincount(gate_group, minlength=num_groups)
+    group_load = np.zeros(num_groups)
+    flight_groups = []
+    home_group = np.full(int_data['num_flights'], -1, dtype=np.int64)
+    for flight in np.argsort(flight_start_times(int_data), kind='stable').tolist():
+        preferences = int_data['preferences'][flight]
+        if not preferences:
+            continue
+        best_preference = max(preferences.values())
+        best_groups = {gate_group[gate - num_activities].item() for gate, pref in preferences.items() if pref == best_preference}
+        home_group[flight] = min(sorted(best_groups), key=lambda group: group_load[group] / group_size[group])
+        group_load[home_group[flight]] += act_duration[int_data['flight_activities'][flight]].sum()
+    for flight in range(int_data['num_flights']):
+        flight_groups.append(sorted({gate_group[gate - num_activities].item() for gate in int_data['valid_gates'][flight]}))
+    return flight_groups, home_group
+
+def fgs_solution(sub, alpha1, alpha2, alpha3, t_max):
+    """ Solves a sub-instance with the FGS MIP and returns the assignment as a clustering of the sub-instance: one
+    cluster per gate, the activities at the dummy gate in one cluster per flight """
+    import FGS_MIP as fgs     # gurobipy is only needed for this solver
+    num_activities = sub['num_activities']
+    num_flights, num_gates, P_preferences, U_successor, T_timeDiff, M_validGate, shadow_constraints = fgs.fgs_inputs_from_ids(sub)
+    model, x, tows = fgs.build_FGS_model(num_flights, num_gates, P_preferences, U_successor, T_timeDiff, M_validGate,
+                                         shadow_constraints, alpha1, alpha2, alpha3, t_max)
+    assignment = model.getAttr('X', x) if model.SolCount > 0 else {}
+
+    solution = {k: [num_activities + k] for k in range(num_gates)}
+    dummy = {}      # flight -> activities at the dummy gate
+    for i in range(num_activities):
+        gate = next((k for k in range(num_gates) if assignment.get((i, k), 0) > 0.5), None)
+        if gate is None:
+            dummy.setdefault(sub['act_flight'][i].item(), []).append(i)
+        else:
+            solution[gate].append(i)
+    for activities in dummy.values():
+        solution[len(solution)] = activities
+    return solution
+
+def _solve_gate_group(task):
+    group, sub, sub_weights, alpha1, alpha2, alpha3, t_max, large_negative, solver, time_limit = task
+    t1 = time.time()
+    num_activities = sub['num_activities']
+    with contextlib.redirect_stdout(io.StringIO()):
+        if solver == "FGS":
+            solution = fgs_solution(sub, alpha1, alpha2, alpha3, t_max)
+        else:
+            near_pairs = Instance.build_near_pair_index(sub['time_diff'], t_max)
+            solution, _ = Heuristic.iterative_refinement_gate_optimization(
+                num_activities, sub['num_gates'], sub_weights, sub['act_successor'], sub['valid_gates'], sub['preferences'],
+                sub['shadow_index'], sub['num_flights'], sub['act_flight'], sub['act_kind'], sub['flight_activities'],
+                large_negative, sub['gate_kind'], near_pairs, time_limit=time_limit, act_start=sub['act_start'])
+    score, _, no_unassigned_activities = Heuristic.calculate_total_score(solution, sub_weights, large_negative, num_activities)
+    stats = {'group': group, 'gates': sub['num_gates'], 'flights': sub['num_flights'], 'activities': num_activities,
+             'score': score, 'unassigned': no_unassigned_activities, 'runtime': time.time() - t1}
+    return solution, stats
+
+def placement_value(activities, state, weights, large_negative, num_activities):
+    """ contribution of the activities (of one flight) to calculate_total_score in their current clusters: the weights
+    to all other vertices of their clusters (pairs within the activities once) and the dummy gate penalties """
+    members = set(activities)
+    value = 0
+    for act in activities:
+        cluster_id = state.cluster_of[act]
+        others = [vertex for vertex in state[cluster_id] if vertex != act]
+        if others:
+            row = weights[act, others]
+            # pairs with another activity of the flight are counted from both sides: halve them
+            own = [k for k, vertex in enumerate(others) if vertex in members]
+            value += 2 * row.sum().item() - row[own].sum().item()
+        if state.gate[cluster_id] == NO_GATE:
+            value += large_negative
+    return value
+
+def reinsert_flights(state, flights, weights, large_negative, M_validGate, activities_to_flights, flights_to_activities,
+                     bitsets, act_start, num_activities):
+    """ Moves each of the flights, in order of start time, as a whole to the valid gate where its activities are feasible
+    (Heuristic.is_move_feasible_new) and contribute most to the score, if that is better than its current placement.
+    Used as the coordination pass over the flights that are valid in several gate groups. Needs one empty cluster.
+    Returns the state and the number of flights moved. """
+    num_moved = 0
+    for flight in sorted(flights, key=lambda flight: min(act_start[act] for act in flights_to_activities[flight])):
+        activities = list(flights_to_activities[flight])
+        if not activities:
+            continue
+        origin = {act: state.cluster_of[act] for act in activities}
+        best_value = placement_value(activities, state, weights, large_negative, num_activities)
+        best_cluster_id = None
+
+        holding_cluster_id = state.empty_cluster()
+        for act in activities:
+            state.move(act, holding_cluster_id)
+        for gate in sorted(M_validGate[flight]):
+            target_cluster_id = state.cluster_of[gate]
+            placed = []
+            for act in activities:
+                if not Heuristic.is_move_feasible_new(act, state, target_cluster_id, bitsets, M_validGate,
+                                                      activities_to_flights, num_activities):
+                    break
+                state.move(act, target_cluster_id)
+                placed.append(act)
+            if len(placed) == len(activities):
+                value = placement_value(activities, state, weights, large_negative, num_activities)
+                if value > best_value:
+                    best_value, best_cluster_id = value, target_cluster_id
+            for act in placed:
+                state.move(act, holding_cluster_id)
+
+        for act in activities:
+            state.move(act, origin[act] if best_cluster_id is None else best_cluster_id)
+        num_moved += best_cluster_id is not None
+    return state, num_moved
+
+def spatial_gate_optimization(int_data, Gates_N, weights, near_pairs, alpha1, alpha2, alpha3, t_max, large_negative,
+                              num_processes=None, solver="Heuristic", time_limit=None):
+    """ Spatial decomposition by gate groups (gate_groups: components of Gates_N). Every flight is solved in its home
+    group (the group of its most preferred valid gate, see flight_gate_groups); the groups are independent sub-instances,
+    solved in parallel on num_processes processes (None: all cores) with iterative_refinement_gate_optimization
+    (solver "Heuristic", time_limit in seconds) or the FGS MIP (solver "FGS", no time limit). The weights of a group are
+    the rows/columns of its vertices in weights (weight array of the full instance).
+    The group solutions are combined into one solution of the full instance and checked with restore_consistency.
+    A coordination pass (reinsert_flights) then reassigns the flights that are valid in several groups.
+    Returns the solution {cluster ID: vertex IDs}, its score and a list of statistics per group. """
+    t1 = time.time()
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    weights = np.asarray(weights[:, :])
+    gate_group, groups = gate_groups(int_data, Gates_N)
+    flight_groups, home_group = flight_gate_groups(int_data, gate_group, len(groups))
+    shared_flights = [flight for flight, flight_group in enumerate(flight_groups) if len(flight_group) > 1]
+    print(f"{len(groups)} gate groups: {[len(gates) for gates in groups]} gates, "
+          f"{len(shared_flights)} of {int_data['num_flights']} flights are valid in several groups")
+
+    tasks = []
+    subs = []
+    for group, gates in enumerate(groups):
+        group_flights = np.nonzero(home_group == group)[0]
+        if not len(group_flights):
+            continue
+        sub = Instance.subset_integer_ids(int_data, group_flights, gates)
+        vertices = np.concatenate([sub['activity_ids'], sub['gate_ids']])
+        tasks.append((group, sub, weights[np.ix_(vertices, vertices)], alpha1, alpha2, alpha3, t_max, large_negative,
+                      solver, time_limit))
+        subs.append(sub)
+    with multiprocessing.Pool(num_processes) as pool:
+        results = pool.map(_solve_gate_group, tasks)
+
+    # combine: cluster g - num_activities holds gate g, the gate-less clusters of the groups get empty clusters
+    state = Heuristic.ClusterState(num_activities, num_activities + num_gates, num_activities + num_gates + 1)
+    for gate in range(num_activities, num_activities + num_gates):
+        state.add(gate, gate - num_activities)
+    for sub, (solution, stats) in zip(subs, results):
+        for cluster_id in solution:
+            gate = NO_GATE
+            activities = []
+            for vertex in solution[cluster_id]:
+                if Heuristic.vertex_is_act(vertex, sub['num_activities']):
+                    activities.append(sub['activity_ids'][vertex].item())
+                else:
+                    gate = sub['gate_ids'][vertex - sub['num_activities']].item()
+            target_cluster_id = gate - num_activities if gate != NO_GATE else state.empty_cluster()
+            for act in activities:
+                state.add(act, target_cluster_id)
+        print(f" • Group {stats['group']}: {stats['gates']} gates, {stats['flights']} flights, "
+              f"value {Heuristic.readable_score(stats['score'])}, {stats['unassigned']} unassigned activities, "
+              f"{stats['runtime']:.2f} seconds")
+    # flights without any valid gate are at the dummy gate
+    for flight in np.nonzero(home_group < 0)[0].tolist():
+        cluster_id = state.empty_cluster()
+        for act in int_data['flight_activities'][flight]:
+            state.add(act, cluster_id)
+
+    bitsets = Heuristic.FeasibilityBitsets(num_activities, int_data['shadow_index'], int_data['act_flight'],
+                                           int_data['flight_activities'], near_pairs)
+    state, num_removed = restore_consistency(state, int_data['valid_gates'], int_data['act_flight'], int_data['flight_activities'],
+                                             bitsets, int_data['act_start'], num_activities)
+    state, num_moved = reinsert_flights(state, shared_flights, weights, large_negative, int_data['valid_gates'],
+                                                 int_data['act_flight'], int_data['flight_activities'], bitsets,
+                                                 int_data['act_start'], num_activities)
+    solution = state.to_solution()
+    score, _, no_unassigned_activities = Heuristic.calculate_total_score(solution, weights, large_negative, num_activities)
+    print(f"Consistency pass: {num_removed} flights moved to the dummy gate; coordination pass: {num_moved} shared flights "
+          f"reassigned. Combined value: {Heuristic.readable_score(score)}, {no_unassigned_activities} unassigned activities. "
+          f"Runtime: {time.time() - t1} seconds.")
+
+    return solution, score, [stats for (solution, stats) in results]
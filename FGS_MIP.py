@@ -1,5 +1,7 @@
+import numpy as np
 import gurobipy as gp
 from gurobipy import Model, GRB, quicksum
+import Instance
 
 
 # Callback function to add lazy constraints
@@ -7,6 +9,7 @@ def callback_shadow_constraints(model, where):
     """
     Callback function to add lazy constraints for shadow constraints during the optimization.
     Triggered during the MIPSOL phase where a feasible integer solution is found.
+    The shadow constraints are an Instance.ShadowConstraintIndex, so only the partners of the pairs set to 1 are checked.
 
     Parameters:
         model: The Gurobi model object.
@@ -14,14 +17,14 @@ def callback_shadow_constraints(model, where):
     """
     if where == GRB.Callback.MIPSOL:
         violated_constraints = 0
-        for (i, k, j, l) in model._shadow_constraints:
-            # Ensure both sets of keys exist in the model dictionary to avoid key errors
-            if (i, k) in model._x and (j, l) in model._x:
-                # Retrieve the solution values directly to minimize callback overhead
-                x_ik = model.cbGetSolution(model._x[i, k])
-                x_jl = model.cbGetSolution(model._x[j, l])
-                # Check if both variables are set to 1 (or rounded to 1), indicating a violation
-                if x_ik > 0.5 and x_jl > 0.5:
+        # only pairs (i, k) set to 1 can violate a shadow constraint: look up their partners in the index
+        values = model.cbGetSolution(model._sc_vars)
+        assigned = [key for key, value in zip(model._sc_keys, values) if value > 0.5]
+        assigned_set = set(assigned)
+        for (i, k) in assigned:
+            for (j, l) in model._shadow_constraints.partners(i, k):
+                # a violated constraint is found from both sides: add it once
+                if (j, l) in assigned_set and (i, k) < (j, l):
                     # Add a lazy constraint to enforce that these two activities cannot overlap
                     model.cbLazy(model._x[i, k] + model._x[j, l] <= 1)
                     violated_constraints += 1
@@ -30,6 +33,42 @@ def callback_shadow_constraints(model, where):
         if violated_constraints > 0:
             print(f"{violated_constraints} constraints were violated and addressed.")
 
+def set_shadow_constraint_callback_data(model, x, shadow_constraints):
+    """ Store the shadow constraint index and the variables of all (activity, gate) pairs it contains on the model. """
+    model._shadow_constraints = shadow_constraints
+    model._sc_keys = [key for key in shadow_constraints.keys() if key in x]
+    model._sc_vars = [x[key] for key in model._sc_keys]
+
+def fgs_inputs_from_ids(int_data, dummy_preference=-1000):
+    '''Translate the integer-indexed instance (see Instance.build_integer_ids) into the inputs of build_FGS_model.
+    The model works on activities (its "flights" i) and gate indices 0..num_gates-1, num_gates being the dummy gate.
+    Returns num_flights, num_gates, P_preferences, U_successor, T_timeDiff, M_validGate, shadow_constraints
+    (an Instance.ShadowConstraintIndex over gate indices).
+    '''
+    num_activities = int_data['num_activities']
+    num_gates = int_data['num_gates']
+    act_flight = int_data['act_flight']
+
+    # preferences per activity and gate index; gates that are not valid for the flight get the dummy gate preference
+    P_preferences = {}
+    M_validGate = {}
+    for i in range(num_activities):
+        flight = act_flight[i]
+        P_preferences[i] = [dummy_preference] * num_gates
+        for gate, pref in int_data['preferences'][flight].items():
+            P_preferences[i][gate - num_activities] = pref
+        M_validGate[i] = {gate - num_activities for gate in int_data['valid_gates'][flight]} | {num_gates}
+
+    # activities without successor point to themselves
+    U_successor = {i: (int(succ) if succ >= 0 else i) for i, succ in enumerate(int_data['act_successor'])}
+
+    # T_timeDiff[(i, j)] indexes the array directly; gates in the shadow constraints become gate indices
+    T_timeDiff = int_data['time_diff']
+    local_constraints = int_data['shadow_constraints'] - np.array([0, num_activities, 0, num_activities], dtype=np.int32)
+    shadow_constraints = Instance.ShadowConstraintIndex(local_constraints, num_activities, num_gates, 0)
+
+    return num_activities, num_gates, P_preferences, U_successor, T_timeDiff, M_validGate, shadow_constraints
+
 def build_FGS_model(num_flights, num_gates, P_preferences, U_successor, T_timeDiff, M_validGate, shadow_constraints, alpha1, alpha2, alpha3, t_max):
     model = Model("FlightGateScheduling")
     model.setParam(GRB.Param.LazyConstraints, 1)  # Enable lazy constraints
@@ -90,6 +129,8 @@ def build_FGS_model(num_flights, num_gates, P_preferences, U_successor, T_timeDi
                 model.addConstr(buffer[i, j, k] <= x[j, k], name=f"Buffer_UpperBound2_{i}_{j}_{k}")
 
     # Shadow restrictions (2)
+    # all of them are added to the model, so it is solved without callback_shadow_constraints (which needs
+    # model._x = x and set_shadow_constraint_callback_data, as in CPP_MIP)
     for (i, k, j, l) in shadow_constraints:
         model.addConstr(x[i, k] + x[j, l] <= 1)
 
@@ -127,11 +168,11 @@ T_timeDiff = {
 M_validGate = {0: {0, 1, 3}, 1: {1, 2, 3}, 2: {0, 2, 3}, 3: {1, 3}}
 
 # Other parameters remain unchanged
-shadow_constraints = [
+shadow_constraints = Instance.ShadowConstraintIndex([
     (0, 0, 1, 0),  # Flight 0 and Flight 1 cannot both use Gate 0.
     (1, 2, 2, 2),  # Flight 1 and Flight 2 cannot both use Gate 2.
     (2, 1, 3, 1)   # Flight 2 and Flight 3 cannot both use Gate 1.
-]
+], num_flights, num_gates, 0)
 t_max = 5
 alpha1, alpha2, alpha3 = 1, 0.5, 0.2
 
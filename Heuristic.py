@@ -1,9 +1,24 @@
 import numpy as np
 import time
-import copy
 import random
-
-def calculate_heuristic_value(i, C, D, weights, activities_to_flights, gates_to_indices):
+import heapq
+import io
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+from Instance import ACT_ARR, GATE_REMOTE, NO_SUCCESSOR
+
+DEBUG_SCORE_CHECKS = False      # if True, the incremental scores are checked against calculate_total_score after every move
+
+# All vertices are integer IDs (see Instance.build_integer_ids): activities are 0..num_activities-1, gates follow.
+# weights is the dense array of vertices_weights.get_weight_array (or a vertices_weights.WeightMatrix around it).
+# activities_to_flights, U_successor and act_kind are indexed by activity ID; flights_to_activities, M_validGate and
+# P_preferences are indexed by flight ID and contain activity/gate vertex IDs.
+# near_pairs is the Instance.NearPairIndex of the instance; its overlap lists replace scans over weight rows.
+# shadow_constraints is the Instance.ShadowConstraintIndex of the instance (lookups by (activity, gate) and by gate).
+# Solutions are kept in a ClusterState; functions that only read a solution also accept a dictionary of cluster lists.
+
+def calculate_heuristic_value(i, C, D, weights):
     """ Calculate the heuristic value for moving vertex i from its current cluster C[i] to a new cluster D """
     # C = current cluster (list of all vertices of that cluster)
     # D = new (possibly empty) cluster (list of the vertices of that cluster)
@@ -11,16 +26,44 @@ def calculate_heuristic_value(i, C, D, weights, activities_to_flights, gates_to_
     # sum_weights_new_cluster = sum(weights[i][j] for j in D if j != 'Dum')
     # sum_weights_current_cluster = sum(weights[i][j] for j in C if (j != i and j != 'Dum'))
 
-    sum_weights_new_cluster = sum(weights[i][j] for j in D)
-    sum_weights_current_cluster = sum(weights[i][j] for j in C if (j != i))
+    weights_i = weights[i]     # row view; clusters are small, so plain indexing beats fancy indexing here
+    sum_weights_new_cluster = sum(weights_i[j] for j in D)
+    sum_weights_current_cluster = sum(weights_i[j] for j in C if (j != i))
 
     return sum_weights_new_cluster - sum_weights_current_cluster
 
-def calculate_total_score(solution, weights, large_negative):
+def build_affinity(solution, weights):
+    """ Affinity table: affinity[v, c] = total weight from vertex v to all vertices of cluster c (incl. v itself) """
+    weights = np.asarray(weights[:, :])
+    dtype = np.int64 if np.issubdtype(weights.dtype, np.integer) else np.float64
+    affinity = np.zeros((len(weights), max(solution) + 1), dtype=dtype)
+    for cluster_id in solution:
+        if solution[cluster_id]:
+            affinity[:, cluster_id] = weights[:, list(solution[cluster_id])].sum(axis=1)
+    return affinity
+
+def update_affinity(affinity, weights, vertex, from_cluster_id, to_cluster_id):
+    """ Update the affinity table after moving vertex from one cluster to another (weights are symmetric) """
+    weights_vertex = weights[vertex]
+    affinity[:, from_cluster_id] -= weights_vertex
+    affinity[:, to_cluster_id] += weights_vertex
+
+def affinity_move_value(i, current_cluster_id, target_cluster_id, affinity, weights, nodes_to_clusters):
+    """ Same value as calculate_heuristic_value(i, C, D, weights) for C = solution[current_cluster_id] and
+    D = solution[target_cluster_id], looked up in the affinity table in O(1) """
+    value = affinity[i, target_cluster_id] - affinity[i, current_cluster_id]
+    if nodes_to_clusters[i] == current_cluster_id:     # i itself is excluded from the current cluster
+        value += weights[i, i]
+    return value
+
+def calculate_total_score(solution, weights, large_negative, num_activities):
     score = 0
     for cluster_id in solution:    # cluster or clique
-        clusterActivities = solution[cluster_id]
-        score += sum(weights[i][j] for i in clusterActivities for j in clusterActivities if i != j)
+        clusterActivities = list(solution[cluster_id])
+        if len(clusterActivities) < 2:     # empty and singleton clusters do not contribute
+            continue
+        cluster_weights = weights[clusterActivities][:, clusterActivities]
+        score += (cluster_weights.sum() - cluster_weights.trace()).item()
 
     score_excl_penalties = score
     no_unassigned_activities = 0
@@ -31,7 +74,7 @@ def calculate_total_score(solution, weights, large_negative):
             if contains_gate:
                 continue
             is_activity_vertex = False
-            if not vertex_is_act(vertex): #to check if the vertex is an activity
+            if not vertex_is_act(vertex, num_activities): #to check if the vertex is an activity
                 contains_gate = True
         if not contains_gate:
             score += large_negative * len(solution[cluster_id])
@@ -39,261 +82,459 @@ def calculate_total_score(solution, weights, large_negative):
 
     return score, score_excl_penalties, no_unassigned_activities
 
-def get_gate_of_activity(i, solution):
-    gate_of_i = 'No gate found'
-    for cluster in solution:
-        for activity in solution[cluster][1:]:  # solution[cluster] = ['gate', 'activity1', 'activity2', ...]
-            if activity == i:
-                gate_of_i = solution[cluster][0]
-    return gate_of_i
-
-def vertex_is_act(vertex):
-    for s in ["arr", "dep", "par"]:
-        if vertex.startswith(s):
-            return True
-    return False
-
-def is_move_feasible_new(vertex, current_solution, current_cluster, target_cluster, shadow_constraints, flights_to_activities, activities_to_flights,
-                         nodes_to_clusters, sc_per_act_gate_pair, sc_per_gate, M_validGate, weights, large_negative):
+class ScoreTracker:
+    """ Keeps the values of calculate_total_score (score, score excl. penalties, number of unassigned activities) and the
+    affinity table of a solution up to date while vertices are moved, instead of recomputing them from scratch.
+    A move is undone by moving the vertex back. """
+
+    def __init__(self, solution, weights, large_negative, num_activities):
+        self.weights = weights
+        self.large_negative = large_negative
+        self.num_activities = num_activities
+        self.affinity = build_affinity(solution, weights)
+        self.score, self.score_excl_penalties, self.no_unassigned_activities = (
+            calculate_total_score(solution, weights, large_negative, num_activities))
+        self.cluster_size = {cluster_id: len(solution[cluster_id]) for cluster_id in solution}
+        self.cluster_gates = {cluster_id: sum(1 for vertex in solution[cluster_id] if not vertex_is_act(vertex, num_activities))
+                              for cluster_id in solution}
+
+    def unassigned_in(self, cluster_id):
+        """ activities of a cluster without gate are assigned to the dummy gate """
+        return self.cluster_size[cluster_id] if self.cluster_gates[cluster_id] == 0 else 0
+
+    def move_delta(self, vertex, from_cluster_id, to_cluster_id):
+        """ change of the clique score (excl. penalties) if vertex moves (counted in both directions) """
+        return 2 * (self.affinity[vertex, to_cluster_id] - self.affinity[vertex, from_cluster_id] + self.weights[vertex, vertex]).item()
+
+    def swap_delta(self, vertex_a, cluster_a_id, vertex_b, cluster_b_id):
+        """ change of the clique score if vertex_a and vertex_b exchange their clusters """
+        weights = self.weights
+        return 2 * (self.affinity[vertex_a, cluster_b_id] - weights[vertex_a, vertex_b]
+                    - self.affinity[vertex_a, cluster_a_id] + weights[vertex_a, vertex_a]
+                    + self.affinity[vertex_b, cluster_a_id] - weights[vertex_b, vertex_a]
+                    - self.affinity[vertex_b, cluster_b_id] + weights[vertex_b, vertex_b]).item()
+
+    def unassigned_delta(self, vertex, from_cluster_id, to_cluster_id):
+        """ change of the number of unassigned activities if vertex moves (without moving it) """
+        unassigned_before = self.unassigned_in(from_cluster_id) + self.unassigned_in(to_cluster_id)
+        moved_gates = 0 if vertex_is_act(vertex, self.num_activities) else 1
+        from_size, to_size = self.cluster_size[from_cluster_id] - 1, self.cluster_size[to_cluster_id] + 1
+        unassigned_after = ((from_size if self.cluster_gates[from_cluster_id] - moved_gates == 0 else 0) +
+                            (to_size if self.cluster_gates[to_cluster_id] + moved_gates == 0 else 0))
+        return unassigned_after - unassigned_before
+
+    def move(self, vertex, from_cluster_id, to_cluster_id):
+        """ update all values for moving vertex from one cluster to another """
+        self.score_excl_penalties += self.move_delta(vertex, from_cluster_id, to_cluster_id)
+        update_affinity(self.affinity, self.weights, vertex, from_cluster_id, to_cluster_id)
+
+        self.no_unassigned_activities += self.unassigned_delta(vertex, from_cluster_id, to_cluster_id)
+        self.cluster_size[from_cluster_id] -= 1
+        self.cluster_size[to_cluster_id] += 1
+        if not vertex_is_act(vertex, self.num_activities):
+            self.cluster_gates[from_cluster_id] -= 1
+            self.cluster_gates[to_cluster_id] += 1
+        self.score = self.score_excl_penalties + self.large_negative * self.no_unassigned_activities
+
+    def verify(self, solution):
+        """ debug check: compare with a full recomputation """
+        expected = calculate_total_score(solution, self.weights, self.large_negative, self.num_activities)
+        tracked = (self.score, self.score_excl_penalties, self.no_unassigned_activities)
+        if tracked != expected:
+            raise Exception(f"Tracked score {tracked} differs from the recomputed score {expected}")
+
+NO_GATE = -1        # gate slot of a cluster without gate (its activities are assigned to the dummy gate)
+NO_CLUSTER = -1     # cluster of a vertex that has been removed and not been added again yet
+
+class ClusterState:
+    """ Solution of the clustering: every vertex (activity or gate) belongs to one of the clusters 0..num_clusters-1.
+    - members[c]: vertices of cluster c, a dictionary used as an insertion-ordered set, so vertices are added and
+      removed in O(1) and iterate in the order in which they joined the cluster (like the former cluster lists)
+    - gate[c]: the gate vertex of cluster c, NO_GATE if there is none (a cluster can contain at most one gate)
+    - cluster_of[v]: the cluster of vertex v
+    - empty clusters are kept in a pool; empty_cluster() returns the one with the lowest ID
+    - gateless: set of the non-empty clusters without a gate
+    - occupancy[c]: bitset (int) of the activities in cluster c, bit a set for activity a (see FeasibilityBitsets)
+    state[c], iterating over the cluster IDs and len(state) work like the solution dictionary {cluster ID: vertices}. """
+
+    def __init__(self, num_activities, num_vertices, num_clusters):
+        self.num_activities = num_activities
+        self.members = [{} for _ in range(num_clusters)]
+        self.gate = [NO_GATE] * num_clusters
+        self.cluster_of = [NO_CLUSTER] * num_vertices
+        self.empty_pool = list(range(num_clusters))    # min-heap of cluster IDs; entries of clusters filled later are skipped
+        self.gateless = set()
+        self.occupancy = [0] * num_clusters
+
+    @classmethod
+    def from_solution(cls, solution, num_activities, num_vertices):
+        """ state of a solution dictionary {cluster ID 0..n-1: list of vertices} """
+        state = cls(num_activities, num_vertices, len(solution))
+        for cluster_id in solution:
+            for vertex in solution[cluster_id]:
+                state.add(vertex, cluster_id)
+        return state
+
+    def copy(self):
+        state = ClusterState.__new__(ClusterState)
+        state.num_activities = self.num_activities
+        state.members = [dict(members) for members in self.members]
+        state.gate = list(self.gate)
+        state.cluster_of = list(self.cluster_of)
+        state.empty_pool = list(self.empty_pool)
+        state.gateless = set(self.gateless)
+        state.occupancy = list(self.occupancy)
+        return state
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(range(len(self.members)))
+
+    def __getitem__(self, cluster_id):
+        return self.members[cluster_id]
+
+    def add(self, vertex, cluster_id):
+        """ add a vertex that is not in any cluster to the end of cluster cluster_id """
+        if not vertex_is_act(vertex, self.num_activities):
+            if self.gate[cluster_id] != NO_GATE:
+                raise Exception(f"Cluster {cluster_id} already contains gate {self.gate[cluster_id]}, cannot add gate {vertex}")
+            self.gate[cluster_id] = vertex
+            self.gateless.discard(cluster_id)
+        else:
+            self.occupancy[cluster_id] |= 1 << vertex
+            if self.gate[cluster_id] == NO_GATE:
+                self.gateless.add(cluster_id)
+        self.members[cluster_id][vertex] = None
+        self.cluster_of[vertex] = cluster_id
+
+    def remove(self, vertex):
+        """ remove a vertex from its cluster, returns the cluster ID """
+        cluster_id = self.cluster_of[vertex]
+        del self.members[cluster_id][vertex]
+        if self.gate[cluster_id] == vertex:
+            self.gate[cluster_id] = NO_GATE
+            self.gateless.add(cluster_id)
+        else:
+            self.occupancy[cluster_id] &= ~(1 << vertex)
+        self.cluster_of[vertex] = NO_CLUSTER
+        if not self.members[cluster_id]:
+            heapq.heappush(self.empty_pool, cluster_id)
+            self.gateless.discard(cluster_id)
+        return cluster_id
+
+    def move(self, vertex, cluster_id):
+        """ move a vertex to the end of cluster cluster_id (also if it is already in this cluster) """
+        self.remove(vertex)
+        self.add(vertex, cluster_id)
+
+    def empty_cluster(self):
+        """ empty cluster with the lowest ID, None if all clusters are occupied """
+        while self.empty_pool and self.members[self.empty_pool[0]]:
+            heapq.heappop(self.empty_pool)
+        return self.empty_pool[0] if self.empty_pool else None
+
+    def to_solution(self):
+        """ solution dictionary {cluster ID: list of vertices} """
+        return {cluster_id: list(members) for cluster_id, members in enumerate(self.members)}
+
+def candidate_clusters(vertex, state, M_validGate, activities_to_flights, num_activities, near_pairs):
+    """ Target clusters (ascending IDs, excl. the current cluster) to which an activity can move without violating a
+    gate or overlap restriction: the clusters of its valid gates and the non-empty clusters without gate, except those
+    containing an activity that overlaps it. Gates are not restricted (all clusters). """
+    current_cluster_id = state.cluster_of[vertex]
+    if not vertex_is_act(vertex, num_activities):
+        return [cluster_id for cluster_id in state if cluster_id != current_cluster_id]
+    cluster_of = state.cluster_of
+    candidates = {cluster_of[gate] for gate in M_validGate[activities_to_flights[vertex]]}
+    candidates |= state.gateless
+    candidates.discard(current_cluster_id)
+    for other_activity in near_pairs.overlapping[vertex]:
+        candidates.discard(cluster_of[other_activity])
+    return sorted(candidates)
+
+def get_gate_of_activity(i, state):
+    gate_of_i = state.gate[state.cluster_of[i]]
+    return gate_of_i if gate_of_i != NO_GATE else 'No gate found'
+
+def vertex_is_act(vertex, num_activities):
+    return vertex < num_activities
+
+def deadline_passed(deadline):
+    """ deadline: time.time() value at which the heuristic has to stop, None for no time limit """
+    return deadline is not None and time.time() >= deadline
+
+def report_progress(progress_callback, start_time, score, no_unassigned_activities):
+    """ call progress_callback(elapsed seconds, best score, unassigned activities), if given """
+    if progress_callback is not None:
+        progress_callback(time.time() - start_time, score, no_unassigned_activities)
+
+class FeasibilityBitsets:
+    """ Shadow constraints and overlaps as bitsets over activities (Python ints, bit a for activity a), to be combined
+    with the cluster occupancy bitsets of a ClusterState:
+    - partner_masks[(activity, gate)]: [(other gate, activities that may not be at the other gate), ...]
+    - gate_conflicts[gate]: [(other gate, own_mask, conflict_masks), ...] for the shadow constraints between the gates:
+      own_mask are the activities of the flights constrained at gate, conflict_masks[a] (a in own_mask) are the activities
+      of the flights that may not be at the other gate while the flight of a is at gate
+    - overlap_masks[activity]: the activities overlapping it """
+
+    def __init__(self, num_activities, shadow_constraints, activities_to_flights, flights_to_activities, near_pairs):
+        flight_masks = [sum(1 << act for act in activities) for activities in flights_to_activities]
+
+        # partners from the (activity, gate) CSR index of the shadow constraints, grouped by (activity, gate, other gate)
+        num_gates, first_gate = shadow_constraints.num_gates, shadow_constraints.first_gate
+        pair_key = np.repeat(np.arange(len(shadow_constraints.pair_ptr) - 1), np.diff(shadow_constraints.pair_ptr))
+        order = np.lexsort((shadow_constraints.pair_gate, pair_key))
+        self.partner_masks = {}
+        previous_key, previous_gate, masks = None, None, None
+        for key, other_gate, other_act in zip(pair_key[order].tolist(), shadow_constraints.pair_gate[order].tolist(),
+                                              shadow_constraints.pair_act[order].tolist()):
+            if key != previous_key:
+                masks = self.partner_masks[(key // num_gates, key % num_gates + first_gate)] = []
+                previous_key, previous_gate = key, None
+            if other_gate != previous_gate:
+                masks.append([other_gate, 0])
+                previous_gate = other_gate
+            masks[-1][1] |= 1 << other_act
+
+        self.gate_conflicts = {}
+        for gate in range(shadow_constraints.first_gate, shadow_constraints.first_gate + shadow_constraints.num_gates):
+            flight_conflicts = {}      # other gate -> {own flight: activities of the other flights}
+            for (a1, a2, g2) in shadow_constraints.gate_constraints(gate):
+                own_flight = activities_to_flights[a1]
+                conflicts = flight_conflicts.setdefault(g2, {})
+                conflicts[own_flight] = conflicts.get(own_flight, 0) | flight_masks[activities_to_flights[a2]]
+            self.gate_conflicts[gate] = []
+            for g2, conflicts in flight_conflicts.items():
+                own_mask = 0
+                conflict_masks = {}
+                for own_flight, mask in conflicts.items():
+                    own_mask |= flight_masks[own_flight]
+                    for act in flights_to_activities[own_flight]:
+                        conflict_masks[act] = mask
+                self.gate_conflicts[gate].append((g2, own_mask, conflict_masks))
+
+        self.overlap_masks = [sum(1 << int(other) for other in near_pairs.overlapping[act]) for act in range(num_activities)]
+
+def is_move_feasible_new(vertex, state, target_cluster_id, bitsets, M_validGate, activities_to_flights, num_activities):
     """
     Checks if moving flight `i` to `proposed_gate` violates any shadow constraints.
     New version that also considers situations where gate vertices are moved.
+    bitsets: FeasibilityBitsets of the instance, checked against the occupancy bitsets of the state.
     """
+    cluster_of = state.cluster_of
+    occupancy = state.occupancy
     # check if vertex is a flight vertex
-    is_flight_vertex = vertex_is_act(vertex)    # True if vertex is activity, false if not (if vertex is gate)
+    is_flight_vertex = vertex_is_act(vertex, num_activities)    # True if vertex is activity, false if not (if vertex is gate)
 
     if is_flight_vertex:
-        # get flight that is supposed to be moved and all gates in the target cluster (must be either 0 or 1)
-        target_activity = vertex
-        target_gates_list = list([vtx for vtx in target_cluster if vertex_is_act(vtx) == False])  # A list of gates in the target cluster
-        # if target cluster contains more than 1 gate: raise an error (this should never happen)
-        if len(target_gates_list) > 1:
-            raise Exception(f"Target cluster contains more than one gate!")
-        # if target cluster contains exactly one gate: check shadow restriction
-        elif len(target_gates_list) == 1:
-            target_gate = target_gates_list[0]
-
-            # check all relevant shadow restrictions for violation*
-            if (target_activity, target_gate) in sc_per_act_gate_pair: # *if there are any
-                for (a2, g2) in sc_per_act_gate_pair[(target_activity, target_gate)]:
-                    if nodes_to_clusters[a2] == nodes_to_clusters[g2]:
-                        return False
+        # get the gate of the target cluster (if any)
+        target_gate = state.gate[target_cluster_id]
+        # if target cluster contains a gate: check shadow restriction
+        if target_gate != NO_GATE:
+            # check all relevant shadow restrictions for violation: is any partner at the cluster of its gate?
+            for (other_gate, partners) in bitsets.partner_masks.get((vertex, target_gate), ()):
+                if partners & occupancy[cluster_of[other_gate]]:
+                    return False
 
             # check if flight can be assigned to the target gate
             if target_gate not in M_validGate[activities_to_flights[vertex]]:
                 return False
 
-        # check for temporal overlaps or infeasible gate assignments
-        for vtx in target_cluster:
-            if weights[vertex][vtx] <= large_negative:
-                return False
-
-    # if vertex is not a flight vertex: need to check for all possible shadow restrictions involving gate 'vertex'
-    elif vertex in sc_per_gate:    # If the gate has any shadow constraints at all
-        relevant_constraints = []  # get all shadow constraints involving this gate.
-        for (a1, a2, g2) in sc_per_gate[vertex]:
-            own_flight = activities_to_flights[a1]
-            other_flight = activities_to_flights[a2]
-            other_gate = g2
-
-            # Check Shadow Constraints for the Gate
-            for other_activity in flights_to_activities[other_flight]:
-                for own_activity in flights_to_activities[own_flight]:
-                    if nodes_to_clusters[other_activity] == nodes_to_clusters[other_gate] and nodes_to_clusters[
-                        own_activity] == nodes_to_clusters[vertex]:
-                        return False
+        # check for temporal overlaps (the gate has been checked above): only activities overlapping the vertex can
+        # have a weight of large_negative to it
+        if bitsets.overlap_masks[vertex] & occupancy[target_cluster_id]:
+            return False
+
+    # if vertex is not a flight vertex: need to check for all possible shadow restrictions involving gate 'vertex':
+    # an activity of a constrained flight in the cluster of the gate and one of its conflicting flights at the other gate
+    else:
+        own_occupancy = occupancy[cluster_of[vertex]]
+        for (other_gate, own_mask, conflict_masks) in bitsets.gate_conflicts[vertex]:
+            present = own_occupancy & own_mask
+            if not present:
+                continue
+            other_occupancy = occupancy[cluster_of[other_gate]]
+            while present:
+                lowest_bit = present & -present
+                if conflict_masks[lowest_bit.bit_length() - 1] & other_occupancy:
+                    return False
+                present ^= lowest_bit
 
     return True
 
-def reassign_vertices(solution, cluster_contains_gate, cluster_to_gates, weights, M_validGate, P_preferences, activities_to_flights,
-                      nodes_to_clusters):
+def reassign_vertices(state, weights, M_validGate, P_preferences, activities_to_flights, deadline=None):
     """
-    Reassign all non-mandatory dummy gate assignments.
+    Reassign all non-mandatory dummy gate assignments (until the deadline, if any).
     """
     # for each cluster: check if there are any gate inside the cluster. If not, this implies that this cluster is assigned to the dummy gate
-    for cluster_id in solution:
-        if solution[cluster_id] == []:  # skip empty clusters
+    for cluster_id in state:
+        if deadline_passed(deadline):
+            break
+        if not state[cluster_id]:  # skip empty clusters
             continue
-        if not cluster_contains_gate[cluster_id]:  # If the cluster does not contain a gate
-            for activity in solution[cluster_id]:
+        if state.gate[cluster_id] == NO_GATE:  # If the cluster does not contain a gate
+            for activity in list(state[cluster_id]):
                 # get random gate with maximum preference
                 flight = activities_to_flights[activity]
+                if not P_preferences[flight]:   # only the dummy gate is valid for this flight: activity stays
+                    continue
                 maximum_preference_gates = [gate for gate in P_preferences[flight] if P_preferences[flight][gate] == max(P_preferences[flight].values())]
                 target_gate = random.choice(maximum_preference_gates)
-                target_cluster_id = nodes_to_clusters[target_gate]
-                solution[target_cluster_id].append(activity)
-                nodes_to_clusters[activity] = target_cluster_id
+                target_cluster_id = state.cluster_of[target_gate]
+                state.move(activity, target_cluster_id)
                 # print(f"Reassigned activity {activity} from {cluster_id} to {target_cluster_id}")
-            # above procedure will be executed for all activities, so cluster will eventually be empty
-            solution[cluster_id] = []
 
-    return solution, nodes_to_clusters
+    return state
+
+def move_flight_to_empty_cluster(state, flight_activities):
+    """ move all activities of a flight into an empty cluster (no gate: the flight is assigned to the dummy gate) """
+    target_cluster_id = state.empty_cluster()
+    if target_cluster_id is None:
+        raise Exception("No empty cluster found")
+    for act in flight_activities:
+        state.move(act, target_cluster_id)
+    return target_cluster_id
 
-def eliminate_conflicts(solution, M_validGate, U_successor, activities_to_flights, flights_to_activities,
-                        nodes_to_clusters, shadow_constraints, weights, large_negative):
+def eliminate_conflicts(state, M_validGate, activities_to_flights, flights_to_activities, bitsets, act_start, num_activities,
+                        deadline=None):
     """
-    Removes gate conflicts by reassigning conflicting flights to alternative gates or to a dummy gate if no alternatives exist.
+    Removes gate conflicts by moving conflicting flights (all of their activities) to empty clusters, i.e. to the dummy gate.
+    bitsets: FeasibilityBitsets of the instance; act_start: start times of the activities (None: cluster order).
+    Stops when the deadline (if any) is reached, possibly leaving conflicts.
     """
-
-    # 1. eliminate gate conflicts, i.e. overlaping gates on same cluster (gate)
-    for cluster_id in solution:
-        for vertex_i in solution[cluster_id]:
-            for vertex_j in solution[cluster_id]:
-                if vertex_i == vertex_j:
-                    continue
-                if weights[vertex_i][vertex_j] == large_negative:   # i.e. they overlap
-                    # remove vertex_j from the cluster and insert it into an empty cluster, together with all of its successors
-                    if vertex_is_act(vertex_j):
-                        vertex_to_remove = vertex_j
-                    else:       # catch the case where vertex_j is a gate (this shouldn't happen anyway, though)
-                        vertex_to_remove = vertex_i
-                    # find empty cluster and insert activities
-                    new_cluster_found = False
-                    for target_cluster_id in solution:
-                        if solution[target_cluster_id] == [] and not new_cluster_found:
-                            new_cluster_found = True
-                            allAct_SameFlight = flights_to_activities[activities_to_flights[vertex_to_remove]]
-                            solution[target_cluster_id] = allAct_SameFlight.copy()  # Assign these activities to the empty cluster
-                            for act in allAct_SameFlight:
-                                solution[nodes_to_clusters[act]].remove(act)  # Remove activities from their original cluster
-                                nodes_to_clusters[act] = target_cluster_id  # Update new cluster assignment
-                    if not new_cluster_found:
-                        raise Exception("No empty cluster found")
-
-
-    # 2. eliminate shadow constraints
-    for (a1, g1, a2, g2) in shadow_constraints:
-        f1 = activities_to_flights[a1]  # Get the flight associated with activities a1.
-        f2 = activities_to_flights[a2]
-        # if shadow constraint is violated: assign all activities associated with flight 1 into an empty cluster
-        for act1 in flights_to_activities[f1]:
-            for act2 in flights_to_activities[f2]:
-                if nodes_to_clusters[act1] == nodes_to_clusters[g1] and nodes_to_clusters[act2] == nodes_to_clusters[g2]:
-                    activities = flights_to_activities[f1]  # Get all activities associated with flight f1.
-                    # remove activities from existing clusters
-                    for act in activities:
-                        solution[nodes_to_clusters[act]].remove(act)  # Find the current cluster of act, remove act
-                    # find an empty cluster and insert all relevant activities
-                    new_cluster_found = False
-                    for cluster_id in solution:
-                        if solution[cluster_id] == [] and not new_cluster_found:
-                            solution[cluster_id] = activities.copy()
-                            for act in activities:
-                                nodes_to_clusters[act] = cluster_id  # update assignment
-                            new_cluster_found = True
-                    if not new_cluster_found:
-                        raise Exception("No empty cluster found")
+    cluster_of = state.cluster_of
+    occupancy = state.occupancy
+
+    # 1. eliminate gate conflicts, i.e. activities at a gate that is not valid for them and overlapping activities in the
+    # same cluster: sweep over the activities of each cluster by start time, keeping every activity that neither
+    # overlaps an activity kept before nor is at an invalid gate
+    for cluster_id in state:
+        if deadline_passed(deadline):
+            return state
+        activities = [vertex for vertex in state[cluster_id] if vertex_is_act(vertex, num_activities)]
+        if not activities:
+            continue
+        if act_start is not None:
+            activities.sort(key=lambda act: act_start[act])
+        gate = state.gate[cluster_id]
+        kept = 0
+        for act in activities:
+            if cluster_of[act] != cluster_id:   # has been moved together with an activity of the same flight
+                continue
+            flight = activities_to_flights[act]
+            # (activities of the same flight that have been moved out are still in kept; only compare with the occupancy)
+            if (gate != NO_GATE and gate not in M_validGate[flight]) or bitsets.overlap_masks[act] & kept & occupancy[cluster_id]:
+                move_flight_to_empty_cluster(state, flights_to_activities[flight])
+            else:
+                kept |= 1 << act
+
+    # 2. eliminate shadow constraints: only the activities assigned to gates are looked up, a flight with an activity
+    # at a gate that conflicts with an activity at the neighbouring gate is moved to an empty cluster
+    for gate, conflicts in bitsets.gate_conflicts.items():
+        if deadline_passed(deadline):
+            return state
+        cluster_id = cluster_of[gate]
+        for (other_gate, own_mask, conflict_masks) in conflicts:
+            present = occupancy[cluster_id] & own_mask
+            while present:
+                lowest_bit = present & -present
+                act = lowest_bit.bit_length() - 1
+                if conflict_masks[act] & occupancy[cluster_of[other_gate]]:
+                    move_flight_to_empty_cluster(state, flights_to_activities[activities_to_flights[act]])
+                present &= occupancy[cluster_id] & ~lowest_bit
 
     print("~Finished eliminating all gate and shadow conflicts~")
 
-    return solution, nodes_to_clusters
+    return state
 
-def initialize_clusters(weights, activities_to_flights, gates_to_indices, U_successor):
-    """(Algorithm 2)"""
+def initialize_clusters(weights, num_activities, num_gates, U_successor, act_kind, deadline=None):
+    """(Algorithm 2) If the deadline is reached, the remaining arrivals stay in their own clusters."""
     t1 = time.time()
 
-    activities = list(activities_to_flights.keys())     # ['arr_1', 'dep_1', ...]
-    gates = list(gates_to_indices.keys())               # ['120', '122', ...]
+    activities = list(range(num_activities))                            # IDs of 'arr_1', 'dep_1', ...
+    gates = list(range(num_activities, num_activities + num_gates))    # IDs of '120', '122', ...
 
     # 0. create initially empty clusters, one for each node in the graph (=activities and gates EXCL. the dummy gate)
-    clusters = {}   # keys = cluster_idx, values = list of nodes inside the cluster
-    nodes_to_clusters = {} # keys = node names (activities, gates), values = name of cluster to which node belongs
-    it = 1
+    clusters = ClusterState(num_activities, num_activities + num_gates, num_activities + num_gates)
+    nodes_to_clusters = clusters.cluster_of     # node ID (activities, gates) -> ID of cluster to which node belongs
+    it = 0
     for gate in gates:
-        clusters[f"cluster_{it}"] = [gate]  # Create a new cluster with cluster_{it}, assign the gate to this cluster
-        nodes_to_clusters[gate] = f"cluster_{it}"  # Update gate-cluster assignment
+        clusters.add(gate, it)  # Create a new cluster with ID it, assign the gate to this cluster
         it += 1
     for act in activities:
-        clusters[f"cluster_{it}"] = [act]
-        nodes_to_clusters[act] = f"cluster_{it}"
+        clusters.add(act, it)
         it += 1
 
-    non_tabu_Activities = [activity for activity in activities if activity.startswith("arr")]
+    non_tabu_Activities = [activity for activity in activities if act_kind[activity] == ACT_ARR]
     non_tabu = len(non_tabu_Activities)
+    affinity = build_affinity(clusters, weights)
 
     while non_tabu > 0:
-        best_improvement = -np.inf
-        best_target_cluster_id = None
-
+        if deadline_passed(deadline):
+            break
         act = non_tabu_Activities[0]  # act is set to the first activity in the list of non-tabu activities
-        current_cluster = clusters[nodes_to_clusters[act]]
-
-        # for each cluster: calculate benefit of moving activity+successors to cluster
-        for cluster_id in clusters:
-            target_cluster = clusters[cluster_id]
-            h1 = calculate_heuristic_value(act, current_cluster, target_cluster, weights, activities_to_flights, gates_to_indices)
-            h2 = calculate_heuristic_value(U_successor[act], current_cluster, target_cluster, weights, activities_to_flights, gates_to_indices)
-            if U_successor[U_successor[act]] != 0:  # the successor of successor
-                h3 = calculate_heuristic_value(U_successor[U_successor[act]], current_cluster, target_cluster, weights, activities_to_flights, gates_to_indices)
-            else:
-                h3 = 0
-
-            improvement = h1 + h2 + h3
-            if improvement > best_improvement:  # if improvement is best found so far: save it!
-                best_improvement = improvement
-                best_target_cluster_id = cluster_id
+        current_cluster_id = nodes_to_clusters[act]
+        successor = int(U_successor[act])
+        succ_successor = int(U_successor[successor])
+        chain = [act, successor] if succ_successor == NO_SUCCESSOR else [act, successor, succ_successor]
+
+        # benefit of moving activity+successors to each cluster (affinity_move_value summed over the chain, all clusters
+        # at once; the values are relative to the cluster of the activity, also for its successors)
+        improvements = affinity[chain].sum(axis=0)
+        improvements -= sum(affinity[vertex, current_cluster_id] - (weights[vertex, vertex] if nodes_to_clusters[vertex] == current_cluster_id else 0)
+                            for vertex in chain)
+        best_target_cluster_id = int(np.argmax(improvements))     # first cluster with the best improvement
+        best_improvement = improvements[best_target_cluster_id]
 
         # if there is a feasible improving move: move activity+successors to respective cluster, otherwise keep everything and mark activity as tabu
         if best_improvement > 0:
-            successor = U_successor[act]
-            succ_successor = U_successor[U_successor[act]]
-            # add activities to new cluster
-            clusters[best_target_cluster_id].extend([act, successor])
-            if succ_successor != 0:
-                clusters[best_target_cluster_id].extend([succ_successor])
-            # remove activities from old clusters and save new cluster IDs for all relevant activities
-            clusters[nodes_to_clusters[act]].remove(act)
-            clusters[nodes_to_clusters[successor]].remove(successor)
-            nodes_to_clusters[act] = best_target_cluster_id
-            nodes_to_clusters[U_successor[act]] = best_target_cluster_id
-            if succ_successor != 0:
-                clusters[nodes_to_clusters[succ_successor]].remove(succ_successor)
-                nodes_to_clusters[succ_successor] = best_target_cluster_id
+            # move activities to the new cluster
+            for moved_act in chain:
+                update_affinity(affinity, weights, moved_act, nodes_to_clusters[moved_act], best_target_cluster_id)
+                clusters.move(moved_act, best_target_cluster_id)
 
         del non_tabu_Activities[0]
         non_tabu -= 1
 
     print(f"Found an initial solution. Runtime: {time.time()-t1} seconds.")
 
-    return clusters, nodes_to_clusters
+    return clusters
 
-def refine_clusters(current_solution, nodes_to_clusters, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
-                         activities_to_flights, gates_to_indices, large_negative, sc_per_act_gate_pair, sc_per_gate,
-                    M_validGate):
-    """(Algorithm 1)"""
+def refine_clusters(state, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
+                         activities_to_flights, act_kind, large_negative, M_validGate, near_pairs, vertex_order_rng=None,
+                         deadline=None, bitsets=None, vertices=None):
+    """(Algorithm 1) Returns the refined ClusterState; the input state is not modified. The vertices are visited by
+    activity kind and ID, or by activity kind in random order if vertex_order_rng (random.Random) is given.
+    If the deadline is reached, no more moves are made and the best iterate so far is returned.
+    bitsets: FeasibilityBitsets of the instance (built here if not given).
+    vertices: the activities that may be moved (None: all activities), e.g. for a local repair."""
+    if bitsets is None:
+        bitsets = FeasibilityBitsets(num_activities, shadow_constraints, activities_to_flights, flights_to_activities, near_pairs)
 
     # Initialization
-    current_score, score_excl_penalties, initial_no_unassigned_activities = calculate_total_score(current_solution, weights, large_negative)
+    # The refinement works on a single copy of the input. Accepted moves are recorded in a journal; the best solution
+    # found is restored at the end by replaying the moves up to it on the input.
+    current_state = state.copy()
+    nodes_to_clusters = current_state.cluster_of
+    score_tracker = ScoreTracker(current_state, weights, large_negative, num_activities)     # tracks the latest accepted solution
+    current_score, initial_no_unassigned_activities = score_tracker.score, score_tracker.no_unassigned_activities
+    affinity = score_tracker.affinity
     values_per_iterator = {0: current_score}  # keys = iterators r of the algorithm, values = obj. value of solution at r-th iteration
-    # solutions_per_iterator = {0: copy.deepcopy(current_solution)}       # keys = iterators r of the algorithm, values = solution after performing r-th iteration
 
-    nontabu_vertices = list(activities_to_flights.keys())   # Only flight activities are made nontabu
+    nontabu_vertices = list(range(num_activities)) if vertices is None else list(vertices)   # Only flight activities are made nontabu
 
-    # todo remove
-    sorted_nontabu_vertices = sorted(nontabu_vertices, key=lambda x: (x[:3] not in ['arr', 'par', 'dep'], x[:3] == 'dep', x[:3] == 'par', x))
+    if vertex_order_rng is None:
+        sorted_nontabu_vertices = sorted(nontabu_vertices, key=lambda x: (act_kind[x], x))     # arrivals, then parkings, then departures
+    else:
+        sorted_nontabu_vertices = sorted(nontabu_vertices, key=lambda x: (act_kind[x], vertex_order_rng.random()))
     nontabu_vertices = sorted_nontabu_vertices
-    # todo
 
     can_improve_more = True
 
-    vertex_is_gate = {}         # keys = vertex names, values = binary indicating if vertex is a gate vertex
-    cluster_contains_gate = {}      # keys = cluster IDs , values = binary indicating if cluster already contains a gate vertex (used to shorten runtime of improvement step)
-    cluster_to_gates = {}
-
-    # Find which clusters contain a gate
-    for cluster_id in current_solution:
-        contains_gate = False
-        cluster_to_gates[cluster_id] = []
-        for vertex in current_solution[cluster_id]:
-            vertex_is_gate[vertex] = not vertex_is_act(vertex)
-            # is_activity_vertex = False
-            if not vertex_is_act(vertex):
-                contains_gate = True
-                cluster_to_gates[cluster_id].append(vertex)
-        cluster_contains_gate[cluster_id] = contains_gate
-
-    solution_data_per_iterator = {0: (copy.deepcopy(current_solution), copy.deepcopy(nodes_to_clusters),
-                                      copy.deepcopy(cluster_contains_gate), copy.deepcopy(cluster_to_gates))}
+    # accepted moves: (vertex, to cluster); move r leads to the r-th iterate
+    move_journal = []
 
     solution_iterator = 0       # index of the currently found solution (0=initial solution)
     maximum_move_count = 50000      # large number that should never be reached
@@ -302,50 +543,41 @@ def refine_clusters(current_solution, nodes_to_clusters, num_activities, num_gat
 
         # for each vertex: find the best move that leads to a feasible neighbour
         for vertex in nontabu_vertices:
-            current_solution, nodes_to_clusters, cluster_contains_gate, cluster_to_gates = solution_data_per_iterator[
-                solution_iterator]
+            if deadline_passed(deadline):
+                can_improve_more = False
+                break
             current_cluster_id = nodes_to_clusters[vertex]
             best_target_cluster_id = None
             best_delta = - np.inf     # change in objective value for the best move found so far
-
-            # for each cluster: check if move would be feasible and how objective function would change
-            for target_cluster_id in current_solution:
-                if target_cluster_id == nodes_to_clusters[vertex]: # skip moving vertex to its current cluster
+            weights_vertex = weights[vertex]
+
+            # for each candidate cluster (all others have an invalid gate or an overlapping activity, or are empty): check if
+            # move would be feasible and how objective function would change
+            for target_cluster_id in candidate_clusters(vertex, current_state, M_validGate, activities_to_flights,
+                                                        num_activities, near_pairs):
+                # need to make sure that infeasible moves (->overlaps) are skipped: the move is only evaluated if the
+                # target cluster contains at least one vertex with a non-negative weight to the vertex (evaluating it once
+                # per such vertex, as before, gives the same result, since nothing changes in between)
+                if not any(weights_vertex[activity] >= 0 for activity in current_state[target_cluster_id]):
                     continue
-                # need to make sure that infeasible moves (->overlaps) are skipped
-                # forbid moving the vertex to a cluster where it will overlap with 1 or more activities
-                for activity in current_solution[target_cluster_id]:
-                    if weights[vertex][activity] <0:
-                        continue
-                        '''Does this continue affect the previous for (as it should) or this for?'''
-                    # # skip move evaluation of gates to clusters that already contain a gate (for runtime improvement)
-                    # if vertex_is_gate[vertex] and cluster_contains_gate[target_cluster_id]:
-                    #     continue
-                    # else: evaluate improvement and amount of unassigned gates
-                    potential_delta = calculate_heuristic_value(vertex, current_solution[current_cluster_id], current_solution[target_cluster_id],
-                                                                      weights, activities_to_flights, gates_to_indices)
-                    # if improvement is better than the best one found so far: check for feasibility
-                    if potential_delta > best_delta:
-                        # print("--------Potential_score is higher")
-                        # 1. check for shadow restrictions (if vertex is not a gate vertex)
-                        move_allowed = is_move_feasible_new(vertex, current_solution, current_solution[current_cluster_id], current_solution[target_cluster_id],
-                                                            shadow_constraints, flights_to_activities, activities_to_flights,
-                                                            nodes_to_clusters, sc_per_act_gate_pair, sc_per_gate, M_validGate, weights, large_negative)
-
-                        # 2. if target cluster is empty: current cluster needs to contain at least 2 elements
-                        if len(current_solution[target_cluster_id]) == 0 and len(current_solution[current_cluster_id]) == 2:
-                            move_allowed = False
-                        # # 3. (Arthur) if target cluster has no gate (activitiy would go to dummy gate), then move not allowed
-                        # if cluster_contains_gate[target_cluster_id] == False:
-                        #     move_allowed = False
-                        # if move is feasible: remember this as the best possible move
-                        if move_allowed:
-                            best_target_cluster_id = target_cluster_id
-                            best_delta = potential_delta
-
-            # # if a feasible and improving move has been found: perform it and store it
-            # # improvingMove = best_improvement > large_negative
-            # move_is_improving = best_score > current_score
+                # else: evaluate improvement and amount of unassigned gates
+                potential_delta = affinity_move_value(vertex, current_cluster_id, target_cluster_id, affinity, weights, nodes_to_clusters)
+                # if improvement is better than the best one found so far: check for feasibility
+                if potential_delta > best_delta:
+                    # 1. check for shadow restrictions (if vertex is not a gate vertex)
+                    move_allowed = is_move_feasible_new(vertex, current_state, target_cluster_id, bitsets, M_validGate,
+                                                        activities_to_flights, num_activities)
+
+                    # 2. if target cluster is empty: current cluster needs to contain at least 2 elements
+                    if len(current_state[target_cluster_id]) == 0 and len(current_state[current_cluster_id]) == 2:
+                        move_allowed = False
+                    # # 3. (Arthur) if target cluster has no gate (activitiy would go to dummy gate), then move not allowed
+                    # if current_state.gate[target_cluster_id] == NO_GATE:
+                    #     move_allowed = False
+                    # if move is feasible: remember this as the best possible move
+                    if move_allowed:
+                        best_target_cluster_id = target_cluster_id
+                        best_delta = potential_delta
 
             # if a feasible move has been found: perform it and store it
             # Note: we also accepts moves that reduce the objective value
@@ -356,41 +588,28 @@ def refine_clusters(current_solution, nodes_to_clusters, num_activities, num_gat
                     raise Exception("Best move delta is <= large_negative, indicating the move is infeasible.\n"
                                     f"Delta: {best_delta}, large negative: {large_negative}\n"
                                     f"Tried moving {vertex} from {current_cluster_id} to {best_target_cluster_id}.\n"
-                                    f"{current_cluster_id}: {current_solution[current_cluster_id]}\n"
-                                    f"{best_target_cluster_id}: {current_solution[best_target_cluster_id]}\n")
-                target_solution = copy.deepcopy(current_solution)
-                # move vertex to its new cluster and update its assigned cluster id
-                target_solution[current_cluster_id].remove(vertex)
-                target_solution[best_target_cluster_id].append(vertex)
-                target_value, _, target_no_unassigned_activities = calculate_total_score(target_solution, weights, large_negative)
-
-                # Check if there are now more unassigned activities -> if yes, reverse the action and continue to next for iteration
-                if target_no_unassigned_activities > initial_no_unassigned_activities:
-                    target_solution[current_cluster_id].append(vertex)
-                    target_solution[best_target_cluster_id].remove(vertex)
+                                    f"{current_cluster_id}: {list(current_state[current_cluster_id])}\n"
+                                    f"{best_target_cluster_id}: {list(current_state[best_target_cluster_id])}\n")
+                # Check if there would be more unassigned activities -> if yes, skip the move and continue to next for iteration
+                if (score_tracker.no_unassigned_activities + score_tracker.unassigned_delta(vertex, current_cluster_id, best_target_cluster_id)
+                        > initial_no_unassigned_activities):
                     continue
-                target_nodes_to_clusters = copy.deepcopy(nodes_to_clusters)
-                target_nodes_to_clusters[vertex] = best_target_cluster_id
-                target_cluster_contains_gate = copy.deepcopy(cluster_contains_gate)
-                target_cluster_to_gates = copy.deepcopy(cluster_to_gates)
+                # move vertex to its new cluster
+                score_tracker.move(vertex, current_cluster_id, best_target_cluster_id)
+                current_state.move(vertex, best_target_cluster_id)
+                if DEBUG_SCORE_CHECKS:
+                    score_tracker.verify(current_state)
 
                 # mark vertex as tabu
                 nontabu_vertices.remove(vertex)
                 # save solution value and solution itself
                 solution_iterator += 1
-                # values_per_iterator[solution_iterator] = values_per_iterator[solution_iterator - 1] + best_score
-                values_per_iterator[solution_iterator] = target_value
+                values_per_iterator[solution_iterator] = score_tracker.score
                 # print(f"Found an improving move. Moving vertex {vertex} from {current_cluster_id} to {best_target_cluster_id}."
                 #       f"Improvement: {best_improvement}. Current solution iterator: {solution_iterator}, value: {values_per_iterator[solution_iterator]}")
-                # if vertex that has been moved is a gate vertex: remember that target cluster now has a gate!
-                if vertex_is_gate[vertex]:
-                    target_cluster_contains_gate[best_target_cluster_id] = True
-                    target_cluster_contains_gate[current_cluster_id] = False
-                    target_cluster_to_gates[best_target_cluster_id].append(vertex)
-                    target_cluster_to_gates[current_cluster_id].remove(vertex)
-                solution_data_per_iterator[solution_iterator] = (target_solution, target_nodes_to_clusters, target_cluster_contains_gate, target_cluster_to_gates)
-
-            # todo remove
+                move_journal.append((vertex, best_target_cluster_id))
+
+            # safety stop against cycling
             if solution_iterator > maximum_move_count:
                 can_improve_more = False
                 break
@@ -402,83 +621,79 @@ def refine_clusters(current_solution, nodes_to_clusters, num_activities, num_gat
     # get iteration where objective value has been maximal
     values_sorted = dict(sorted(values_per_iterator.items(), key = lambda x: x[1], reverse=True))
     best_iterator = list(values_sorted.keys())[0]
-    best_solution, best_nodes_to_clusters, best_cluster_contains_gate, best_cluster_to_gates = solution_data_per_iterator[best_iterator]
+    # restore the best iterate by replaying the moves up to it on the input (unless it is the latest one)
+    if best_iterator < len(move_journal):
+        current_state = state.copy()
+        for (vertex, to_cluster_id) in move_journal[:best_iterator]:
+            current_state.move(vertex, to_cluster_id)
     print(f"~Best reassignment solution found at {best_iterator}th iteration~. Delta to previous solution: {values_per_iterator[best_iterator] - values_per_iterator[0]}")
 
-    return best_solution, best_nodes_to_clusters, best_cluster_contains_gate, best_cluster_to_gates
-
-def apply_two_opt_step(current_solution, nodes_to_clusters, weights, large_negative, activities_to_flights, M_validGate):
-    """Applies a 2-opt algorithm to ..."""
-
-    initial_score, _, _ = calculate_total_score(current_solution, weights, large_negative)
-    best_solution = copy.deepcopy(current_solution)
-    best_nodes_to_clusters = copy.deepcopy(nodes_to_clusters)
-    best_score = initial_score
-    improved = False
-
-    vertex_is_gate = {}  # keys = vertex names, values = binary indicating if vertex is a gate vertex
-    cluster_contains_gate = {}  # keys = cluster IDs , values = binary indicating if cluster already contains a gate vertex (used to shorten runtime of improvement step)
-
-    # Initialize vertex_is_gate and cluster_contains_gate dictionaries
-    gate_per_cluster = {}
-    for cluster_id in current_solution:
-        gate_per_cluster[cluster_id] = None
-        contains_gate = False
-        for vertex in current_solution[cluster_id]:
-            vertex_is_gate[vertex] = not vertex_is_act(vertex)
-            if not vertex_is_act(vertex):
-                contains_gate = True
-                gate_per_cluster[cluster_id] = vertex
-        cluster_contains_gate[cluster_id] = contains_gate
-
-    # Attempt swaps between all pairs of vertices not in the same cluster
-    # todo: only check swap quality if both vertices corresponding to activities for which not all 3 activities are already at the same gate
-    activity_vertices = [vertex for vertex in vertex_is_gate if vertex_is_gate[vertex] == False]
-    for i in range(len(activity_vertices)):
-        vertex_a = activity_vertices[i]
-        flight_a = activities_to_flights[vertex_a]
-        cluster_a_id = nodes_to_clusters[vertex_a]
-        for j in range(i, len(activity_vertices)):
-            vertex_b = activity_vertices[j]
-            flight_b = activities_to_flights[vertex_b]
-            cluster_b_id = nodes_to_clusters[vertex_b]
+    return current_state
+
+def build_swap_neighbours(num_activities, activities_to_flights, M_validGate, near_pairs):
+    """ Swap candidates of every activity: the activities b > a that overlap it or are less than t_max apart (near_pairs)
+    and share at least two valid gates (a swap moves both activities between two gated clusters, whose gates must
+    be valid for both of them). Returns a list of lists indexed by activity ID. """
+    swap_neighbours = []
+    for vertex_a in range(num_activities):
+        valid_a = M_validGate[activities_to_flights[vertex_a]]
+        swap_neighbours.append([int(vertex_b) for vertex_b in near_pairs.neighbours_of(vertex_a)
+                                if vertex_b > vertex_a and len(valid_a & M_validGate[activities_to_flights[vertex_b]]) >= 2])
+    return swap_neighbours
+
+def find_improving_swap(state, score_tracker, swap_neighbours, M_validGate, activities_to_flights, first_improvement=False):
+    """ Best (or, if first_improvement, the first) swap of two activities between their clusters that improves the
+    score, as (gain, vertex_a, vertex_b); None if there is none. The gains are computed from the affinities of the
+    ScoreTracker, the solution is not modified. """
+    cluster_of = state.cluster_of
+    gate_per_cluster = state.gate
+    best_swap = None
+    best_gain = 0
+    for vertex_a, neighbours in enumerate(swap_neighbours):
+        cluster_a_id = cluster_of[vertex_a]
+        valid_a = M_validGate[activities_to_flights[vertex_a]]
+        if gate_per_cluster[cluster_a_id] == NO_GATE:   # activities without gate can not be swapped to a valid gate
+            continue
+        for vertex_b in neighbours:
+            cluster_b_id = cluster_of[vertex_b]
             if cluster_a_id == cluster_b_id:
                 continue
             # skip if 2-opt step would assign activities to infeasible gates, as this can not be an improving step
-            if gate_per_cluster[cluster_b_id] not in M_validGate[flight_a] or gate_per_cluster[cluster_a_id] not in M_validGate[flight_b]:
+            if gate_per_cluster[cluster_b_id] not in valid_a or gate_per_cluster[cluster_a_id] not in M_validGate[activities_to_flights[vertex_b]]:
                 continue
+            # the clusters keep their sizes and gates, so only the clique weights change
+            gain = score_tracker.swap_delta(vertex_a, cluster_a_id, vertex_b, cluster_b_id)
+            if gain > best_gain:
+                best_gain = gain
+                best_swap = (gain, vertex_a, vertex_b)
+                if first_improvement:
+                    return best_swap
+    return best_swap
+
+def apply_two_opt_step(state, weights, large_negative, activities_to_flights, M_validGate, num_activities, swap_neighbours,
+                       first_improvement=False, deadline=None):
+    """Applies a 2-opt algorithm to the state: improving swaps of two activities between their (gated) clusters are
+    made until there is none left or the deadline is reached. swap_neighbours: see build_swap_neighbours.
+    Returns (improved, state)."""
+
+    score_tracker = ScoreTracker(state, weights, large_negative, num_activities)
+    improved = False
 
-            # Perform the swap
-            current_solution[cluster_a_id].remove(vertex_a)
-            current_solution[cluster_b_id].remove(vertex_b)
-            current_solution[cluster_a_id].append(vertex_b)
-            current_solution[cluster_b_id].append(vertex_a)
-
-            # Update the mapping after swap
-            nodes_to_clusters[vertex_a] = cluster_b_id
-            nodes_to_clusters[vertex_b] = cluster_a_id
-
-            # Recalculate the score after the swap
-            new_score, _, _ = calculate_total_score(current_solution, weights, large_negative)
-            # If the new score is better, accept the swap
-            if new_score > best_score:
-                print(f"Improvement found! Swapping {vertex_a} and {vertex_b} between {cluster_a_id} and {cluster_b_id}")
-                best_score = new_score
-                best_solution = copy.deepcopy(current_solution)
-                best_nodes_to_clusters = copy.deepcopy(nodes_to_clusters)
-                # update local cluster_a_id variable
-                cluster_a_id = nodes_to_clusters[vertex_a]
-                improved = True
-            else:
-                # Swap back if no improvement
-                current_solution[cluster_a_id].remove(vertex_b)
-                current_solution[cluster_b_id].remove(vertex_a)
-                current_solution[cluster_a_id].append(vertex_a)
-                current_solution[cluster_b_id].append(vertex_b)
-
-                # Revert the mapping after swap back
-                nodes_to_clusters[vertex_a] = cluster_a_id
-                nodes_to_clusters[vertex_b] = cluster_b_id
+    swap = None if deadline_passed(deadline) else (
+        find_improving_swap(state, score_tracker, swap_neighbours, M_validGate, activities_to_flights, first_improvement))
+    while swap is not None:
+        gain, vertex_a, vertex_b = swap
+        cluster_a_id, cluster_b_id = state.cluster_of[vertex_a], state.cluster_of[vertex_b]
+        score_tracker.move(vertex_a, cluster_a_id, cluster_b_id)
+        score_tracker.move(vertex_b, cluster_b_id, cluster_a_id)
+        state.move(vertex_a, cluster_b_id)
+        state.move(vertex_b, cluster_a_id)
+        if DEBUG_SCORE_CHECKS:
+            score_tracker.verify(state)
+        print(f"Improvement found! Swapping {vertex_a} and {vertex_b} between {cluster_a_id} and {cluster_b_id} (+{gain})")
+        improved = True
+        swap = None if deadline_passed(deadline) else (
+            find_improving_swap(state, score_tracker, swap_neighbours, M_validGate, activities_to_flights, first_improvement))
 
     # for cluster_a_id in current_solution:
     #     print(f"{cluster_a_id} ({current_solution[cluster_a_id]} out of {len(current_solution)}")
@@ -524,34 +739,44 @@ def apply_two_opt_step(current_solution, nodes_to_clusters, weights, large_negat
     #                         nodes_to_clusters[vertex_a] = cluster_a_id
     #                         nodes_to_clusters[vertex_b] = cluster_b_id
 
-    return improved, best_solution, best_nodes_to_clusters
+    return improved, state
 
 
 def iterative_refinement_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences,
                                            shadow_constraints, num_flights,
-                                           activities_to_flights, gates_to_indices, flights_to_activities,
-                                           large_negative, sc_per_act_gate_pair, sc_per_gate):
-    ''' Algorithm 3 '''
+                                           activities_to_flights, act_kind, flights_to_activities,
+                                           large_negative, gate_kind, near_pairs, seed=None, time_limit=None,
+                                           progress_callback=None, act_start=None):
+    ''' Algorithm 3. With a seed, Algorithm 1 visits the vertices of each activity kind in a seeded random order.
+    time_limit: seconds after which all phases stop and the best solution found so far is returned (None: no limit).
+    progress_callback(elapsed seconds, best score, unassigned activities) is called whenever the best solution improves.
+    act_start: start times of the activities, used to resolve overlaps in conflict elimination (None: cluster order). '''
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else None
+    vertex_order_rng = random.Random(seed) if seed is not None else None
+    bitsets = FeasibilityBitsets(num_activities, shadow_constraints, activities_to_flights, flights_to_activities, near_pairs)
 
     # Algorithm 2
-    current_solution, nodes_to_clusters = initialize_clusters(weights, activities_to_flights, gates_to_indices, U_successor)
-    best_score = calculate_total_score(current_solution, weights, large_negative)[0]
+    current_state = initialize_clusters(weights, num_activities, num_gates, U_successor, act_kind, deadline)
+    best_score, _, best_no_unassigned_activities = calculate_total_score(current_state, weights, large_negative, num_activities)
     best_score0 = best_score
-    best_solution = copy.deepcopy(current_solution)     # Otherwise while loop always runs with current solution
-    best_nodes_to_clusters = copy.deepcopy(nodes_to_clusters)   # Otherwise nodes_to_clusters is modified
+    best_state = current_state.copy()     # Otherwise while loop always runs with current solution
+    report_progress(progress_callback, start_time, best_score, best_no_unassigned_activities)
 
     limited_run_count = 0
     run_count = 1
     while limited_run_count < 7:
+        if deadline_passed(deadline):
+            print(f"Time limit of {time_limit} seconds reached; returning the best solution found so far.")
+            break
         print(f"\n================================ Run n°{run_count} ================================\n"
               f"Starting new run. Value of current solution: {readable_score(best_score)}")
 
         # Algorithm 1
-        refined_solution, refined_nodes_to_clusters, cluster_contains_gate, cluster_to_gates = (
-            refine_clusters(best_solution, best_nodes_to_clusters, num_activities, num_gates, weights, shadow_constraints,
-                            flights_to_activities, activities_to_flights, gates_to_indices, large_negative,
-                            sc_per_act_gate_pair, sc_per_gate, M_validGate))
-        score_alg1, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_solution, weights, large_negative)
+        refined_state = refine_clusters(best_state, num_activities, num_gates, weights, shadow_constraints,
+                                        flights_to_activities, activities_to_flights, act_kind, large_negative,
+                                        M_validGate, near_pairs, vertex_order_rng, deadline, bitsets)
+        score_alg1, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_state, weights, large_negative, num_activities)
         print(f" • Algorithm 1 (refinement) terminated. Value of solution: {readable_score(score_alg1)}"
               f" ({readable_score(score_alg1-best_score0)} better than previous run)")
 
@@ -561,9 +786,9 @@ def iterative_refinement_gate_optimization(num_activities, num_gates, weights, U
             break  # Terminate the process if no improvement is found
 
         elif score_alg1 > best_score:
-            best_solution = copy.deepcopy(refined_solution)
-            best_nodes_to_clusters = copy.deepcopy(refined_nodes_to_clusters)
+            best_state = refined_state.copy()
             best_score = score_alg1
+            report_progress(progress_callback, start_time, best_score, no_unassigned_activities)
             limited_run_count = 0  # Reset the limit run count if improvement is found
             run_count +=1
             # print("New best solution found, score updated:", readable_score(best_score))
@@ -573,35 +798,39 @@ def iterative_refinement_gate_optimization(num_activities, num_gates, weights, U
             run_count += 1
 
         # Reassign unassigned activities
-        reassigned_solution, reassigned_nodes_to_clusters = reassign_vertices(refined_solution, cluster_contains_gate, cluster_to_gates, weights, M_validGate, P_preferences,
-                                     activities_to_flights, refined_nodes_to_clusters)
-        re_score, re_score_excl_penalties, re_no_unassigned_activities = calculate_total_score(reassigned_solution, weights, large_negative)
+        reassigned_state = reassign_vertices(refined_state, weights, M_validGate, P_preferences, activities_to_flights, deadline)
+        re_score, re_score_excl_penalties, re_no_unassigned_activities = calculate_total_score(reassigned_state, weights, large_negative, num_activities)
         print(f" • Value after reassignining unassigned activities: {readable_score(re_score)}")
 
         # Handle any conflicts in the solution
-        eliminate_solution, eliminate_nodes_to_clusters = eliminate_conflicts(reassigned_solution, M_validGate, U_successor, activities_to_flights, flights_to_activities,
-                            reassigned_nodes_to_clusters, shadow_constraints, weights, large_negative)
-        el_score, el_score_excl_penalties, el_no_unassigned_activities = calculate_total_score(eliminate_solution, weights, large_negative)
+        eliminate_state = eliminate_conflicts(reassigned_state, M_validGate, activities_to_flights, flights_to_activities,
+                                              bitsets, act_start, num_activities, deadline)
+        el_score, el_score_excl_penalties, el_no_unassigned_activities = calculate_total_score(eliminate_state, weights, large_negative, num_activities)
         print(f" • Value after eliminating conflicts: {readable_score(el_score)} (excl. penalties: {readable_score(el_score_excl_penalties)})"
               f"\n   /!\ There are still {el_no_unassigned_activities} unassigned activities out of {num_activities} ({str(100*el_no_unassigned_activities/num_activities)[:4]}%)")
         print(f"   Value of current best solution: {readable_score(best_score)}\n"
               f"   Improvement/deterioration from the start by {readable_score(best_score-best_score0)} ({str((best_score-best_score0)*100/abs(best_score0))[0:7]}%)")
         print(f"================================= Add: {el_score_excl_penalties}")  #
 
-        suboptimalGates, amountSuboptimalGates, towings, amountTowings = suboptimalGates_and_towing(refined_solution, flights_to_activities, activities_to_flights, refined_nodes_to_clusters)
-        print(f"   Of the 26 remote (suboptimal) gates, {amountSuboptimalGates} have activities ({str(100*(amountSuboptimalGates)/26)[0:5]}), and {amountTowings} towings.")
+        suboptimalGates, amountSuboptimalGates, towings, amountTowings = suboptimalGates_and_towing(refined_state, flights_to_activities, activities_to_flights,
+                                                                                                    num_activities, gate_kind)
+        num_remote_gates = int(np.sum(gate_kind == GATE_REMOTE))
+        print(f"   Of the {num_remote_gates} remote (suboptimal) gates, {amountSuboptimalGates} have activities ({str(100*(amountSuboptimalGates)/max(num_remote_gates, 1))[0:5]}), and {amountTowings} towings.")
 
-    return best_solution, best_score
+    return best_state.to_solution(), best_score
 
 def pre_optimized_2opt_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences,
                                            shadow_constraints, num_flights,
-                                           activities_to_flights, gates_to_indices, flights_to_activities,
-                                           large_negative, sc_per_act_gate_pair, sc_per_gate):
-    # Algorithm 3 + 2-opt
-    current_solution = initialize_clusters(weights, activities_to_flights, gates_to_indices, U_successor)
-    best_solution = refine_clusters(current_solution, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
-                        activities_to_flights, gates_to_indices, M_validGate)
-    best_score, score_excl_penalties, no_unassigned_activities = calculate_total_score(best_solution, weights, large_negative)
+                                           activities_to_flights, act_kind, flights_to_activities,
+                                           large_negative, near_pairs, act_start=None):
+    # Algorithm 3 + 2-opt: every run applies 2-opt swaps to the best solution before refining it (act_start: see
+    # iterative_refinement_gate_optimization). Returns the best solution and its score.
+    bitsets = FeasibilityBitsets(num_activities, shadow_constraints, activities_to_flights, flights_to_activities, near_pairs)
+    swap_neighbours = build_swap_neighbours(num_activities, activities_to_flights, M_validGate, near_pairs)
+    current_state = initialize_clusters(weights, num_activities, num_gates, U_successor, act_kind)
+    best_state = refine_clusters(current_state, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
+                                 activities_to_flights, act_kind, large_negative, M_validGate, near_pairs, bitsets=bitsets)
+    best_score, score_excl_penalties, no_unassigned_activities = calculate_total_score(best_state, weights, large_negative, num_activities)
 
     limited_run_count = 0
     run_count = 1
@@ -611,50 +840,59 @@ def pre_optimized_2opt_gate_optimization(num_activities, num_gates, weights, U_s
 
         # Algorithm 1
         # Apply a 2-opt step to refine the solution further by examining pairs of activities
-        two_opt_refined_solution = apply_two_opt_step(current_solution, weights, U_successor)
-        refined_solution = refine_clusters(two_opt_refined_solution, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
-                        activities_to_flights, gates_to_indices, M_validGate)
-        current_score, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_solution, weights, large_negative)
+        improvement_found, two_opt_state = apply_two_opt_step(best_state.copy(), weights, large_negative, activities_to_flights,
+                                                              M_validGate, num_activities, swap_neighbours)
+        refined_state = refine_clusters(two_opt_state, num_activities, num_gates, weights, shadow_constraints, flights_to_activities,
+                                        activities_to_flights, act_kind, large_negative, M_validGate, near_pairs, bitsets=bitsets)
+        current_score, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_state, weights, large_negative, num_activities)
 
         if current_score > best_score:
-            best_solution = refined_solution[:]
+            best_state = refined_state.copy()
             best_score = current_score
             limited_run_count = 0  # Reset if an improvement is found
         else:
             limited_run_count += 1  # Continue if no improvement
+        run_count += 1
 
         # Reassign any non-optimal gate assignments and handle conflicts
-        reassign_vertices(refined_solution, weights, M_validGate, P_preferences)
-        eliminate_conflicts(refined_solution, M_validGate, U_successor)
+        reassigned_state = reassign_vertices(refined_state, weights, M_validGate, P_preferences, activities_to_flights)
+        eliminate_conflicts(reassigned_state, M_validGate, activities_to_flights, flights_to_activities, bitsets, act_start,
+                            num_activities)
 
-    return best_solution
+    return best_state.to_solution(), best_score
 
 def integrated_2opt_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences,
                                            shadow_constraints, num_flights,
-                                           activities_to_flights, gates_to_indices, flights_to_activities,
-                                           large_negative, sc_per_act_gate_pair, sc_per_gate):
-    # Algorithm 3 + 2-opt
-    current_solution, nodes_to_clusters = initialize_clusters(weights, activities_to_flights, gates_to_indices, U_successor)
-    best_score = calculate_total_score(current_solution, weights, large_negative)[0]
+                                           activities_to_flights, act_kind, flights_to_activities,
+                                           large_negative, near_pairs, time_limit=None, progress_callback=None, act_start=None):
+    # Algorithm 3 + 2-opt (time_limit, progress_callback and act_start: see iterative_refinement_gate_optimization)
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else None
+    current_state = initialize_clusters(weights, num_activities, num_gates, U_successor, act_kind, deadline)
+    best_score, _, best_no_unassigned_activities = calculate_total_score(current_state, weights, large_negative, num_activities)
     best_score0 = best_score
-    best_solution = copy.deepcopy(current_solution)     # Otherwise while loop always runs with current solution
-    best_nodes_to_clusters = copy.deepcopy(nodes_to_clusters)   # Otherwise nodes_to_clusters is modified
+    best_state = current_state.copy()     # Otherwise while loop always runs with current solution
+    report_progress(progress_callback, start_time, best_score, best_no_unassigned_activities)
+    swap_neighbours = build_swap_neighbours(num_activities, activities_to_flights, M_validGate, near_pairs)
+    bitsets = FeasibilityBitsets(num_activities, shadow_constraints, activities_to_flights, flights_to_activities, near_pairs)
 
-    # improvement_found, two_opt_solution, two_opt_nodes_to_clusters = apply_two_opt_step(
-    #     current_solution, nodes_to_clusters, weights, large_negative, activities_to_flights, M_validGate)
+    # improvement_found, two_opt_state = apply_two_opt_step(
+    #     current_state, weights, large_negative, activities_to_flights, M_validGate, num_activities, swap_neighbours)
 
     limited_run_count = 0
     run_count = 1
     while limited_run_count < 7:
+        if deadline_passed(deadline):
+            print(f"Time limit of {time_limit} seconds reached; returning the best solution found so far.")
+            break
         print(f"\n================================ Run n°{run_count} ================================\n"
               f"Starting new run. Value of current solution: {readable_score(best_score)}")
 
         # Algorithm 1
-        refined_solution, refined_nodes_to_clusters, cluster_contains_gate, cluster_to_gates = (
-            refine_clusters(best_solution, best_nodes_to_clusters, num_activities, num_gates, weights, shadow_constraints,
-                            flights_to_activities, activities_to_flights, gates_to_indices, large_negative,
-                            sc_per_act_gate_pair, sc_per_gate, M_validGate))
-        score_alg1, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_solution, weights, large_negative)
+        refined_state = refine_clusters(best_state, num_activities, num_gates, weights, shadow_constraints,
+                                        flights_to_activities, activities_to_flights, act_kind, large_negative,
+                                        M_validGate, near_pairs, deadline=deadline, bitsets=bitsets)
+        score_alg1, score_excl_penalties, no_unassigned_activities = calculate_total_score(refined_state, weights, large_negative, num_activities)
         print(f" • Algorithm 1 (refinement) terminated. Value of solution: {readable_score(score_alg1)}"
               f" ({readable_score(score_alg1-best_score0)} better than previous run)")
 
@@ -663,9 +901,9 @@ def integrated_2opt_gate_optimization(num_activities, num_gates, weights, U_succ
             break  # Terminate the process if no improvement is found
 
         elif score_alg1 > best_score:
-            best_solution = copy.deepcopy(refined_solution)
-            best_nodes_to_clusters = copy.deepcopy(refined_nodes_to_clusters)
+            best_state = refined_state.copy()
             best_score = score_alg1
+            report_progress(progress_callback, start_time, best_score, no_unassigned_activities)
             limited_run_count = 0  # Reset the limit run count if improvement is found
             run_count += 1
 
@@ -674,13 +912,14 @@ def integrated_2opt_gate_optimization(num_activities, num_gates, weights, U_succ
             run_count += 1
 
         # Apply two-opt step
-        improvement_found, two_opt_solution, two_opt_nodes_to_clusters = apply_two_opt_step(
-            refined_solution, refined_nodes_to_clusters, weights, large_negative, activities_to_flights, M_validGate)
+        improvement_found, two_opt_state = apply_two_opt_step(
+            refined_state, weights, large_negative, activities_to_flights, M_validGate, num_activities, swap_neighbours,
+            deadline=deadline)
 
         if improvement_found:
-            best_solution = copy.deepcopy(two_opt_solution)
-            best_nodes_to_clusters = copy.deepcopy(two_opt_nodes_to_clusters)
-            best_score = calculate_total_score(two_opt_solution, weights, large_negative)[0]
+            best_state = two_opt_state.copy()
+            best_score, _, best_no_unassigned_activities = calculate_total_score(two_opt_state, weights, large_negative, num_activities)
+            report_progress(progress_callback, start_time, best_score, best_no_unassigned_activities)
             print(f" • Two-opt step found an improvement. Value of solution: {readable_score(best_score)}")
             limited_run_count = 0  # Reset the limit run count if improvement is found
             run_count += 1
@@ -688,38 +927,104 @@ def integrated_2opt_gate_optimization(num_activities, num_gates, weights, U_succ
             print(f" • Two-opt step did not find an improvement. Continuing with previous best solution.")
 
         # Reassign unassigned activities
-        reassigned_solution, reassigned_nodes_to_clusters = reassign_vertices(refined_solution, cluster_contains_gate, cluster_to_gates, weights, M_validGate, P_preferences,
-                                     activities_to_flights, refined_nodes_to_clusters)
-        re_score, re_score_excl_penalties, re_no_unassigned_activities = calculate_total_score(reassigned_solution, weights, large_negative)
+        reassigned_state = reassign_vertices(refined_state, weights, M_validGate, P_preferences, activities_to_flights, deadline)
+        re_score, re_score_excl_penalties, re_no_unassigned_activities = calculate_total_score(reassigned_state, weights, large_negative, num_activities)
         print(f" • Value after reassignining unassigned activities: {readable_score(re_score)}")
 
         # Handle any conflicts in the solution
-        eliminate_solution, eliminate_nodes_to_clusters = eliminate_conflicts(reassigned_solution, M_validGate, U_successor, activities_to_flights, flights_to_activities,
-                            reassigned_nodes_to_clusters, shadow_constraints, weights, large_negative)
-        el_score, el_score_excl_penalties, el_no_unassigned_activities = calculate_total_score(eliminate_solution, weights, large_negative)
+        eliminate_state = eliminate_conflicts(reassigned_state, M_validGate, activities_to_flights, flights_to_activities,
+                                              bitsets, act_start, num_activities, deadline)
+        el_score, el_score_excl_penalties, el_no_unassigned_activities = calculate_total_score(eliminate_state, weights, large_negative, num_activities)
         print(f" • Value after eliminating conflicts: {readable_score(el_score)} (excl. penalties: {readable_score(el_score_excl_penalties)})"
               f"\n   /!\ There are still {el_no_unassigned_activities} activities out of {num_activities} ({str(100*el_no_unassigned_activities/num_activities)[:4]}%)")
         print(f"   Value of current best solution: {readable_score(best_score)}\n"
               f"   Improvement/deterioration from the start by {readable_score(best_score-best_score0)} ({str((best_score-best_score0)*100/abs(best_score0))[0:7]}%)")
 
-    return best_solution, best_score
+    return best_state.to_solution(), best_score
 
 
+# Multi-start: independent runs of iterative_refinement_gate_optimization in a process pool. The weight array is
+# placed in shared memory and attached read-only by the workers; the remaining instance data is sent once per worker.
+_multi_start_worker = {}
+
+def _init_multi_start_worker(weights_name, weights_shape, weights_dtype, instance):
+    weights_shm = shared_memory.SharedMemory(name=weights_name)
+    weights = np.ndarray(weights_shape, dtype=weights_dtype, buffer=weights_shm.buf)
+    weights.flags.writeable = False
+    _multi_start_worker.update(weights_shm=weights_shm, weights=weights, instance=instance)
+
+def _run_single_start(start_seed_deadline):
+    start, seed, deadline = start_seed_deadline
+    order_seed = seed if start > 0 else None    # start 0 keeps the vertex order of a single run
+    weights = _multi_start_worker['weights']
+    (num_activities, num_gates, U_successor, M_validGate, P_preferences, shadow_constraints, num_flights,
+     activities_to_flights, act_kind, flights_to_activities, large_negative, gate_kind, near_pairs, act_start) = _multi_start_worker['instance']
+    t1 = time.time()
+    random.seed(seed)       # reassign_vertices picks among the maximum preference gates at random
+    with contextlib.redirect_stdout(io.StringIO()):
+        solution, score = iterative_refinement_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate,
+                                                                 P_preferences, shadow_constraints, num_flights,
+                                                                 activities_to_flights, act_kind, flights_to_activities,
+                                                                 large_negative, gate_kind, near_pairs, order_seed,
+                                                                 None if deadline is None else max(deadline - time.time(), 0),
+                                                                 act_start=act_start)
+    no_unassigned_activities = calculate_total_score(solution, weights, large_negative, num_activities)[2]
+    stats = {'start': start, 'seed': seed, 'score': score, 'unassigned': no_unassigned_activities, 'runtime': time.time() - t1}
+    return solution, score, stats
+
+def multi_start_gate_optimization(num_starts, num_processes, num_activities, num_gates, weights, U_successor, M_validGate,
+                                  P_preferences, shadow_constraints, num_flights, activities_to_flights, act_kind,
+                                  flights_to_activities, large_negative, gate_kind, near_pairs, base_seed=0, time_limit=None,
+                                  act_start=None):
+    """ Runs iterative_refinement_gate_optimization num_starts times on num_processes processes (None: all cores).
+    Start k seeds the random choices of reassign_vertices with base_seed + k; starts k > 0 also use it to shuffle the
+    vertex order, start 0 keeps the order of a single run (and gives the same result as
+    iterative_refinement_gate_optimization after random.seed(base_seed)). All starts stop time_limit seconds after the
+    call (None: no limit).
+    Returns the best solution, its score and a list of statistics per start (start, seed, score, unassigned, runtime). """
+    t1 = time.time()
+    weights = np.asarray(weights[:, :])
+    instance = (num_activities, num_gates, U_successor, M_validGate, P_preferences, shadow_constraints, num_flights,
+                activities_to_flights, act_kind, flights_to_activities, large_negative, gate_kind, near_pairs, act_start)
+    deadline = t1 + time_limit if time_limit is not None else None
+    starts = [(start, base_seed + start, deadline) for start in range(num_starts)]
+
+    weights_shm = shared_memory.SharedMemory(create=True, size=max(weights.nbytes, 1))
+    try:
+        np.ndarray(weights.shape, dtype=weights.dtype, buffer=weights_shm.buf)[:] = weights
+        with multiprocessing.Pool(num_processes, _init_multi_start_worker,
+                                  (weights_shm.name, weights.shape, weights.dtype.str, instance)) as pool:
+            results = pool.map(_run_single_start, starts)
+    finally:
+        weights_shm.close()
+        weights_shm.unlink()
+
+    start_stats = [stats for (solution, score, stats) in results]
+    best_solution, best_score, best_stats = max(results, key=lambda result: result[1])    # first start with the best score
+    for stats in start_stats:
+        print(f" • Start {stats['start']} (seed {stats['seed']}): {readable_score(stats['score'])}, "
+              f"{stats['unassigned']} unassigned activities, {stats['runtime']:.2f} seconds")
+    print(f"Best of {num_starts} starts: start {best_stats['start']} with {readable_score(best_score)}. "
+          f"Runtime: {time.time() - t1} seconds.")
+
+    return best_solution, best_score, start_stats
+
 def readable_score(n):
     return f"{n:,}"
 
 
 
-def suboptimalGates_and_towing(solution, flights_to_activities, activities_to_flights, nodes_to_clusters):
+def suboptimalGates_and_towing(state, flights_to_activities, activities_to_flights, num_activities, gate_kind):
     suboptimalGates = []
     towings = []
 
-    for cluster in solution:
-        for vertex in solution[cluster]:
-            if not vertex_is_act(vertex):   # vertex = gates
+    nodes_to_clusters = state.cluster_of
+    for cluster in state:
+        for vertex in state[cluster]:
+            if not vertex_is_act(vertex, num_activities):   # vertex = gates
                 gate = vertex
-                if gate[0] != '1' and gate[0] != '2':   # If gate is remote
-                    if len(solution[cluster]) > 1:      # If gate is not alone in the cluster
+                if gate_kind[gate - num_activities] == GATE_REMOTE:   # If gate is remote
+                    if len(state[cluster]) > 1:      # If gate is not alone in the cluster
                         suboptimalGates.append(gate)
             else:   # vertex = activity
                 # vertex_cluster = nodes_to_clusters[vertex]
@@ -1,7 +1,70 @@
+import numpy as np
 import pandas as pd
+import openpyxl
+from openpyxl.utils import column_index_from_string
 import datetime
-
-def import_data(local_path, EstimatedOrReal):
+import hashlib
+import os
+import pickle
+import re
+
+# On-disk cache of fully derived instances (see createInputData). The entries are pickles of the whole tuple returned by
+# createInputData (DataFrames and NumPy arrays included), so they can only be read back with the same pandas/NumPy
+# versions: these are part of the file name and of the key. Unpickling runs arbitrary code, so the cache directory must
+# only contain files written by this module: never load cache files from an untrusted source.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance_cache')
+CACHE_VERSION = 6   # bump whenever the structure returned by createInputData changes
+CACHE_LIBRARIES = f"pd{pd.__version__}_np{np.__version__}"
+
+# Integer-indexed representation (see build_integer_ids)
+ACT_ARR, ACT_PAR, ACT_DEP = 0, 1, 2     # activity kinds
+GATE_CONTACT, GATE_REMOTE = 0, 1        # gate kinds
+NO_SUCCESSOR = -1                       # successor of departure activities
+ACT_KIND_NAMES = {ACT_ARR: 'arr', ACT_PAR: 'par', ACT_DEP: 'dep'}
+
+# Activity intervals when the time differences are derived from the schedule (TimeSource = "Schedule")
+ARRIVAL_DURATION = 20       # minutes after arrival (ETA/RTA) covered by the arrival activity of a towable flight
+DEPARTURE_DURATION = 20     # minutes before departure (ETD/RTD) covered by the departure activity of a towable flight
+
+# Sheet and last column of the T matrix (time differences) for each mode. Regular instance:
+TMATRIX_SHEETS = {"Estimated": ('EBBR - Tmatrix (estimated)', 'PK'),
+                  "Real": ('EBBR - Tmatrix (real)', 'OD')}
+# # Smaller instance (1/3rd of the flights)
+# TMATRIX_SHEETS = {"Estimated": ('EBBR - Tmatrix (estimated)', 'EP'),
+#                   "Real": ('EBBR - Tmatrix (real)', 'ED')}
+
+def read_matrix_sheet(workbook, sheet_name, last_column, nrows=None):
+    '''Stream a labelled matrix sheet (column labels in the first row, row labels in column A) straight into a NumPy
+    array, without building an intermediate DataFrame. Only columns A..last_column and at most nrows data rows are read.
+    The array is int64 if all cells are integers (as pandas would infer), float64 otherwise.
+    Returns (row_labels, column_labels, values).
+    '''
+    sheet = workbook[sheet_name]
+    max_col = column_index_from_string(last_column)
+    rows = sheet.iter_rows(min_row=1, max_col=max_col, values_only=True)
+
+    header = next(rows)
+    column_labels = []
+    for label in header[1:]:
+        if label is None:   # end of the labelled columns
+            break
+        column_labels.append(label)
+    num_columns = len(column_labels)
+
+    row_labels = []
+    row_values = []
+    for row in rows:
+        if row[0] is None or (nrows is not None and len(row_labels) == nrows):
+            break
+        row_labels.append(row[0])
+        row_values.append(np.array(row[1:num_columns + 1], dtype=np.float64))     # empty cells become NaN
+    values = np.vstack(row_values) if row_values else np.zeros((0, num_columns))
+
+    if np.all(np.isfinite(values)) and np.array_equal(values, np.round(values)):
+        values = values.astype(np.int64)
+    return row_labels, column_labels, values
+
+def import_data(local_path, EstimatedOrReal, read_TimeDiff=True):
     # Flights
     flights = pd.read_excel(local_path, sheet_name='EBBR - Flights', usecols='A:AV', header=1, index_col=0)
     num_flights = len(flights)
@@ -10,25 +73,23 @@ def import_data(local_path, EstimatedOrReal):
     gates = pd.read_excel(local_path, sheet_name='EBBR - Gates (data)', usecols='A:G', header=0, index_col=0)
     num_gates = len(gates)
 
-    # T Matrix (Time Differences)
-    # Regular instance
-    T_timeDiff_Estim = pd.read_excel(local_path, sheet_name='EBBR - Tmatrix (estimated)', usecols='A:PK', header=0, index_col=0)
-    T_timeDiff_Real = pd.read_excel(local_path, sheet_name='EBBR - Tmatrix (real)', usecols='A:OD', header=0, index_col=0)
-    if EstimatedOrReal == "Estimated":
-        T_timeDiff = T_timeDiff_Estim
-    elif EstimatedOrReal == "Real":
-        T_timeDiff = T_timeDiff_Real
-
-    # # Smaller instance (1/3rd of the flights)
-    # T_timeDiff_Estim = pd.read_excel(local_path, sheet_name='EBBR - Tmatrix (estimated)', usecols='A:EP', header=0, index_col=0)
-    # T_timeDiff_Real = pd.read_excel(local_path, sheet_name='EBBR - Tmatrix (real)', usecols='A:ED', header=0, index_col=0)
-    # if EstimatedOrReal == "Estimated":
-    #     T_timeDiff = T_timeDiff_Estim
-    # elif EstimatedOrReal == "Real":
-    #     T_timeDiff = T_timeDiff_Real
-
-    # Gates Neighbours and Distances
-    Gates_N = pd.read_excel(local_path, sheet_name='EBBR - Gates (next)', usecols='A:DA', header=0, index_col=0, nrows=num_gates)
+    # The large square matrices are streamed cell by cell in read-only mode, and only the T matrix of the selected mode
+    # is read (none at all if the time differences are derived from the schedule, see ActivityTimes).
+    # They are wrapped in DataFrames afterwards (no copy) for label-based access.
+    workbook = openpyxl.load_workbook(local_path, read_only=True, data_only=True)
+    try:
+        # T Matrix (Time Differences)
+        T_timeDiff = None
+        if read_TimeDiff:
+            sheet_name, last_column = TMATRIX_SHEETS[EstimatedOrReal]
+            row_labels, column_labels, values = read_matrix_sheet(workbook, sheet_name, last_column)
+            T_timeDiff = pd.DataFrame(values, index=row_labels, columns=column_labels, copy=False)
+
+        # Gates Neighbours and Distances
+        row_labels, column_labels, values = read_matrix_sheet(workbook, 'EBBR - Gates (next)', 'DA', nrows=num_gates)
+        Gates_N = pd.DataFrame(values, index=row_labels, columns=column_labels, copy=False)
+    finally:
+        workbook.close()
 
     return flights, num_flights, gates, num_gates, T_timeDiff, Gates_N
 
@@ -50,49 +111,44 @@ def process_data(flights, gates):
 
     return Flight_No, ETA, ETD, RTA, RTD, AC_size, Gate_No, Max_Wingspan, Is_Int, Is_LowCost, Is_Close
 
-def build_preferences_dict(flights, Is_Int, Is_LowCost, Is_Close, Flight_No, M_validGate):
+def build_preference_matrix(flights, Is_Int, Is_LowCost, Is_Close, Flight_No, Gate_No):
+    """ Flights x gates matrix of preferences (rows in the order of Flight_No, columns in the order of Gate_No),
+    computed in one vectorized pass from the Pref./Is_* columns. """
+    pref_int = flights.loc[Flight_No, "Pref. Int"].to_numpy()[:, None]
+    pref_normal = flights.loc[Flight_No, "Pref. EU (normal)"].to_numpy()[:, None]
+    pref_low_cost = flights.loc[Flight_No, "Pref. EU (low cost)"].to_numpy()[:, None]
+    pref_close = flights.loc[Flight_No, "Pref. Close"].to_numpy()[:, None]
+    is_int = Is_Int.loc[Gate_No].to_numpy()[None, :]
+    is_low_cost = Is_LowCost.loc[Gate_No].to_numpy()[None, :]
+    is_close = Is_Close.loc[Gate_No].to_numpy()[None, :] == 1
+
+    # Flight and gate are both INT or both EU. Kept exactly as in the original dict construction, where the conditions
+    # "Is_Int[gate] == (1 or 2)" and "Is_Int[gate] == (0 or 2)" reduce to "Is_Int[gate] == 1" and "Is_Int[gate] == 2".
+    both_are_int = (pref_int == 10) & (is_int == 1)
+    both_are_eu = (pref_int == 0) & (is_int == 2)
+    P = np.where(both_are_int | both_are_eu, 10, 0)
+
+    # EU flights: normal/low cost match, otherwise the close/not close preference
+    both_normal = (pref_normal == 10) & (is_low_cost == 0)
+    both_low_cost = (pref_low_cost == 10) & (is_low_cost == 1)
+    close_bonus = np.select([pref_close == 0, pref_close == 10], [-10, 10], 0)  # -10/0/+10 pts if flight doesn't want/is indifferent/wants a close gate
+    eu_bonus = np.select([both_normal, both_low_cost, is_close], [pref_normal, pref_low_cost, close_bonus], -close_bonus)
+    P = P + np.where(both_are_eu, eu_bonus, 0)
+
+    # For dummy gate, set preference to some large <0 value
+    P[:, [g for g, gate in enumerate(Gate_No) if gate == "Dum"]] = -1000
+    return P.astype(np.int64)
+
+def build_preferences_dict(flights, Is_Int, Is_LowCost, Is_Close, Flight_No, Gate_No, M_validGate, preference_matrix=None):
     """ Builds a dictionary of flight preferences. """
+    if preference_matrix is None:
+        preference_matrix = build_preference_matrix(flights, Is_Int, Is_LowCost, Is_Close, Flight_No, Gate_No)
+    gate_pos = {gate: g for g, gate in enumerate(Gate_No)}
+
     P_preferences = {}  # keys: flights, values: dictionary with keys = gate IDs, values = assigned preference
-    for flight in Flight_No:
-        P_preferences[flight] = {}
-        for gate in M_validGate[flight]:
-            g_pref = 0
-            if gate == "Dum":
-                g_pref -= 1000     # For dummy gate, set preference to some large <0 value
-            else:
-                prefForInt = flights.loc[flight, "Pref. Int"]
-                BothAreInt = prefForInt == 10 and Is_Int[gate] == (1 or 2)  # If flight is INT and gate is INT or remote
-                BothAreEU = prefForInt == 0 and Is_Int[gate] == (0 or 2)    # If flight is EU and gate is EU or remote
-                if BothAreInt or BothAreEU:
-                    g_pref += 10     # Already included in M_validGate, but the preference still increases
-                    pass
-                if BothAreEU:
-                    prefForNormal = flights.loc[flight, "Pref. EU (normal)"]
-                    prefForLowCost = flights.loc[flight, "Pref. EU (low cost)"]
-                    prefForClose = flights.loc[flight, "Pref. Close"]
-                    BothNormal = prefForNormal == 10 and Is_LowCost[gate] == 0
-                    BothLowCost = prefForLowCost == 10 and Is_LowCost[gate] == 1
-                    GateIsClose = Is_Close[gate] == 1
-                    if BothNormal:
-                        g_pref += prefForNormal
-                    elif BothLowCost:
-                        g_pref += prefForLowCost
-                    elif GateIsClose:
-                        if prefForClose == 0:
-                            g_pref -= 10    # -10 pts of preference if flight doesn't want a close gate
-                        elif prefForClose == 5:
-                            g_pref -= 0     # 0 pts of preference if flight is indifferent to a close gate
-                        elif prefForClose == 10:
-                            g_pref += 10    # +10 pts of preference if flight does want a close gate
-                    elif not GateIsClose:
-                        if prefForClose == 0:
-                            g_pref += 10    # +10 pts of preference if flight doesn't want a close gate
-                        elif prefForClose == 5:
-                            g_pref -= 0     # 0 pts of preference if flight is indifferent to a close gate
-                        elif prefForClose == 10:
-                            g_pref -= 10    # -10 pts of preference if flight does want a close gate
-
-            P_preferences[flight][gate] = g_pref
+    for f, flight in enumerate(Flight_No):
+        prefs = preference_matrix[f].tolist()
+        P_preferences[flight] = {gate: prefs[gate_pos[gate]] for gate in M_validGate[flight]}
 
     return P_preferences
 
@@ -110,7 +166,6 @@ def createActivitiesFromFlights_VBA(T_timeDiff, flights, EstimatedOrReal):
     elif EstimatedOrReal == "Real":
         ColumnCheckTurnaround = 48-1-1      # Column AV is the 48th column, -1 because column 1 = indices, -1 because .iloc start from 0
 
-    myActivities = T_timeDiff.columns.tolist()  # Get all activities
     myFlightsList = flights.index.tolist()
 
     for flight in myFlightsList:
@@ -134,64 +189,339 @@ def createActivitiesFromFlights_VBA(T_timeDiff, flights, EstimatedOrReal):
         if is_towable:
             activities_to_flights[f"par_{flight}"] = flight
 
-    num_activities = len(myActivities)
+    if T_timeDiff is not None:
+        num_activities = len(T_timeDiff.columns)    # all activities of the T matrix
+    else:
+        num_activities = len(activities_to_flights)
 
     return flights_to_activities, activities_to_flights, Udict, no_towable_flights, num_activities
 
-def build_Mdict(AC_size, Pref_Int, Max_Wingspan, Is_Int, Flight_No, Gate_No):
-    Mdict = {}
+def times_to_minutes(times):
+    '''Convert a column of times (datetimes, times of day, or Excel serial day numbers) to minutes.
+    Datetimes are counted from midnight of the earliest day in the column.
+    '''
+    values = list(times)
+    if all(isinstance(t, datetime.time) for t in values):
+        return np.array([60 * t.hour + t.minute + t.second / 60 for t in values], dtype=np.float64)
+    if all(isinstance(t, (int, float, np.integer, np.floating)) for t in values):
+        return np.array(values, dtype=np.float64) * 24 * 60
+    stamps = pd.to_datetime(pd.Series(values))
+    return ((stamps - stamps.min().normalize()).dt.total_seconds() / 60).to_numpy()
+
+def flight_activity_intervals(arrival, departure, is_towable):
+    '''Start and end (in minutes) of the activities of a flight, keyed by activity kind ('arr', 'par', 'dep'): towable
+    flights get an arrival of ARRIVAL_DURATION, a departure of DEPARTURE_DURATION and a parking activity in between,
+    other flights split their stay in an arrival and a departure half. A towable flight staying less than
+    ARRIVAL_DURATION + DEPARTURE_DURATION is split in halves as well, with a parking activity of length 0 in between, so
+    that the activities of a flight never overlap.
+    Times are minutes on one continuous axis (e.g. from midnight of the first day, see times_to_minutes): a flight
+    staying over midnight departs after 24 * 60. Raises ValueError if the departure is before the arrival.
+    '''
+    if departure < arrival:
+        raise ValueError(f"Departure at {departure} before the arrival at {arrival} (minutes)")
+    middle = (arrival + departure) // 2
+    if is_towable:
+        arrival_end = min(arrival + ARRIVAL_DURATION, middle)
+        departure_start = max(departure - DEPARTURE_DURATION, middle)
+        return {'arr': (arrival, arrival_end), 'par': (arrival_end, departure_start), 'dep': (departure_start, departure)}
+    return {'arr': (arrival, middle), 'dep': (middle, departure)}
+
+def build_activity_intervals(flights, flights_to_activities, activities_to_flights, EstimatedOrReal):
+    '''Start and end (in minutes) of every activity, in the order of activities_to_flights, derived from ETA/ETD
+    (Estimated) or RTA/RTD (Real). Towable flights get an arrival of ARRIVAL_DURATION, a departure of
+    DEPARTURE_DURATION and a parking activity in between; other flights split their stay in an arrival and a departure half
+    (see flight_activity_intervals). Times are rounded to whole minutes, like the T matrix sheets. If the columns only
+    hold times of day (no dates), a departure before the arrival is taken to be on the next day.
+    '''
+    if EstimatedOrReal == "Estimated":
+        arrival_column, departure_column = 'ETA', 'ETD'
+    elif EstimatedOrReal == "Real":
+        arrival_column, departure_column = 'RTA', 'RTD'
+
+    Flight_No = flights.index.tolist()
+    times = pd.concat([flights[arrival_column], flights[departure_column]])
+    minutes = np.round(times_to_minutes(times)).astype(np.int64)
+    arrival = dict(zip(Flight_No, minutes[:len(Flight_No)]))
+    departure = dict(zip(Flight_No, minutes[len(Flight_No):]))
+    if all(isinstance(t, datetime.time) for t in times):
+        # times of day: flights staying over midnight depart on the next day
+        departure = {flight: time + 24 * 60 if time < arrival[flight] else time for flight, time in departure.items()}
+
+    intervals = {}
     for flight in Flight_No:
-        valid_gates = [gate for gate in Gate_No if AC_size.loc[flight] <= Max_Wingspan.loc[gate] and (Pref_Int[flight] / 10 == Is_Int.loc[gate] or Is_Int.loc[gate] == 2)]
+        is_towable = len(flights_to_activities[flight]) == 3    # arrival, departure, parking
+        for kind, interval in flight_activity_intervals(arrival[flight], departure[flight], is_towable).items():
+            intervals[f"{kind}_{flight}"] = interval
+
+    act_start = np.array([intervals[act][0] for act in activities_to_flights], dtype=np.int64)
+    act_end = np.array([intervals[act][1] for act in activities_to_flights], dtype=np.int64)
+    return act_start, act_end
+
+class ActivityTimes:
+    '''Time differences derived on demand from activity intervals, as a replacement for the precomputed T matrix.
+    T[i, j] = max(start_j - end_i, start_i - end_j) for i != j: negative if i and j overlap, otherwise the idle time between them.
+    Supports T[i, j] for scalars and (broadcast) index arrays, and pairs_below(), which finds all pairs with a small
+    time difference with a sweep over the intervals sorted by start time instead of a quadratic matrix.
+    '''
+
+    def __init__(self, act_start, act_end):
+        self.start = np.asarray(act_start)
+        self.end = np.asarray(act_end)
+        self.order = np.argsort(self.start, kind='stable')     # sorted interval index
+        self.sorted_start = self.start[self.order]
+        self.shape = (len(self.start), len(self.start))
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, key):
+        i, j = key
+        # the diagonal is 0, as in the T matrix sheets
+        return np.where(np.equal(i, j), 0, np.maximum(self.start[j] - self.end[i], self.start[i] - self.end[j]))
+
+    def pairs_below(self, bound):
+        '''All ordered pairs (i, j) with T[i, j] < bound, as arrays (i, j, T_ij) sorted by (i, j). The diagonal (T = 0)
+        is included if 0 < bound.'''
+        n = len(self.start)
+        # for the k-th interval in start order, only later intervals starting before its end + bound can qualify
+        ends = self.end[self.order]
+        first = np.arange(n) + 1
+        last = np.searchsorted(self.sorted_start, ends + bound, side='left')
+        counts = np.maximum(last - first, 0)
+        k = np.repeat(np.arange(n), counts)
+        m = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + k + 1
+        i = self.order[k]
+        j = self.order[m]
+        T_ij = self[i, j]
+        near = T_ij < bound
+        i, j, T_ij = i[near], j[near], T_ij[near]
+
+        # symmetric: add the other orientation (and the diagonal), then sort by (i, j)
+        diagonal = np.arange(n) if 0 < bound else np.arange(0)
+        i, j = np.concatenate([i, j, diagonal]), np.concatenate([j, i, diagonal])
+        T_ij = np.concatenate([T_ij, T_ij, np.zeros(len(diagonal), dtype=T_ij.dtype)])
+        order = np.lexsort((j, i))
+        return i[order], j[order], T_ij[order]
+
+def time_diff_pairs(T_timeDiff, bound):
+    '''All ordered pairs (i, j) of activity IDs with T[i, j] < bound, as arrays (i, j, T_ij) sorted by (i, j), including
+    the diagonal if it is below the bound. T_timeDiff is the dense T matrix (in activity ID order), an ActivityTimes or
+    a NearPairIndex built with at least this bound.
+    '''
+    if isinstance(T_timeDiff, (ActivityTimes, NearPairIndex)):
+        return T_timeDiff.pairs_below(bound)
+    T = np.asarray(T_timeDiff)
+    i, j = np.nonzero(T < bound)   # row-major, i.e. sorted by (i, j)
+    return i, j, T[i, j]
+
+class NearPairIndex:
+    '''For every activity, the activities that overlap it or are less than `bound` minutes apart (usually t_max), in
+    CSR form: the neighbours of activity i are neighbours[indptr[i]:indptr[i + 1]] (sorted), with their time
+    differences in time_diff. All other pairs have T >= bound, i.e. neither an overlap nor a buffer penalty, so the
+    weights, large_negative and the overlap checks of the Heuristic only need these pairs.
+    '''
+
+    def __init__(self, num_activities, act_i, act_j, time_diff, bound):
+        self.bound = bound
+        self.indptr = np.zeros(num_activities + 1, dtype=np.int64)
+        np.cumsum(np.bincount(act_i, minlength=num_activities), out=self.indptr[1:])
+        self.neighbours = np.asarray(act_j, dtype=np.int64)
+        self.time_diff = np.asarray(time_diff)
+        # overlapping activities (T < 0, excluding the activity itself) as plain lists, for the Python loops of the Heuristic
+        rows = np.repeat(np.arange(num_activities), np.diff(self.indptr))
+        overlap = (self.time_diff < 0) & (self.neighbours != rows)
+        self.overlapping = [[] for _ in range(num_activities)]
+        for i, j in zip(rows[overlap].tolist(), self.neighbours[overlap].tolist()):
+            self.overlapping[i].append(j)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def neighbours_of(self, i):
+        return self.neighbours[self.indptr[i]:self.indptr[i + 1]]
+
+    def update_rows(self, T_timeDiff, changed):
+        '''Recompute the pairs of the activities in changed (rows and columns) from T_timeDiff, after their times have
+        changed (T_timeDiff: dense T array or ActivityTimes). All other pairs are kept.'''
+        n = len(self)
+        is_changed = np.zeros(n, dtype=bool)
+        is_changed[changed] = True
+        rows = np.repeat(np.arange(n), np.diff(self.indptr))
+        keep = ~(is_changed[rows] | is_changed[self.neighbours])
+        act_i, act_j, time_diff = [rows[keep]], [self.neighbours[keep]], [self.time_diff[keep]]
+        others = np.arange(n)
+        for act in np.nonzero(is_changed)[0].tolist():
+            row = np.asarray(T_timeDiff[np.full(n, act), others])
+            near = row < self.bound
+            act_i.append(np.full(near.sum(), act)), act_j.append(others[near]), time_diff.append(row[near])
+            column = np.asarray(T_timeDiff[others, np.full(n, act)])
+            near = (column < self.bound) & ~is_changed      # pairs of two changed activities are in the rows
+            act_i.append(others[near]), act_j.append(np.full(near.sum(), act)), time_diff.append(column[near])
+        act_i, act_j, time_diff = np.concatenate(act_i), np.concatenate(act_j), np.concatenate(time_diff)
+        order = np.lexsort((act_j, act_i))
+        self.__init__(n, act_i[order], act_j[order], time_diff[order], self.bound)
+
+    def pairs_below(self, bound):
+        '''All listed pairs (i, j) with T[i, j] < bound (at most the bound of the index), as arrays (i, j, T_ij).'''
+        if bound > self.bound:
+            raise ValueError(f"NearPairIndex was built for time differences below {self.bound}, not {bound}")
+        act_i = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        below = self.time_diff < bound
+        return act_i[below], self.neighbours[below], self.time_diff[below]
+
+def build_near_pair_index(T_timeDiff, bound):
+    '''NearPairIndex of all activity pairs with T < bound (e.g. t_max), from the dense T matrix (activity ID order) or an
+    ActivityTimes (sweep over the intervals, without a quadratic matrix).
+    '''
+    act_i, act_j, T_ij = time_diff_pairs(T_timeDiff, bound)
+    return NearPairIndex(T_timeDiff.shape[0], act_i, act_j, T_ij, bound)
+
+def build_gate_compatibility(AC_size, Pref_Int, Max_Wingspan, Is_Int, Flight_No, Gate_No):
+    """ Flights x gates boolean matrix (rows in the order of Flight_No, columns in the order of Gate_No): the aircraft
+    fits the gate and the gate's international flag matches the flight, or the gate is remote/dummy (Is_Int == 2). """
+    size = AC_size.loc[Flight_No].to_numpy()[:, None]
+    pref_int = Pref_Int.loc[Flight_No].to_numpy()[:, None]
+    max_wingspan = Max_Wingspan.loc[Gate_No].to_numpy()[None, :]
+    is_int = Is_Int.loc[Gate_No].to_numpy()[None, :]
+    return (size <= max_wingspan) & ((pref_int / 10 == is_int) | (is_int == 2))
+
+def build_Mdict(AC_size, Pref_Int, Max_Wingspan, Is_Int, Flight_No, Gate_No, compatibility=None):
+    if compatibility is None:
+        compatibility = build_gate_compatibility(AC_size, Pref_Int, Max_Wingspan, Is_Int, Flight_No, Gate_No)
+    Mdict = {}
+    for f, flight in enumerate(Flight_No):
+        valid_gates = [Gate_No[g] for g in np.flatnonzero(compatibility[f])]
         # Mdict[flight] = valid_gates + ['Dum']  # Include dummy gate
         Mdict[flight] = valid_gates
     return Mdict
 
+def gate_neighbours(Gates_N, gate_list):
+    """ Boolean matrix of the gates in gate_list that are next to each other or the same gate (Gates_N = 1 or -1),
+    i.e. the gate pairs of the shadow constraints """
+    N = Gates_N.loc[gate_list, gate_list].to_numpy()
+    return (N == 1) | (N == -1)
+
+def build_ShadowConstraint_arrays(activities_to_flights, T_timeDiff, M_validGate, Gates_N, chunk_size=20000):
+    """ Constructs shadow constraints as index arrays (vectorized).
+
+    T_timeDiff is the T matrix (DataFrame), or an array/ActivityTimes in the order of activities_to_flights.
+    Returns (act1_idx, gate1_idx, act2_idx, gate2_idx, activities, gate_list): constraint s forbids assigning
+    activities[act1_idx[s]] to gate_list[gate1_idx[s]] while activities[act2_idx[s]] is at gate_list[gate2_idx[s]].
+    Constraints are ordered exactly as the nested loops of the original implementation produced them
+    (act1, act2, then gate1 and gate2 in the order of M_validGate).
+    """
+    activities = list(activities_to_flights.keys())
+    flights = list(M_validGate.keys())
+    flight_pos = {flight: f for f, flight in enumerate(flights)}
+    act_flight = np.array([flight_pos[activities_to_flights[act]] for act in activities], dtype=np.int64)
+
+    # "next-or-same gate" mask, computed once (dummy gate excluded)
+    gate_list = [gate for gate in Gates_N.index if gate != 'Dum']
+    gate_pos = {gate: g for g, gate in enumerate(gate_list)}
+    near_g1, near_g2 = np.nonzero(gate_neighbours(Gates_N, gate_list))
+
+    # per-flight valid gate mask, plus the position of each gate in M_validGate[flight] (needed to reproduce the order)
+    valid = np.zeros((len(flights), len(gate_list)), dtype=bool)
+    rank = np.zeros((len(flights), len(gate_list)), dtype=np.int64)
+    for flight in flights:
+        for r, gate in enumerate(M_validGate[flight]):
+            if gate in gate_pos:
+                valid[flight_pos[flight], gate_pos[gate]] = True
+                rank[flight_pos[flight], gate_pos[gate]] = r
+
+    # overlap mask: all ordered activity pairs with a negative time difference, sorted act1-major
+    if isinstance(T_timeDiff, pd.DataFrame):
+        T_timeDiff = T_timeDiff.loc[activities, activities].to_numpy()
+    over_a1, over_a2, _ = time_diff_pairs(T_timeDiff, 0)    # includes the diagonal where the T matrix has T < 0
+
+    # combine: (overlapping pair) x (next-or-same gate pair), kept if both gates are valid for the respective flights.
+    # Processed in chunks of activity pairs to bound the size of the boolean matrix.
+    parts = []
+    for start in range(0, len(over_a1), chunk_size):
+        a1 = over_a1[start:start + chunk_size]
+        a2 = over_a2[start:start + chunk_size]
+        f1 = act_flight[a1]
+        f2 = act_flight[a2]
+        mask = valid[f1][:, near_g1] & valid[f2][:, near_g2]
+        p, e = np.nonzero(mask)
+        g1 = near_g1[e]
+        g2 = near_g2[e]
+        order = np.lexsort((rank[f2[p], g2], rank[f1[p], g1], p))
+        parts.append((a1[p][order], g1[order], a2[p][order], g2[order]))
+
+    if parts:
+        act1_idx, gate1_idx, act2_idx, gate2_idx = (np.concatenate(arrays) for arrays in zip(*parts))
+    else:
+        act1_idx, gate1_idx, act2_idx, gate2_idx = (np.zeros(0, dtype=np.int64) for _ in range(4))
+
+    return act1_idx, gate1_idx, act2_idx, gate2_idx, activities, gate_list
+
 def build_ShadowConstraints(activities_to_flights, T_timeDiff, M_validGate, Gates_N):
     """ Constructs shadow constraints based on flight scheduling logic. """
-    # preprocessing: store information on neighbouring or identical gates. Reduces runtime by >90%
-    GatesAreNext = {}
-    GatesAreSame = {}
-    for gate_f1 in Gates_N.index:
-        for gate_f2 in Gates_N.columns:
-            GatesAreNext[(gate_f1, gate_f2)] = Gates_N.loc[gate_f1, gate_f2] == 1
-            GatesAreSame[(gate_f1, gate_f2)] = Gates_N.loc[gate_f1, gate_f2] == -1  # Check if they are the same gates
-
-    shadow_constraints = []
-    for act1 in activities_to_flights.keys():
-        for act2 in activities_to_flights.keys():
-            if T_timeDiff.loc[act1, act2] < 0:      # Check if activities overlaps
-                f1 = activities_to_flights[act1]    # Flight of act1
-                f2 = activities_to_flights[act2]    # Flight of act2
-                for gate1 in M_validGate[f1]:
-                    for gate2 in M_validGate[f2]:
-                        if (GatesAreNext[(gate1, gate2)] or GatesAreSame[(gate1, gate2)]) and (gate1 != 'Dum' and gate2 != 'Dum'):
-                            shadow_constraints.append((act1, gate1, act2, gate2))
-    return shadow_constraints
-
-def convert_sc_to_dicts(shadow_constraints):
-    '''Convert shadow constraint list into easier-to-access dictionaries.
+    return shadow_constraints_to_tuples(*build_ShadowConstraint_arrays(activities_to_flights, T_timeDiff, M_validGate, Gates_N))
+
+def shadow_constraints_to_tuples(act1_idx, gate1_idx, act2_idx, gate2_idx, activities, gate_list):
+    """ Converts the index arrays of build_ShadowConstraint_arrays into the list of (act1, gate1, act2, gate2) names. """
+    return [(activities[a1], gate_list[g1], activities[a2], gate_list[g2])
+            for a1, g1, a2, g2 in zip(act1_idx.tolist(), gate1_idx.tolist(), act2_idx.tolist(), gate2_idx.tolist())]
+
+class ShadowConstraintIndex:
+    '''Shadow constraints (a1, g1, a2, g2) with CSR indexes for both orientations: the partners (a2, g2) of an
+    (activity, gate) pair are pair_act/pair_gate[pair_ptr[k]:pair_ptr[k + 1]] with k = activity * num_gates + gate index,
+    and the constraints involving a gate (own activity, other activity, other gate) are found the same way via gate_ptr.
+    Gates are numbered from first_gate (num_activities for vertex IDs, 0 for the gate indices of the FGS model).
+    Iterating yields the constraints as tuples, in their original order.
     '''
-    sc_per_act_gate_pair = {}   # { ('act1', 'gate1'): [ ('actX', 'gateY'), ('actZ', 'gateA'), ...], ('act2', 'gate2'): [...], ... }
-    sc_per_gate = {}            # { 'gate1': [('act1', 'act2', 'gate1'), (...), ...], 'gate2': [...], ... }
-
-    for (a1, g1, a2, g2) in shadow_constraints:
-        # dictionary with keys = tuples of flight and gate
-        if (a1, g1) not in sc_per_act_gate_pair:
-            sc_per_act_gate_pair[(a1, g1)] = []
-        sc_per_act_gate_pair[(a1, g1)].append((a2, g2))
-        if (a2, g2) not in sc_per_act_gate_pair:
-            sc_per_act_gate_pair[(a2, g2)] = []
-        sc_per_act_gate_pair[(a2, g2)].append((a1, g1))
-
-        # dictionary with keys = gates
-        if g1 not in sc_per_gate:
-            sc_per_gate[g1] = []
-        sc_per_gate[g1].append((a1, a2, g2))
-        if g2 not in sc_per_gate:
-            sc_per_gate[g2] = []
-        sc_per_gate[g2].append((a2, a1, g1))
-
-    return sc_per_act_gate_pair, sc_per_gate
+
+    def __init__(self, constraints, num_activities, num_gates, first_gate):
+        self.constraints = np.asarray(constraints, dtype=np.int32).reshape(-1, 4)
+        self.num_activities = num_activities
+        self.num_gates = num_gates
+        self.first_gate = first_gate
+
+        # both orientations of every constraint
+        a1, g1, a2, g2 = (self.constraints[:, c].astype(np.int64) for c in range(4))
+        own_act, own_gate = np.concatenate([a1, a2]), np.concatenate([g1, g2]) - first_gate
+        other_act, other_gate = np.concatenate([a2, a1]), np.concatenate([g2, g1])
+
+        # by (activity, gate)
+        key = own_act * num_gates + own_gate
+        order = np.argsort(key, kind='stable')
+        self.pair_ptr = np.zeros(num_activities * num_gates + 1, dtype=np.int64)
+        np.cumsum(np.bincount(key, minlength=num_activities * num_gates), out=self.pair_ptr[1:])
+        self.pair_act = other_act[order].astype(np.int32)
+        self.pair_gate = other_gate[order].astype(np.int32)
+
+        # by gate
+        order = np.argsort(own_gate, kind='stable')
+        self.gate_ptr = np.zeros(num_gates + 1, dtype=np.int64)
+        np.cumsum(np.bincount(own_gate, minlength=num_gates), out=self.gate_ptr[1:])
+        self.gate_own_act = own_act[order].astype(np.int32)
+        self.gate_other_act = other_act[order].astype(np.int32)
+        self.gate_other_gate = other_gate[order].astype(np.int32)
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def __iter__(self):
+        return iter(map(tuple, self.constraints.tolist()))
+
+    def partners(self, activity, gate):
+        '''[(a2, g2), ...]: the pairs that may not be assigned together with activity at gate.'''
+        key = activity * self.num_gates + gate - self.first_gate
+        lo, hi = self.pair_ptr[key], self.pair_ptr[key + 1]
+        return list(zip(self.pair_act[lo:hi].tolist(), self.pair_gate[lo:hi].tolist()))
+
+    def gate_constraints(self, gate):
+        '''[(a1, a2, g2), ...]: the constraints forbidding a1 at gate together with a2 at g2.'''
+        lo, hi = self.gate_ptr[gate - self.first_gate], self.gate_ptr[gate - self.first_gate + 1]
+        return list(zip(self.gate_own_act[lo:hi].tolist(), self.gate_other_act[lo:hi].tolist(),
+                        self.gate_other_gate[lo:hi].tolist()))
+
+    def keys(self):
+        '''All (activity, gate) pairs that appear in at least one shadow constraint.'''
+        keys = np.nonzero(np.diff(self.pair_ptr))[0]
+        return list(zip((keys // self.num_gates).tolist(), (keys % self.num_gates + self.first_gate).tolist()))
 
 def mapGatesToIndices(Gates_N):
     '''Assign a unique index, starting from 1, to each gate. Used to create the weight matrix for the CPP.
@@ -208,14 +538,329 @@ def mapGatesToIndices(Gates_N):
 
     return gates_to_indices, indices_to_gates
 
-def createInputData(local_path, check_output, EstimatedOrReal):
-    flights, num_flights, gates, num_gates, T_timeDiff, Gates_N = import_data(local_path, EstimatedOrReal)
+def build_integer_ids(Flight_No, Gate_No, flights_to_activities, activities_to_flights, U_successor, compatibility,
+                      preference_matrix, gates_to_indices, T_timeDiff, act_start, act_end, sc_arrays):
+    '''Compact integer-indexed representation of the instance, used by the heuristics, the weight builder and the MIPs.
+    Vertex IDs are contiguous: activities get 0..A-1 (in the order of activities_to_flights), real gates get A..A+G-1
+    (in the order of gates_to_indices, i.e. without the dummy gate). Flights get 0..F-1 in the order of Flight_No.
+    Names are only needed to translate from/to the workbook (vertex_names, flight_names).
+    '''
+    activities = list(activities_to_flights.keys())
+    gates = list(gates_to_indices.keys())
+    num_activities = len(activities)
+    num_gates = len(gates)
+
+    vertex_names = activities + gates
+    vertex_ids = {name: vid for vid, name in enumerate(vertex_names)}
+    flight_ids = {flight: f for f, flight in enumerate(Flight_No)}
+
+    # activities
+    act_flight = np.array([flight_ids[activities_to_flights[act]] for act in activities], dtype=np.int32)
+    act_successor = np.array([vertex_ids[U_successor[act]] if U_successor[act] != 0 else NO_SUCCESSOR
+                              for act in activities], dtype=np.int32)
+    kinds = {'arr': ACT_ARR, 'par': ACT_PAR, 'dep': ACT_DEP}
+    act_kind = np.array([kinds[act[:3]] for act in activities], dtype=np.int8)
+    flight_activities = [[vertex_ids[act] for act in flights_to_activities[flight]] for flight in Flight_No]
+
+    # gates: remote stands are the ones whose name does not start with the pier number (1xx / 2xx)
+    gate_kind = np.array([GATE_CONTACT if str(gate)[0] in ('1', '2') else GATE_REMOTE for gate in gates], dtype=np.int8)
+
+    # flights x gates compatibility and preference matrices, restricted to the real gates (the dummy gate has no vertex)
+    gate_columns = [Gate_No.index(str(gate)) for gate in gates]
+    valid_gate_matrix = compatibility[:, gate_columns]
+    preference_matrix = preference_matrix[:, gate_columns]
+
+    # dict views: valid gates and preferences per flight, gates in the order of the gate sheet
+    gate_order = sorted(range(num_gates), key=lambda g: gate_columns[g])
+    valid_gates = []
+    preferences = []
+    for f in range(len(Flight_No)):
+        flight_gates = [g for g in gate_order if valid_gate_matrix[f, g]]
+        valid_gates.append({num_activities + g for g in flight_gates})
+        preferences.append({num_activities + g: int(preference_matrix[f, g]) for g in flight_gates})
+
+    # time differences, rows/columns in activity ID order: the T matrix of the workbook, or derived from the intervals
+    if T_timeDiff is not None:
+        time_diff = T_timeDiff.loc[activities, activities].to_numpy()
+    else:
+        time_diff = ActivityTimes(act_start, act_end)
+
+    # shadow constraints (a1, g1, a2, g2) as vertex IDs
+    act1_idx, gate1_idx, act2_idx, gate2_idx, sc_activities, sc_gates = sc_arrays
+    sc_act_ids = np.array([vertex_ids[act] for act in sc_activities], dtype=np.int32)
+    sc_gate_ids = np.array([vertex_ids[gate] for gate in sc_gates], dtype=np.int32)
+    shadow_constraints = np.column_stack([sc_act_ids[act1_idx], sc_gate_ids[gate1_idx],
+                                          sc_act_ids[act2_idx], sc_gate_ids[gate2_idx]]).astype(np.int32)
+
+    shadow_index = ShadowConstraintIndex(shadow_constraints, num_activities, num_gates, num_activities)
+
+    return {'num_activities': num_activities, 'num_gates': num_gates, 'num_flights': len(Flight_No),
+            'vertex_names': vertex_names, 'vertex_ids': vertex_ids, 'flight_names': list(Flight_No),
+            'act_flight': act_flight, 'act_successor': act_successor, 'act_kind': act_kind,
+            'flight_activities': flight_activities, 'gate_kind': gate_kind,
+            'valid_gate_matrix': valid_gate_matrix, 'preference_matrix': preference_matrix,
+            'valid_gates': valid_gates, 'preferences': preferences,
+            'time_diff': time_diff, 'act_start': act_start, 'act_end': act_end,
+            'shadow_constraints': shadow_constraints, 'shadow_index': shadow_index}
+
+def subset_integer_ids(int_data, flight_ids, gate_ids=None):
+    '''Integer-indexed sub-instance (same keys as build_integer_ids) of the given flights (with all their activities) and
+    gate vertex IDs (None: all gates). The sub-instance has its own contiguous IDs, in the order of the full instance,
+    so that the orientation of the T matrix is kept. Valid gates, preferences and shadow constraints are restricted to
+    the gates of the subset; shadow constraints with an activity outside the subset are dropped (the others are sorted).
+    The IDs of the full instance are kept in 'flight_ids', 'activity_ids' and 'gate_ids' (vertex IDs).
+    '''
+    num_activities = int_data['num_activities']
+    flight_ids = np.sort(np.asarray(flight_ids, dtype=np.int64))
+    activity_ids = np.sort(np.concatenate([np.asarray(int_data['flight_activities'][f], dtype=np.int64) for f in flight_ids]
+                                          + [np.arange(0)]))
+    if gate_ids is None:
+        gate_ids = np.arange(num_activities, num_activities + int_data['num_gates'])
+    gate_ids = np.sort(np.asarray(gate_ids, dtype=np.int64))
+    sub_activities, sub_gates = len(activity_ids), len(gate_ids)
+
+    # vertex and flight IDs of the full instance -> sub-instance (-1: not in the subset), looked up by bisection, so
+    # that the cost depends on the size of the subset (plus a logarithm), not on the size of the full instance
+    def local_ids(subset_ids, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(subset_ids):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        k = np.minimum(np.searchsorted(subset_ids, ids), len(subset_ids) - 1)
+        return np.where(subset_ids[k] == ids, k, -1)
+    vertex_ids = np.concatenate([activity_ids, gate_ids])     # sorted, activities before gates
+    def local_vertex(vertices):
+        return local_ids(vertex_ids, vertices)
+    gate_columns = gate_ids - num_activities
+
+    vertex_names = [int_data['vertex_names'][v] for v in vertex_ids.tolist()]
+    successor = int_data['act_successor'][activity_ids]
+    act_successor = np.where(successor >= 0, local_vertex(np.maximum(successor, 0)), NO_SUCCESSOR).astype(np.int32)
+
+    valid_gates = []
+    preferences = []
+    for f in flight_ids.tolist():
+        gates = sorted(int_data['valid_gates'][f])
+        local_gates = dict(zip(gates, local_vertex(gates).tolist()))
+        valid_gates.append({local_gates[g] for g in gates if local_gates[g] >= 0})
+        preferences.append({local_gates[g]: pref for g, pref in int_data['preferences'][f].items() if local_gates.get(g, -1) >= 0})
+
+    time_diff = int_data['time_diff']
+    if isinstance(time_diff, ActivityTimes):
+        time_diff = ActivityTimes(time_diff.start[activity_ids], time_diff.end[activity_ids])
+    else:
+        time_diff = np.asarray(time_diff)[np.ix_(activity_ids, activity_ids)]
+
+    # shadow constraints: the rows of the subset activities at the subset gates in the CSR index (both orientations of
+    # every constraint), kept if the other pair is in the subset as well
+    index = int_data['shadow_index']
+    keys = (activity_ids[:, None] * index.num_gates + (gate_ids - index.first_gate)[None, :]).ravel()
+    lo, hi = index.pair_ptr[keys], index.pair_ptr[keys + 1]
+    counts = hi - lo
+    row_offsets = np.cumsum(counts) - counts
+    entries = np.repeat(lo - row_offsets, counts) + np.arange(counts.sum())
+    shadow_constraints = np.stack([np.repeat(np.repeat(activity_ids, sub_gates), counts),
+                                   np.repeat(np.tile(gate_ids, sub_activities), counts),
+                                   index.pair_act[entries], index.pair_gate[entries]], axis=1)
+    shadow_constraints = local_vertex(shadow_constraints)
+    shadow_constraints = shadow_constraints[(shadow_constraints >= 0).all(axis=1)]
+    shadow_constraints = np.unique(shadow_constraints, axis=0).reshape(-1, 4).astype(np.int32)
+    shadow_index = ShadowConstraintIndex(shadow_constraints, sub_activities, sub_gates, sub_activities)
+
+    return {'num_activities': sub_activities, 'num_gates': sub_gates, 'num_flights': len(flight_ids),
+            'vertex_names': vertex_names, 'vertex_ids': {name: vid for vid, name in enumerate(vertex_names)},
+            'flight_names': [int_data['flight_names'][f] for f in flight_ids.tolist()],
+            'act_flight': local_ids(flight_ids, int_data['act_flight'][activity_ids]).astype(np.int32),
+            'act_successor': act_successor, 'act_kind': int_data['act_kind'][activity_ids],
+            'flight_activities': [local_vertex(int_data['flight_activities'][f]).tolist() for f in flight_ids.tolist()],
+            'gate_kind': int_data['gate_kind'][gate_columns],
+            'valid_gate_matrix': int_data['valid_gate_matrix'][np.ix_(flight_ids, gate_columns)],
+            'preference_matrix': int_data['preference_matrix'][np.ix_(flight_ids, gate_columns)],
+            'valid_gates': valid_gates, 'preferences': preferences,
+            'time_diff': time_diff, 'act_start': int_data['act_start'][activity_ids], 'act_end': int_data['act_end'][activity_ids],
+            'shadow_constraints': shadow_constraints, 'shadow_index': shadow_index,
+            'flight_ids': flight_ids, 'activity_ids': activity_ids, 'gate_ids': gate_ids}
+
+def update_shadow_constraints(int_data, changed, Gates_N):
+    '''Replace the shadow constraints of the activities in changed (after their times have changed) in int_data: the
+    overlapping activity pairs involving them (T < 0; the diagonal is 0) on neighbouring gates valid for both flights,
+    as in build_ShadowConstraint_arrays. All other constraints are kept; the index is rebuilt.
+    '''
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    is_changed = np.zeros(num_activities, dtype=bool)
+    is_changed[changed] = True
+    constraints = int_data['shadow_constraints']
+    constraints = constraints[~(is_changed[constraints[:, 0]] | is_changed[constraints[:, 2]])]
+
+    # overlapping pairs in the rows and columns of the changed activities
+    T = int_data['time_diff']
+    others = np.arange(num_activities)
+    act1, act2 = [], []
+    for act in np.nonzero(is_changed)[0].tolist():
+        overlap = np.nonzero(np.asarray(T[np.full(num_activities, act), others]) < 0)[0]
+        act1.append(np.full(len(overlap), act)), act2.append(overlap)
+        overlap = np.nonzero((np.asarray(T[others, np.full(num_activities, act)]) < 0) & ~is_changed)[0]
+        act1.append(overlap), act2.append(np.full(len(overlap), act))
+    act1, act2 = np.concatenate(act1 + [np.arange(0)]), np.concatenate(act2 + [np.arange(0)])
+
+    near_g1, near_g2 = np.nonzero(gate_neighbours(Gates_N, int_data['vertex_names'][num_activities:]))
+    valid = int_data['valid_gate_matrix']
+    f1, f2 = int_data['act_flight'][act1], int_data['act_flight'][act2]
+    p, e = np.nonzero(valid[f1][:, near_g1] & valid[f2][:, near_g2])
+    new_constraints = np.column_stack([act1[p], num_activities + near_g1[e], act2[p], num_activities + near_g2[e]])
+
+    int_data['shadow_constraints'] = np.concatenate([constraints, new_constraints.astype(np.int32)])
+    int_data['shadow_index'] = ShadowConstraintIndex(int_data['shadow_constraints'], num_activities, num_gates, num_activities)
+
+def update_flight_times(int_data, near_pairs, Gates_N, flight_times):
+    '''Apply new arrival and departure times {flight ID: (arrival, departure)} (minutes) to int_data and near_pairs in
+    place: the activity intervals (see flight_activity_intervals), the rows and columns of the changed activities in
+    the time differences, the near pairs and the shadow constraints. The time differences of the changed activities are
+    derived from the intervals, also if the others come from the T matrix of the workbook (with the diagonal 0, as in
+    the T matrix sheets and ActivityTimes). Returns the IDs of the changed activities.
+    '''
+    num_activities = int_data['num_activities']
+    act_start, act_end = int_data['act_start'].copy(), int_data['act_end'].copy()
+    changed = []
+    for flight, (arrival, departure) in flight_times.items():
+        activities = int_data['flight_activities'][flight]
+        intervals = flight_activity_intervals(arrival, departure, len(activities) == 3)
+        for act in activities:
+            act_start[act], act_end[act] = intervals[ACT_KIND_NAMES[int_data['act_kind'][act]]]
+            changed.append(act)
+    changed = np.array(sorted(changed), dtype=np.int64)
+    int_data['act_start'], int_data['act_end'] = act_start, act_end
+
+    derived = ActivityTimes(act_start, act_end)
+    if isinstance(int_data['time_diff'], ActivityTimes):
+        int_data['time_diff'] = derived
+    else:
+        T = int_data['time_diff']
+        if not T.flags.writeable:     # e.g. a view of the workbook DataFrame: copied once
+            T = int_data['time_diff'] = T.copy()
+        others = np.arange(num_activities)
+        for act in changed.tolist():
+            T[act, :] = derived[np.full(num_activities, act), others]
+            T[:, act] = derived[others, np.full(num_activities, act)]
+
+    near_pairs.update_rows(int_data['time_diff'], changed)
+    update_shadow_constraints(int_data, changed, Gates_N)
+    return changed
+
+def solution_to_names(solution, vertex_names):
+    '''Translate a solution {cluster: [vertex IDs]} back to vertex names (activities and gates).
+    '''
+    return {cluster_id: [vertex_names[vertex] for vertex in solution[cluster_id]] for cluster_id in solution}
+
+def workbook_hash(local_path):
+    '''SHA-256 of the workbook's contents. Any edit of the file leads to a new hash and thus to a new cache key.
+    '''
+    sha = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def cache_path(local_path, EstimatedOrReal, content_hash, cache_dir=CACHE_DIR):
+    '''Location of the cache file for a given workbook (content hash), mode (Estimated/Real), cache version and
+    pandas/NumPy versions.
+    '''
+    workbook_name = os.path.splitext(os.path.basename(local_path))[0].replace(' ', '_')
+    return os.path.join(cache_dir, f"{workbook_name}_{EstimatedOrReal}_{content_hash[:16]}_v{CACHE_VERSION}_{CACHE_LIBRARIES}.pkl")
+
+def load_cached_instance(local_path, EstimatedOrReal, content_hash, cache_dir=CACHE_DIR):
+    '''Return the cached instance data, or None if there is no valid cache entry for this workbook content and mode.
+    '''
+    path = cache_path(local_path, EstimatedOrReal, content_hash, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+    except Exception:
+        return None     # unreadable, truncated or written by an incompatible version: rebuild
+    # the file name already encodes the key, but double-check in case files were renamed or copied around
+    if (not isinstance(cached, dict) or 'data' not in cached or cached.get('hash') != content_hash
+            or cached.get('mode') != EstimatedOrReal or cached.get('version') != CACHE_VERSION
+            or cached.get('libraries') != CACHE_LIBRARIES):
+        return None
+    return cached['data']
+
+def store_cached_instance(local_path, EstimatedOrReal, content_hash, data, cache_dir=CACHE_DIR):
+    '''Write the derived instance to the cache and remove stale entries of the same workbook and mode.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(local_path, EstimatedOrReal, content_hash, cache_dir)
+
+    # entries of older workbook versions (or older cache or library versions) will never be hit again. The file name is
+    # matched up to the hash, so that e.g. the entries of a workbook "Brussels_Real" in mode Estimated are not taken
+    # for entries of "Brussels" in mode Real.
+    workbook_name = os.path.splitext(os.path.basename(local_path))[0].replace(' ', '_')
+    entry_pattern = re.compile(rf"{re.escape(workbook_name)}_{re.escape(EstimatedOrReal)}_[0-9a-f]{{16}}_v\d+_.+\.pkl(\.tmp)?")
+    for file_name in os.listdir(cache_dir):
+        if entry_pattern.fullmatch(file_name) and os.path.join(cache_dir, file_name) != path:
+            os.remove(os.path.join(cache_dir, file_name))
+
+    # write to a temporary file first, so that an interrupted run never leaves a corrupt cache entry behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'hash': content_hash, 'mode': EstimatedOrReal, 'version': CACHE_VERSION,
+                     'libraries': CACHE_LIBRARIES, 'data': data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def buildInputData(local_path, EstimatedOrReal, TimeSource="Workbook"):
+    '''Read the workbook and derive all model inputs from it (this is what the instance cache stores).
+    TimeSource "Workbook" uses the precomputed T matrix sheet, "Schedule" derives the time differences from the
+    ETA/ETD (RTA/RTD) columns instead (T_timeDiff is then None and int_data['time_diff'] an ActivityTimes).
+    '''
+    flights, num_flights, gates, num_gates, T_timeDiff, Gates_N = import_data(local_path, EstimatedOrReal, TimeSource == "Workbook")
     Flight_No, ETA, ETD, RTA, RTD, AC_size, Gate_No, Max_Wingspan, Is_Int, Is_LowCost, Is_Close = process_data(flights, gates)
     flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities = createActivitiesFromFlights_VBA(T_timeDiff, flights, EstimatedOrReal)
-    M_validGate = build_Mdict(flights['AC size (m)'], flights["Pref. Int"], gates['Max length (m)'], gates['International'], Flight_No, Gate_No)
-    P_preferences = build_preferences_dict(flights, gates['International'], gates['Low cost'], gates["Close"], Flight_No, M_validGate)
-    shadow_constraints = build_ShadowConstraints(activities_to_flights, T_timeDiff, M_validGate, Gates_N)
+    compatibility = build_gate_compatibility(flights['AC size (m)'], flights["Pref. Int"], gates['Max length (m)'], gates['International'], Flight_No, Gate_No)
+    preference_matrix = build_preference_matrix(flights, gates['International'], gates['Low cost'], gates["Close"], Flight_No, Gate_No)
+    M_validGate = build_Mdict(flights['AC size (m)'], flights["Pref. Int"], gates['Max length (m)'], gates['International'], Flight_No, Gate_No, compatibility)
+    P_preferences = build_preferences_dict(flights, gates['International'], gates['Low cost'], gates["Close"], Flight_No, Gate_No, M_validGate, preference_matrix)
+    act_start, act_end = build_activity_intervals(flights, flights_to_activities, activities_to_flights, EstimatedOrReal)
+    if T_timeDiff is not None:
+        sc_arrays = build_ShadowConstraint_arrays(activities_to_flights, T_timeDiff, M_validGate, Gates_N)
+    else:
+        sc_arrays = build_ShadowConstraint_arrays(activities_to_flights, ActivityTimes(act_start, act_end), M_validGate, Gates_N)
+    shadow_constraints = shadow_constraints_to_tuples(*sc_arrays)
     gates_to_indices, indices_to_gates = mapGatesToIndices(Gates_N)
+    int_data = build_integer_ids(Flight_No, Gate_No, flights_to_activities, activities_to_flights, U_successor,
+                                 compatibility, preference_matrix, gates_to_indices, T_timeDiff, act_start, act_end, sc_arrays)
+
+    return (flights, num_flights, gates, num_gates, T_timeDiff, Gates_N,
+            Flight_No, ETA, ETD, RTA, RTD, AC_size, Gate_No, Max_Wingspan, Is_Int, Is_LowCost, Is_Close,
+            P_preferences,
+            flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
+            M_validGate,
+            shadow_constraints,
+            gates_to_indices, indices_to_gates,
+            int_data)
+
+def createInputData(local_path, check_output, EstimatedOrReal, use_cache=True, cache_dir=CACHE_DIR, TimeSource="Workbook"):
+    '''Returns all model inputs for the given workbook. If use_cache is set, the derived data is stored on disk,
+    keyed by the workbook's content hash and the mode (Estimated/Real), so that repeated runs skip the Excel parsing.
+    TimeSource: "Workbook" (precomputed T matrix) or "Schedule" (time differences derived from the flight times).
+    '''
+    mode = EstimatedOrReal if TimeSource == "Workbook" else f"{EstimatedOrReal}-{TimeSource}"
+    data = None
+    if use_cache:
+        content_hash = workbook_hash(local_path)
+        data = load_cached_instance(local_path, mode, content_hash, cache_dir)
+    if data is None:
+        data = buildInputData(local_path, EstimatedOrReal, TimeSource)
+        if use_cache:
+            store_cached_instance(local_path, mode, content_hash, data, cache_dir)
+
+    (flights, num_flights, gates, num_gates, T_timeDiff, Gates_N,
+     Flight_No, ETA, ETD, RTA, RTD, AC_size, Gate_No, Max_Wingspan, Is_Int, Is_LowCost, Is_Close,
+     P_preferences,
+     flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
+     M_validGate,
+     shadow_constraints,
+     gates_to_indices, indices_to_gates,
+     int_data) = data
 
     # if desired: print some sample data from the resultss
     if check_output:
@@ -232,7 +877,7 @@ def createInputData(local_path, check_output, EstimatedOrReal):
 
         # Check a slice of the T matrix to ensure it's properly loaded
         print("\nSample of T matrix (T_timeDiff):")
-        print(T_timeDiff.iloc[:5, :5])
+        print(T_timeDiff.iloc[:5, :5] if T_timeDiff is not None else int_data['time_diff'][np.arange(5)[:, None], np.arange(5)])
 
         # Print details of the Gates Neighbours
         print("\nGates Neighbours Matrix Sample:")
@@ -267,7 +912,8 @@ def createInputData(local_path, check_output, EstimatedOrReal):
             flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
             M_validGate,
             shadow_constraints,
-            gates_to_indices, indices_to_gates)
+            gates_to_indices, indices_to_gates,
+            int_data)
 
 
 if __name__ == "__main__":
@@ -284,7 +930,8 @@ if __name__ == "__main__":
      flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
      M_validGate,
      shadow_constraints,
-     gates_to_indices, indices_to_gates) = createInputData(LOCAL_PATH, False, "Real")
+     gates_to_indices, indices_to_gates,
+     int_data) = createInputData(LOCAL_PATH, False, "Real")
 
 
 def simulatenous_flights():
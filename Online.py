@@ -0,0 +1,271 @@
+import numpy as np
+import time
+import json
+import bisect
+import Instance
+from Heuristic import NO_GATE, readable_score
+
+# Online assignment from a time-ordered stream of flight events, e.g. the lines appended to a file or the items put
+# into a queue.Queue. An event announces a flight or updates its times:
+#     {"time": <event time>, "flight": <flight number, as in Flight_No>, "arrival": <minutes>, "departure": <minutes>}
+# The master data of the flights (valid gates, preferences, towable or not) is taken from the integer-indexed instance
+# (Instance.build_integer_ids); the times only come from the events. The activity intervals follow
+# Instance.flight_activity_intervals, so the rules are those of TimeSource "Schedule":
+# - an activity can only be at a valid gate of its flight (M_validGate)
+# - activities that overlap in time cannot be at the same gate (large negative weight) or at neighbouring gates
+#   (shadow constraints, Gates_N)
+# - the value of an assignment is made of the weights of vertices_weights.get_weight_array: alpha1 * preference per
+#   activity, alpha2 per successor pair at the same gate (no tow), -alpha3 * buffer time deficit per pair at a gate
+
+def file_events(path, follow=False, poll_interval=0.1, idle_timeout=None):
+    '''Events from a file with one JSON event per line. With follow, the file is tailed (like tail -f): lines appended
+    later are read as they come, until a line {"end": true} or no new line for idle_timeout seconds (None: no limit).
+    '''
+    with open(path) as f:
+        buffer = ''
+        last_line_time = time.time()
+        while True:
+            line = f.readline()
+            if line:
+                buffer += line
+                if follow and not buffer.endswith('\n'):     # the rest of the line has not been written yet
+                    continue
+                text, buffer = buffer.strip(), ''
+                last_line_time = time.time()
+                if not text:
+                    continue
+                event = json.loads(text)
+                if event.get('end'):
+                    return
+                yield event
+            elif not follow:
+                if buffer.strip():
+                    yield json.loads(buffer)
+                return
+            elif idle_timeout is not None and time.time() - last_line_time > idle_timeout:
+                return
+            else:
+                time.sleep(poll_interval)
+
+def queue_events(event_queue):
+    '''Events from a queue.Queue (e.g. filled by another thread), until None is put into it.'''
+    while True:
+        event = event_queue.get()
+        if event is None:
+            return
+        yield event
+
+class OnlineGateAssigner:
+    """ Gate occupancy of the flights announced so far, updated one event at a time.
+    - timeline[gate]: (start, end, activity) of the activities at the gate, sorted by start time. The activities of a
+      gate never overlap, so their end times are sorted as well and every lookup is a bisection plus a short scan.
+    - gate_of[activity]: gate vertex of an announced activity, NO_GATE for the dummy gate
+    Each decision places the whole flight at its best feasible gate; a towable flight may also have its parking
+    activity at another gate (towed), among its tow_gates most preferred valid gates. If no placement is feasible, a
+    local search tries to move one blocking flight elsewhere. A decision takes at most about max_decision_time seconds:
+    after that, the best feasible placement found so far is taken. A flight whose times change keeps its gates if they
+    are still feasible. """
+
+    def __init__(self, int_data, Gates_N, alpha1, alpha2, alpha3, t_max, max_decision_time=0.005, tow_gates=5):
+        self.num_activities = num_activities = int_data['num_activities']
+        self.alpha1, self.alpha2, self.alpha3, self.t_max = alpha1, alpha2, alpha3, t_max
+        self.max_decision_time = max_decision_time
+        self.tow_gates = tow_gates
+        self.flight_ids = {name: f for f, name in enumerate(int_data['flight_names'])}
+        self.flight_activities = int_data['flight_activities']
+        self.act_flight = int_data['act_flight']
+        self.act_kind = int_data['act_kind']
+        self.act_successor = int_data['act_successor']
+        self.valid_gates = int_data['valid_gates']
+        self.preferences = int_data['preferences']
+
+        # gates whose occupancy conflicts with a gate: the gate itself and its neighbours
+        neighbours = Instance.gate_neighbours(Gates_N, int_data['vertex_names'][num_activities:])
+        self.conflict_gates = {num_activities + g: sorted({num_activities + g} | {num_activities + other for other in np.nonzero(neighbours[g])[0].tolist()})
+                               for g in range(int_data['num_gates'])}
+        self.timeline = {gate: [] for gate in self.conflict_gates}
+        self.gate_of = {}
+        self.interval = {}
+
+    def activities_near(self, gate, start, end, margin):
+        """ activities at the gate less than margin minutes apart from [start, end) (T < margin; margin 0: overlapping) """
+        timeline = self.timeline[gate]
+        k = bisect.bisect_left(timeline, (end + margin,))
+        near = []
+        while k > 0 and timeline[k - 1][1] > start - margin:
+            k -= 1
+            near.append(timeline[k])
+        return near
+
+    def is_feasible(self, flight, placement):
+        """ placement {activity: gate} of a flight that is not on the timelines. The activities of the flight must not
+        overlap each other (nor end before they start), as the timelines rely on it. """
+        intervals = sorted(self.interval[act] for act in placement)
+        for k, (start, end) in enumerate(intervals):
+            if start > end or (k > 0 and intervals[k - 1][1] > start):
+                return False
+        for act, gate in placement.items():
+            if gate not in self.valid_gates[flight]:
+                return False
+            start, end = self.interval[act]
+            for conflict_gate in self.conflict_gates[gate]:
+                if self.activities_near(conflict_gate, start, end, 0):
+                    return False
+        return True
+
+    def placement_value(self, flight, placement):
+        value = 0
+        for act, gate in placement.items():
+            value += self.alpha1 * self.preferences[flight][gate]
+            successor = self.act_successor[act]
+            if successor >= 0 and placement[successor] == gate:
+                value += self.alpha2
+            start, end = self.interval[act]
+            for (other_start, other_end, other) in self.activities_near(gate, start, end, self.t_max):
+                value -= self.alpha3 * (self.t_max - max(other_start - end, start - other_end))
+        return value
+
+    def candidate_placements(self, flight):
+        """ the whole flight at each valid gate, then (towable flights) the parking activity at another gate, most
+        preferred gates first """
+        activities = self.flight_activities[flight]
+        gates = sorted(self.valid_gates[flight], key=lambda gate: (-self.preferences[flight][gate], gate))
+        for gate in gates:
+            yield {act: gate for act in activities}
+        if len(activities) == 3:    # towable: parking at another gate
+            parking = next(act for act in activities if self.act_kind[act] == Instance.ACT_PAR)
+            tow_gates = gates[:self.tow_gates]
+            for gate in tow_gates:
+                for parking_gate in tow_gates:
+                    if parking_gate != gate:
+                        placement = {act: gate for act in activities}
+                        placement[parking] = parking_gate
+                        yield placement
+
+    def best_placement(self, flight, deadline=None):
+        """ best feasible placement (None if there is none); after the deadline (time.perf_counter()), the best one
+        found so far """
+        best_value, best = None, None
+        for placement in self.candidate_placements(flight):
+            if best is not None and deadline is not None and time.perf_counter() > deadline:
+                break
+            if self.is_feasible(flight, placement):
+                value = self.placement_value(flight, placement)
+                if best_value is None or value > best_value:
+                    best_value, best = value, placement
+        return best
+
+    def place(self, flight, placement):
+        for act in self.flight_activities[flight]:
+            gate = placement[act] if placement is not None else NO_GATE
+            self.gate_of[act] = gate
+            if gate != NO_GATE:
+                start, end = self.interval[act]
+                bisect.insort(self.timeline[gate], (start, end, act))
+
+    def remove(self, flight):
+        """ takes a flight off the timelines, returns its placement (None if it was at the dummy gate) """
+        placement = {}
+        for act in self.flight_activities[flight]:
+            gate = self.gate_of.pop(act)
+            if gate != NO_GATE:
+                start, end = self.interval[act]
+                self.timeline[gate].remove((start, end, act))
+            placement[act] = gate
+        return placement if NO_GATE not in placement.values() else None
+
+    def blocking_flights(self, flight, gate):
+        """ flights with an activity that conflicts with the flight at the gate """
+        blocking = set()
+        for act in self.flight_activities[flight]:
+            start, end = self.interval[act]
+            for conflict_gate in self.conflict_gates[gate]:
+                for (_, _, other) in self.activities_near(conflict_gate, start, end, 0):
+                    blocking.add(self.act_flight[other])
+        return blocking
+
+    def assign(self, flight, previous=None):
+        """ places a flight that is not on the timelines: at its previous placement if it is still feasible, otherwise at
+        its best feasible placement, otherwise by moving one blocking flight (until the decision deadline), otherwise at
+        the dummy gate. Returns the outcome ('kept', 'assigned', 'relocated' or 'unassigned'). """
+        deadline = time.perf_counter() + self.max_decision_time
+        if previous is not None and self.is_feasible(flight, previous):
+            self.place(flight, previous)
+            return 'kept'
+        best = self.best_placement(flight, deadline)
+        if best is not None:
+            self.place(flight, best)
+            return 'assigned'
+
+        # local search: move a single blocking flight, most preferred gates first
+        for gate in sorted(self.valid_gates[flight], key=lambda gate: -self.preferences[flight][gate]):
+            if time.perf_counter() > deadline:
+                break
+            blocking = self.blocking_flights(flight, gate)
+            if len(blocking) != 1:
+                continue
+            other = blocking.pop()
+            other_placement = self.remove(other)
+            placement = {act: gate for act in self.flight_activities[flight]}
+            if self.is_feasible(flight, placement):
+                self.place(flight, placement)
+                other_best = self.best_placement(other, deadline)
+                if other_best is not None:
+                    self.place(other, other_best)
+                    return 'relocated'
+                self.remove(flight)
+            self.place(other, other_placement)
+        self.place(flight, None)
+        return 'unassigned'
+
+    def process(self, event):
+        """ handles an announcement or time update, returns the outcome (None for an unknown flight or invalid times,
+        which leave the assignment unchanged) """
+        flight = self.flight_ids.get(event['flight'])
+        if flight is None:
+            return None
+        activities = self.flight_activities[flight]
+        try:
+            intervals = Instance.flight_activity_intervals(event['arrival'], event['departure'], len(activities) == 3)
+        except ValueError:
+            return None
+        previous = self.remove(flight) if activities[0] in self.gate_of else None
+        for act in activities:
+            self.interval[act] = intervals[Instance.ACT_KIND_NAMES[self.act_kind[act]]]
+        return self.assign(flight, previous)
+
+    def to_solution(self):
+        """ the current assignment as a solution {cluster ID: vertex IDs} (see Heuristic): one cluster per gate, one per
+        flight at the dummy gate; activities that have not been announced are not included """
+        solution = {}
+        for gate, timeline in self.timeline.items():
+            solution[len(solution)] = [gate] + [act for (_, _, act) in timeline]
+        for flight, activities in enumerate(self.flight_activities):
+            if activities and self.gate_of.get(activities[0], None) == NO_GATE:
+                solution[len(solution)] = list(activities)
+        return solution
+
+def run_online_assignment(events, assigner):
+    """ Feeds the events to the assigner and reports the throughput (events per second of decision time) and the
+    decision latencies (median, p99, maximum). Returns a dictionary of statistics. """
+    t1 = time.time()
+    latencies = []
+    outcomes = {}
+    for event in events:
+        start = time.perf_counter()
+        outcome = assigner.process(event)
+        latencies.append(time.perf_counter() - start)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    latencies = np.array(latencies) * 1000
+    busy_time = latencies.sum() / 1000
+    stats = {'events': len(latencies), 'outcomes': outcomes, 'runtime': time.time() - t1,
+             'throughput': len(latencies) / busy_time if busy_time > 0 else float('inf'),
+             'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+             'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+             'max_ms': float(latencies.max()) if len(latencies) else 0.0,
+             'unassigned_activities': sum(1 for gate in assigner.gate_of.values() if gate == NO_GATE)}
+    print(f"Processed {stats['events']} events in {stats['runtime']:.2f} seconds: {readable_score(round(stats['throughput']))} "
+          f"events/s, decision latency p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms. "
+          f"Outcomes: {outcomes}, {stats['unassigned_activities']} unassigned activities.")
+    return stats
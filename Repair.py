@@ -0,0 +1,104 @@
+import numpy as np
+import time
+import Instance
+import vertices_weights as vw
+import Heuristic
+from Heuristic import NO_GATE
+import Decomposition
+
+# Incremental re-optimization of an existing assignment after flight time changes (e.g. RTA/RTD updates during the
+# day), without rebuilding the instance: only the rows of the changed activities in the time differences, weights,
+# near pairs and shadow constraints are updated, and the assignment is repaired around the changed flights.
+# Vertex IDs are the ones of Instance.build_integer_ids; solutions are dictionaries {cluster ID: vertex IDs}.
+
+def release_infeasible_flights(state, flights, M_validGate, activities_to_flights, flights_to_activities, bitsets,
+                               num_activities):
+    """ Moves each of the flights whose activities are no longer feasible in their clusters (Heuristic.is_move_feasible_new)
+    to an empty cluster (the dummy gate). Needs one empty cluster. Returns the state and the released flights. """
+    released = []
+    for flight in flights:
+        activities = list(flights_to_activities[flight])
+        origin = {act: state.cluster_of[act] for act in activities}
+        holding_cluster_id = state.empty_cluster()
+        for act in activities:
+            state.move(act, holding_cluster_id)
+        feasible = True
+        for act in activities:
+            if state.gate[origin[act]] != NO_GATE and not Heuristic.is_move_feasible_new(
+                    act, state, origin[act], bitsets, M_validGate, activities_to_flights, num_activities):
+                feasible = False
+                break
+            state.move(act, origin[act])
+        if not feasible:
+            Heuristic.move_flight_to_empty_cluster(state, activities)
+            released.append(flight)
+    return state, released
+
+def repair_assignment(solution, flight_times, int_data, weights, near_pairs, Gates_N, alpha2, alpha3, t_max,
+                      large_negative):
+    """ Repairs an assignment after the arrival/departure times of some flights have changed.
+    flight_times: {flight ID: (arrival, departure)} in minutes. int_data, weights (array of get_weight_array) and
+    near_pairs are updated in place (Instance.update_flight_times, vertices_weights.update_weight_rows); large_negative
+    is kept. Then:
+    1. changed flights that are no longer feasible at their gates are moved to the dummy gate
+    2. the changed flights are moved to their best feasible gate, if better than their placement (reinsert_flights)
+    3. refine_clusters moves only the activities at the affected gates (the gates of the changed flights, before and
+       after) or at the dummy gate, in the time window of the changed flights (before and after, extended by t_max)
+    All other activities keep their gates.
+    Returns the new solution, its score and the reassigned activities [(activity, old gate, new gate), ...]
+    (gates are NO_GATE for the dummy gate). """
+    t1 = time.time()
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    flights_to_activities = int_data['flight_activities']
+    changed_flights = sorted(flight_times)
+
+    state = Heuristic.ClusterState(num_activities, num_activities + num_gates, len(solution) + len(changed_flights) + 1)
+    for cluster_id in solution:
+        for vertex in solution[cluster_id]:
+            state.add(vertex, cluster_id)
+    old_gate = [state.gate[state.cluster_of[act]] for act in range(num_activities)]
+
+    # time window and gates affected by the changes: before ...
+    changed_activities = [act for flight in changed_flights for act in flights_to_activities[flight]]
+    window_start = min(int_data['act_start'][changed_activities])
+    window_end = max(int_data['act_end'][changed_activities])
+    affected_gates = {old_gate[act] for act in changed_activities}
+
+    # update the instance
+    changed = Instance.update_flight_times(int_data, near_pairs, Gates_N, flight_times)
+    vw.update_weight_rows(weights, changed, int_data['time_diff'], int_data['act_successor'], alpha2, alpha3, t_max,
+                          large_negative)
+    bitsets = Heuristic.FeasibilityBitsets(num_activities, int_data['shadow_index'], int_data['act_flight'],
+                                           flights_to_activities, near_pairs)
+
+    # 1. + 2. release and reinsert the changed flights
+    state, released = release_infeasible_flights(state, changed_flights, int_data['valid_gates'], int_data['act_flight'],
+                                                 flights_to_activities, bitsets, num_activities)
+    state, num_moved = Decomposition.reinsert_flights(state, changed_flights, weights, large_negative, int_data['valid_gates'],
+                                                      int_data['act_flight'], flights_to_activities, bitsets,
+                                                      int_data['act_start'], num_activities)
+
+    # ... and after
+    window_start = min(window_start, min(int_data['act_start'][changed_activities])) - t_max
+    window_end = max(window_end, max(int_data['act_end'][changed_activities])) + t_max
+    affected_gates |= {state.gate[state.cluster_of[act]] for act in changed_activities}
+
+    # 3. local refinement
+    act_start, act_end = int_data['act_start'], int_data['act_end']
+    local_activities = [act for act in range(num_activities)
+                        if act_end[act] > window_start and act_start[act] < window_end
+                        and state.gate[state.cluster_of[act]] in affected_gates | {NO_GATE}]
+    state = Heuristic.refine_clusters(state, num_activities, num_gates, weights, int_data['shadow_index'],
+                                      flights_to_activities, int_data['act_flight'], int_data['act_kind'], large_negative,
+                                      int_data['valid_gates'], near_pairs, bitsets=bitsets, vertices=local_activities)
+
+    reassigned = [(act, old_gate[act], state.gate[state.cluster_of[act]]) for act in range(num_activities)
+                  if state.gate[state.cluster_of[act]] != old_gate[act]]
+    solution = state.to_solution()
+    score, _, no_unassigned_activities = Heuristic.calculate_total_score(solution, weights, large_negative, num_activities)
+    print(f"Repaired the assignment after {len(changed_flights)} flight time changes: {len(released)} flights released, "
+          f"{num_moved} moved, {len(local_activities)} activities refined locally, {len(reassigned)} activities reassigned. "
+          f"Value {Heuristic.readable_score(score)}, {no_unassigned_activities} unassigned activities. "
+          f"Runtime: {time.time() - t1} seconds.")
+
+    return solution, score, reassigned
@@ -4,8 +4,14 @@ import vertices_weights as vw
 import CPP_MIP as cpp
 import FGS_MIP as fgs
 import Heuristic
+import Decomposition
+import Online
 
-def main(local_path, EstimatedOrReal):
+def report_progress(elapsed, best_score, no_unassigned_activities):
+    print(f"[{elapsed:.1f} s] New best solution: {Heuristic.readable_score(best_score)}, {no_unassigned_activities} unassigned activities")
+
+def main(local_path, EstimatedOrReal, TimeSource="Workbook", num_starts=1, num_processes=None, time_limit=None,
+         window_length=None, window_overlap=120, spatial_solver=None):
     # 0. define all relevant model parameters
     # Parameters based on experiences
     alpha1 = 10  # Preference scaling factor
@@ -20,14 +26,25 @@ def main(local_path, EstimatedOrReal):
      flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
      M_validGate,
      shadow_constraints,
-     gates_to_indices, indices_to_gates) = Instance.createInputData(local_path, False, EstimatedOrReal)
-
-    large_negative = vw.calculate_large_negative(activities_to_flights, num_activities, no_towable_flights, T_timeDiff, P_preferences, M_validGate, alpha1, alpha2, alpha3, t_max)
+     gates_to_indices, indices_to_gates,
+     int_data) = Instance.createInputData(local_path, False, EstimatedOrReal, TimeSource=TimeSource)
+
+    # From here on, all vertices are integer IDs (see Instance.build_integer_ids). Names are only used for the output.
+    vertex_names = int_data['vertex_names']
+    # activity pairs closer than t_max (all others neither overlap nor get a buffer penalty)
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], t_max)
+    large_negative = vw.calculate_large_negative(int_data['num_activities'], no_towable_flights, int_data['time_diff'], alpha1, alpha2, alpha3, t_max,
+                                                 near_pairs)
     # large_negative = -20000
-    weights = vw.get_weight_matrix(num_activities, activities_to_flights, T_timeDiff, P_preferences, U_successor, M_validGate, alpha1, alpha2, alpha3,
-                      t_max, large_negative, gates_to_indices, indices_to_gates)
-
-    # Note: the keys of the dictionary 'weights' are exactly the names of all vertices present in the graph!
+    # the rolling windows build the weights of each window, the (A+G) x (A+G) array of the full instance is not needed
+    weights = None
+    if spatial_solver is not None or window_length is None:
+        weights = vw.get_weight_array(int_data['num_activities'], int_data['num_gates'], int_data['act_flight'], int_data['time_diff'],
+                                      int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                                      alpha1, alpha2, alpha3, t_max, large_negative, near_pairs)
+    shadow_index = int_data['shadow_index']
+
+    # Note: the rows/columns of the array 'weights' are exactly the IDs of all vertices present in the graph!
     print("large_negative:", large_negative)
     # print("weights:", weights)
 
@@ -38,7 +55,7 @@ def main(local_path, EstimatedOrReal):
 
     # CPP Model
     # start_time = time.time()
-    # cpp_solution = cpp.build_cpp_model(weights, shadow_constraints)
+    # cpp_solution = cpp.build_cpp_model(vw.WeightMatrix(weights), shadow_index, vertex_names)
     # cpp_duration = time.time() - start_time
     # performance_records['CPP'] = {'duration': cpp_duration, 'solution': cpp_solution}
 
@@ -46,16 +63,38 @@ def main(local_path, EstimatedOrReal):
     # todo: adjust it so it works without 'vertices' list
 
     # Iterative Refinement Heuristic Model
-    sc_per_act_gate_pair, sc_per_gate = Instance.convert_sc_to_dicts(shadow_constraints)
-
     start_time = time.time()
     print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~\nStarting standard heuristic.\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-    iterative_refinement_solution, iterative_refinement_score = (
-        Heuristic.iterative_refinement_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences,
-                                                         shadow_constraints, num_flights,
-                                                         activities_to_flights, gates_to_indices, flights_to_activities,
-                                                         large_negative,
-                                                         sc_per_act_gate_pair, sc_per_gate))
+    if spatial_solver is not None:
+        # gate groups (components of Gates_N) solved in parallel processes with "Heuristic" or "FGS", then coordinated
+        iterative_refinement_solution, iterative_refinement_score, group_stats = (
+            Decomposition.spatial_gate_optimization(int_data, Gates_N, weights, near_pairs, alpha1, alpha2, alpha3, t_max,
+                                                    large_negative, num_processes, spatial_solver, time_limit))
+    elif window_length is not None:
+        # rolling time windows of window_length minutes, each solved as a sub-instance and stitched together
+        iterative_refinement_solution, iterative_refinement_score, window_stats = (
+            Decomposition.rolling_window_gate_optimization(int_data, near_pairs, alpha1, alpha2, alpha3, t_max, large_negative,
+                                                           window_length, window_overlap, time_limit=time_limit))
+    elif num_starts > 1:
+        # independent seeded runs in a process pool, keeping the best solution
+        iterative_refinement_solution, iterative_refinement_score, start_stats = (
+            Heuristic.multi_start_gate_optimization(num_starts, num_processes, int_data['num_activities'], int_data['num_gates'], weights,
+                                                    int_data['act_successor'], int_data['valid_gates'], int_data['preferences'],
+                                                    shadow_index, num_flights,
+                                                    int_data['act_flight'], int_data['act_kind'], int_data['flight_activities'],
+                                                    large_negative,
+                                                    int_data['gate_kind'], near_pairs, time_limit=time_limit,
+                                                    act_start=int_data['act_start']))
+    else:
+        iterative_refinement_solution, iterative_refinement_score = (
+            Heuristic.iterative_refinement_gate_optimization(int_data['num_activities'], int_data['num_gates'], weights,
+                                                             int_data['act_successor'], int_data['valid_gates'], int_data['preferences'],
+                                                             shadow_index, num_flights,
+                                                             int_data['act_flight'], int_data['act_kind'], int_data['flight_activities'],
+                                                             large_negative,
+                                                             int_data['gate_kind'], near_pairs, time_limit=time_limit,
+                                                             progress_callback=report_progress, act_start=int_data['act_start']))
+    iterative_refinement_solution = Instance.solution_to_names(iterative_refinement_solution, vertex_names)
     iterative_refinement_duration = time.time() - start_time
     performance_records['Iterative Refinement Heuristic'] = {'duration': iterative_refinement_duration,
                                                              'solution': iterative_refinement_solution}
@@ -63,14 +102,14 @@ def main(local_path, EstimatedOrReal):
 
     # # 2-opt Integrated Heuristic Model
     # start_time = time.time()
-    # integrated_solution = Heuristic.integrated_2opt_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences, activities_to_flights, gates_to_indices)
+    # integrated_solution, integrated_score = Heuristic.integrated_2opt_gate_optimization(int_data['num_activities'], int_data['num_gates'], weights, int_data['act_successor'], int_data['valid_gates'], int_data['preferences'], shadow_index, num_flights, int_data['act_flight'], int_data['act_kind'], int_data['flight_activities'], large_negative, near_pairs, act_start=int_data['act_start'])
     # integrated_duration = time.time() - start_time
     # performance_records['Integrated 2-opt Heuristic'] = {'duration': integrated_duration,
     #                                                      'solution': integrated_solution}
     #
     # # Pre-optimized 2-opt Gate Assignment Model
     # start_time = time.time()
-    # pre_optimized_solution = Heuristic.pre_optimized_2opt_gate_optimization(num_activities, num_gates, weights, U_successor, M_validGate, P_preferences, activities_to_flights, gates_to_indices)
+    # pre_optimized_solution, pre_optimized_score = Heuristic.pre_optimized_2opt_gate_optimization(int_data['num_activities'], int_data['num_gates'], weights, int_data['act_successor'], int_data['valid_gates'], int_data['preferences'], shadow_index, num_flights, int_data['act_flight'], int_data['act_kind'], int_data['flight_activities'], large_negative, near_pairs, act_start=int_data['act_start'])
     # pre_optimized_duration = time.time() - start_time
     # performance_records['Pre-optimized 2-opt'] = {'duration': pre_optimized_duration, 'solution': pre_optimized_solution}
 
@@ -78,6 +117,21 @@ def main(local_path, EstimatedOrReal):
     # for model, record in performance_records.items():
     #     print(f"{model} took {record['duration']} seconds and produced solution {record['solution']}")
 
+def main_online(local_path, EstimatedOrReal, event_path, follow=False, max_decision_time=0.005):
+    # Online mode: flights are assigned one event at a time from a JSON lines file of flight announcements and time
+    # updates (see Online.py), tailed if follow is True. The master data of the flights comes from the workbook.
+    alpha1 = 10  # Preference scaling factor
+    alpha2 = 3  # Reward for avoiding tows
+    alpha3 = 100  # Penalty scaling factor for buffer time deficits
+    t_max = 30
+
+    results = Instance.createInputData(local_path, False, EstimatedOrReal, TimeSource="Schedule")
+    Gates_N, int_data = results[5], results[-1]
+    assigner = Online.OnlineGateAssigner(int_data, Gates_N, alpha1, alpha2, alpha3, t_max, max_decision_time)
+    print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~\nStarting online assignment.\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+    stats = Online.run_online_assignment(Online.file_events(event_path, follow=follow), assigner)
+    return Instance.solution_to_names(assigner.to_solution(), int_data['vertex_names']), stats
+
 # Configurations for data import
 LOCAL_PATH_TingYing = '/Users/chentingying/Documents/tum/AS_Operation_Management/Brussels.xlsm'
 LOCAL_PATH_Arthur = '/Users/arthurdebelle/Desktop/TUM/SoSe 2024/Ad.S - OM/Project/CODING/Airports data/Brussels (EBBR)/Brussels.xlsm'
@@ -88,7 +142,18 @@ LOCAL_PATH = LOCAL_PATH_Arthur
 if __name__ == "__main__":
     EstimatedOrReal = "Estimated"
     # EstimatedOrReal = "Real"
-    main(LOCAL_PATH, EstimatedOrReal)
+    TimeSource = "Workbook"     # precomputed T matrix sheet
+    # TimeSource = "Schedule"   # time differences derived from the flight times
+    num_starts = 1              # > 1: independent runs in parallel processes, the best one is kept
+    time_limit = None           # seconds, None: no time limit
+    window_length = None        # minutes, e.g. 24 * 60: rolling time-window decomposition (for multi-day schedules)
+    spatial_solver = None       # "Heuristic" or "FGS": gate groups solved in parallel processes
+    event_path = None           # JSON lines file of flight events: online assignment instead of the day at once
+    if event_path is not None:
+        main_online(LOCAL_PATH, EstimatedOrReal, event_path)
+    else:
+        main(LOCAL_PATH, EstimatedOrReal, TimeSource, num_starts, time_limit=time_limit, window_length=window_length,
+             spatial_solver=spatial_solver)
 
 
 
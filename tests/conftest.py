@@ -0,0 +1,128 @@
+import datetime
+import os
+import random
+import sys
+
+import openpyxl
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Heuristic
+import Instance
+from Heuristic import NO_GATE
+
+# Small synthetic workbooks in the layout of the Brussels workbook (same sheets, header rows and columns), so that the
+# tests run the whole import path (Instance.createInputData) without the real data.
+
+GATES = ['120', '122', '124', '126', '140L', '140R', '142', '150', 'T1', 'T2', 'T3', 'Dum']
+BASE_TIME = datetime.datetime(2024, 6, 1, 5, 0)
+
+def write_workbook(path, num_flights=30, seed=1, flight_overrides=None):
+    """ Writes a workbook with num_flights random flights. flight_overrides {flight number: {column: value}} replaces
+    columns of single flights (e.g. 'AC size (m)', 'ETD' or 'Turnaround est'). The T matrix sheets are derived from the ETA/ETD (RTA/RTD)
+    columns with the intervals of Instance.flight_activity_intervals, with a diagonal of 0 as in the real sheets. """
+    rnd = random.Random(seed)
+    flight_overrides = flight_overrides or {}
+    workbook = openpyxl.Workbook()
+
+    sheet = workbook.active
+    sheet.title = 'EBBR - Flights'
+    header = [f'c{k}' for k in range(48)]
+    for k, name in enumerate(['Flight', 'ETA', 'ETD', 'RTA', 'RTD', 'AC size (m)', 'Pref. Int', 'Pref. EU (normal)',
+                              'Pref. EU (low cost)', 'Pref. Close']):
+        header[k] = name
+    header[36], header[47] = 'Turnaround est', 'Turnaround real'
+    sheet.append(['Flights'])
+    sheet.append(header)
+    flights = []
+    for flight in range(1, num_flights + 1):
+        row = [None] * 48
+        stay = rnd.choice([45, 60, 90, 180, 300])
+        eta = BASE_TIME + datetime.timedelta(minutes=rnd.randrange(0, 600, 5))
+        rta = eta + datetime.timedelta(minutes=rnd.choice([0, 0, 10, -5, 25]))
+        pref_normal, pref_low_cost = rnd.choice([(10, 0), (0, 10), (0, 0)])
+        row[:10] = [flight, eta, eta + datetime.timedelta(minutes=stay), rta,
+                    rta + datetime.timedelta(minutes=stay + rnd.choice([0, 15])), rnd.choice([30, 36, 45, 60, 65]),
+                    rnd.choice([0, 0, 10]), pref_normal, pref_low_cost, rnd.choice([0, 5, 10])]
+        row[36] = 'No' if stay >= 180 else 'Yes'     # towable (arrival, parking, departure)
+        row[47] = 'No' if (row[4] - row[3]).total_seconds() / 60 >= 180 else 'Yes'
+        for column, value in flight_overrides.get(flight, {}).items():
+            row[header.index(column)] = value
+        sheet.append(row)
+        flights.append(row)
+
+    sheet = workbook.create_sheet('EBBR - Gates (data)')
+    sheet.append(['Gate', 'Max length (m)', 'International', 'Low cost', 'Close', 'x', 'y'])
+    for gate in GATES:
+        if gate == 'Dum' or gate.startswith('T'):
+            sheet.append([gate, 1000 if gate == 'Dum' else 80, 2, 2, 2, 0, 0])
+        else:
+            sheet.append([gate, rnd.choice([40, 50, 70]), rnd.choice([0, 1]), rnd.choice([0, 1]), rnd.choice([0, 1]), 0, 0])
+
+    for sheet_name, arrival_column, departure_column, turnaround_column in [('EBBR - Tmatrix (estimated)', 1, 2, 36),
+                                                                          ('EBBR - Tmatrix (real)', 3, 4, 47)]:
+        activities, start, end = [], [], []
+        for row in flights:
+            arrival = round((row[arrival_column] - BASE_TIME).total_seconds() / 60) + 5 * 60
+            departure = round((row[departure_column] - BASE_TIME).total_seconds() / 60) + 5 * 60
+            intervals = Instance.flight_activity_intervals(arrival, departure, row[turnaround_column] == 'No')
+            for kind in ['arr', 'dep', 'par']:
+                if kind in intervals:
+                    activities.append(f"{kind}_{row[0]}")
+                    start.append(intervals[kind][0])
+                    end.append(intervals[kind][1])
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(['Activity'] + activities)
+        for i, activity in enumerate(activities):
+            sheet.append([activity] + [0 if i == j else max(start[j] - end[i], start[i] - end[j]) for j in range(len(activities))])
+
+    sheet = workbook.create_sheet('EBBR - Gates (next)')
+    sheet.append(['Gate'] + GATES)
+    at_pier = [not gate.startswith('T') and gate != 'Dum' for gate in GATES]    # neighbours along the pier
+    for i, gate in enumerate(GATES):
+        sheet.append([gate] + [-1 if i == j else int(abs(i - j) == 1 and at_pier[i] and at_pier[j]) for j in range(len(GATES))])
+    workbook.save(path)
+    return path
+
+def gate_assignment(solution, int_data):
+    """ gate vertex of every activity (NO_GATE: dummy gate); checks that every vertex is in exactly one cluster """
+    num_activities = int_data['num_activities']
+    vertices = sorted(vertex for cluster in solution.values() for vertex in cluster)
+    assert vertices == list(range(num_activities + int_data['num_gates']))
+    gate_of = [NO_GATE] * num_activities
+    for cluster in solution.values():
+        gates = [vertex for vertex in cluster if not Heuristic.vertex_is_act(vertex, num_activities)]
+        assert len(gates) <= 1
+        for act in cluster:
+            if gates and Heuristic.vertex_is_act(act, num_activities):
+                gate_of[act] = gates[0]
+    return gate_of
+
+def assert_feasible(gate_of, int_data):
+    """ checks a gate assignment (see gate_assignment) against the valid gates, overlaps and shadow constraints """
+    for act, gate in enumerate(gate_of):
+        if gate != NO_GATE:
+            assert gate in int_data['valid_gates'][int_data['act_flight'][act]]
+    T = int_data['time_diff']
+    for i in range(len(gate_of)):
+        for j in range(i):
+            if gate_of[i] != NO_GATE and gate_of[i] == gate_of[j]:
+                assert T[i, j] >= 0 and T[j, i] >= 0
+    for (a1, g1, a2, g2) in int_data['shadow_index']:
+        assert not (gate_of[a1] == g1 and gate_of[a2] == g2)
+
+@pytest.fixture(scope='session')
+def workbook_path(tmp_path_factory):
+    return write_workbook(str(tmp_path_factory.mktemp('workbook') / 'Test.xlsx'))
+
+@pytest.fixture
+def load_instance(workbook_path, tmp_path):
+    """ load_instance(EstimatedOrReal, TimeSource, **workbook options): createInputData of the default test workbook,
+    or of a new one if workbook options (see write_workbook) are given """
+    def load(EstimatedOrReal='Estimated', TimeSource='Workbook', **workbook_options):
+        path = workbook_path
+        if workbook_options:
+            path = write_workbook(str(tmp_path / f'Test_{len(os.listdir(tmp_path))}.xlsx'), **workbook_options)
+        return Instance.createInputData(path, False, EstimatedOrReal, use_cache=False, TimeSource=TimeSource)
+    return load
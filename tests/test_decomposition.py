@@ -0,0 +1,44 @@
+import pytest
+
+import Decomposition
+import Heuristic
+import Instance
+import vertices_weights as vw
+from Heuristic import NO_GATE
+from conftest import gate_assignment, assert_feasible
+
+ALPHA1, ALPHA2, ALPHA3, T_MAX = 10, 3, 100, 30
+
+def prepare(int_data):
+    num_activities = int_data['num_activities']
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    large_negative = vw.calculate_large_negative(num_activities, 10, int_data['time_diff'], ALPHA1, ALPHA2, ALPHA3, T_MAX,
+                                                 near_pairs)
+    weights = vw.get_weight_array(num_activities, int_data['num_gates'], int_data['act_flight'], int_data['time_diff'],
+                                  int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                                  ALPHA1, ALPHA2, ALPHA3, T_MAX, large_negative, near_pairs)
+    return near_pairs, large_negative, weights
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_rolling_windows(load_instance, TimeSource):
+    int_data = load_instance(TimeSource=TimeSource)[-1]
+    near_pairs, large_negative, weights = prepare(int_data)
+    solution, score, window_stats = Decomposition.rolling_window_gate_optimization(
+        int_data, near_pairs, ALPHA1, ALPHA2, ALPHA3, T_MAX, large_negative, 240, 60)
+    assert len(window_stats) > 1
+    assert_feasible(gate_assignment(solution, int_data), int_data)
+    assert score == Heuristic.calculate_total_score(solution, weights, large_negative, int_data['num_activities'])[0]
+
+def test_spatial_with_gateless_flight(load_instance):
+    # flight 3 fits at no gate
+    data = load_instance(flight_overrides={3: {'AC size (m)': 5000}})
+    Gates_N, int_data = data[5], data[-1]
+    flight = int_data['flight_names'].index(3)
+    assert not int_data['valid_gates'][flight]
+    near_pairs, large_negative, weights = prepare(int_data)
+    solution, score, group_stats = Decomposition.spatial_gate_optimization(
+        int_data, Gates_N, weights, near_pairs, ALPHA1, ALPHA2, ALPHA3, T_MAX, large_negative, num_processes=2)
+    gate_of = gate_assignment(solution, int_data)
+    assert_feasible(gate_of, int_data)
+    assert all(gate_of[act] == NO_GATE for act in int_data['flight_activities'][flight])
+    assert score == Heuristic.calculate_total_score(solution, weights, large_negative, int_data['num_activities'])[0]
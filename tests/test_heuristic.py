@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+import Heuristic
+import Instance
+import vertices_weights as vw
+from Heuristic import ClusterState, ScoreTracker, NO_GATE, NO_CLUSTER
+
+ALPHA1, ALPHA2, ALPHA3, T_MAX = 10, 3, 100, 30
+
+@pytest.fixture
+def instance(load_instance):
+    int_data = load_instance()[-1]
+    num_activities = int_data['num_activities']
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    large_negative = vw.calculate_large_negative(num_activities, 10, int_data['time_diff'], ALPHA1, ALPHA2, ALPHA3, T_MAX,
+                                                 near_pairs)
+    weights = vw.get_weight_array(num_activities, int_data['num_gates'], int_data['act_flight'], int_data['time_diff'],
+                                  int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                                  ALPHA1, ALPHA2, ALPHA3, T_MAX, large_negative, near_pairs)
+    return int_data, weights, large_negative
+
+def random_state(int_data, rnd):
+    """ one cluster per gate, the activities spread over the gate clusters and a few clusters without gate """
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    state = ClusterState(num_activities, num_activities + num_gates, num_activities + num_gates + 1)
+    for g in range(num_gates):
+        state.add(num_activities + g, g)
+    for act in range(num_activities):
+        state.add(act, rnd.randrange(num_gates + 5))
+    return state
+
+def full_score(state, weights, large_negative, num_activities):
+    return Heuristic.calculate_total_score(state.to_solution(), weights, large_negative, num_activities)
+
+def test_score_tracker_move_deltas(instance):
+    int_data, weights, large_negative = instance
+    num_activities, num_vertices = int_data['num_activities'], int_data['num_activities'] + int_data['num_gates']
+    rnd = random.Random(3)
+    state = random_state(int_data, rnd)
+    tracker = ScoreTracker(state, weights, large_negative, num_activities)
+    for _ in range(300):
+        vertex = rnd.randrange(num_vertices)
+        from_cluster_id = state.cluster_of[vertex]
+        to_cluster_id = state.empty_cluster() if rnd.random() < 0.1 else rnd.randrange(len(state))
+        if to_cluster_id == from_cluster_id or (not Heuristic.vertex_is_act(vertex, num_activities) and state.gate[to_cluster_id] != NO_GATE):
+            continue
+        _, excl_before, unassigned_before = full_score(state, weights, large_negative, num_activities)
+        move_delta = tracker.move_delta(vertex, from_cluster_id, to_cluster_id)
+        unassigned_delta = tracker.unassigned_delta(vertex, from_cluster_id, to_cluster_id)
+        state.move(vertex, to_cluster_id)
+        tracker.move(vertex, from_cluster_id, to_cluster_id)
+        _, excl_after, unassigned_after = full_score(state, weights, large_negative, num_activities)
+        assert move_delta == excl_after - excl_before
+        assert unassigned_delta == unassigned_after - unassigned_before
+        tracker.verify(state.to_solution())
+
+def test_score_tracker_swap_deltas(instance):
+    int_data, weights, large_negative = instance
+    num_activities = int_data['num_activities']
+    rnd = random.Random(4)
+    state = random_state(int_data, rnd)
+    tracker = ScoreTracker(state, weights, large_negative, num_activities)
+    for _ in range(300):
+        vertex_a, vertex_b = rnd.sample(range(num_activities), 2)
+        cluster_a_id, cluster_b_id = state.cluster_of[vertex_a], state.cluster_of[vertex_b]
+        if cluster_a_id == cluster_b_id:
+            continue
+        _, excl_before, _ = full_score(state, weights, large_negative, num_activities)
+        swap_delta = tracker.swap_delta(vertex_a, cluster_a_id, vertex_b, cluster_b_id)
+        for vertex, from_cluster_id, to_cluster_id in [(vertex_a, cluster_a_id, cluster_b_id), (vertex_b, cluster_b_id, cluster_a_id)]:
+            state.move(vertex, to_cluster_id)
+            tracker.move(vertex, from_cluster_id, to_cluster_id)
+        _, excl_after, _ = full_score(state, weights, large_negative, num_activities)
+        assert swap_delta == excl_after - excl_before
+        tracker.verify(state.to_solution())
+
+def test_cluster_state_bookkeeping():
+    num_activities, num_gates = 4, 2
+    state = ClusterState(num_activities, num_activities + num_gates, 5)
+    assert state.empty_cluster() == 0
+    state.add(4, 0)         # gate
+    state.add(0, 0)
+    state.add(1, 1)
+    state.add(2, 1)
+    assert state.gate[0] == 4 and state.gate[1] == NO_GATE
+    assert state.gateless == {1}
+    assert state.occupancy[0] == 0b1 and state.occupancy[1] == 0b110
+    assert state.empty_cluster() == 2
+    with pytest.raises(Exception):
+        state.add(4, 0)
+
+    copied = state.copy()
+    state.add(5, 1)         # gate into the gateless cluster
+    assert state.gateless == set() and copied.gateless == {1}
+    assert list(state[1]) == [1, 2, 5]
+
+    state.move(0, 1)
+    assert state.cluster_of[0] == 1 and list(state[1]) == [1, 2, 5, 0]
+    assert state.occupancy[0] == 0 and state.occupancy[1] == 0b111
+    assert state.remove(4) == 0
+    assert state.cluster_of[4] == NO_CLUSTER and state.gate[0] == NO_GATE
+    assert state.empty_cluster() == 0 and 0 not in state.gateless
+
+    state.move(5, 3)
+    assert state.gateless == {1} and state.gate[3] == 5
+    state.add(3, 0)
+    assert state.empty_cluster() == 2
+    assert state.to_solution() == {0: [3], 1: [1, 2, 0], 2: [], 3: [5], 4: []}
+    assert ClusterState.from_solution(state.to_solution(), num_activities, num_activities + num_gates).to_solution() == state.to_solution()
+
+def run_arguments(int_data, weights, large_negative):
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    return (int_data['num_activities'], int_data['num_gates'], weights, int_data['act_successor'], int_data['valid_gates'],
+            int_data['preferences'], int_data['shadow_index'], len(int_data['flight_activities']), int_data['act_flight'],
+            int_data['act_kind'], int_data['flight_activities'], large_negative, int_data['gate_kind'], near_pairs)
+
+def test_multi_start_is_reproducible(instance):
+    int_data, weights, large_negative = instance
+    arguments = run_arguments(int_data, weights, large_negative)
+    runs = [Heuristic.multi_start_gate_optimization(3, 2, *arguments, base_seed=7, act_start=int_data['act_start'])
+            for _ in range(2)]
+    assert runs[0][:2] == runs[1][:2]
+    assert [stats['score'] for stats in runs[0][2]] == [stats['score'] for stats in runs[1][2]]
+    assert [stats['seed'] for stats in runs[0][2]] == [7, 8, 9]
+
+    # start 0 is the single run
+    random.seed(7)
+    solution, score = Heuristic.iterative_refinement_gate_optimization(*arguments, act_start=int_data['act_start'])
+    assert runs[0][2][0]['score'] == score
+    single_start = Heuristic.multi_start_gate_optimization(1, 1, *arguments, base_seed=7, act_start=int_data['act_start'])
+    assert single_start[:2] == (solution, score)
@@ -0,0 +1,101 @@
+import datetime
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Instance
+from conftest import BASE_TIME
+
+def assert_flight_intervals_disjoint(intervals):
+    ordered = sorted(intervals.values())
+    for start, end in ordered:
+        assert start <= end
+    for (_, end), (next_start, _) in zip(ordered, ordered[1:]):
+        assert end <= next_start
+
+@pytest.mark.parametrize('stay', [0, 1, 15, 30, 39, 40, 41, 120])
+def test_short_towable_stay(stay):
+    intervals = Instance.flight_activity_intervals(600, 600 + stay, True)
+    assert_flight_intervals_disjoint(intervals)
+    assert intervals['arr'][0] == 600 and intervals['dep'][1] == 600 + stay
+    assert intervals['arr'][1] == intervals['par'][0] and intervals['par'][1] == intervals['dep'][0]
+    if stay >= Instance.ARRIVAL_DURATION + Instance.DEPARTURE_DURATION:
+        assert intervals['arr'][1] - intervals['arr'][0] == Instance.ARRIVAL_DURATION
+        assert intervals['dep'][1] - intervals['dep'][0] == Instance.DEPARTURE_DURATION
+
+def test_departure_before_arrival():
+    with pytest.raises(ValueError):
+        Instance.flight_activity_intervals(600, 590, False)
+    with pytest.raises(ValueError):
+        Instance.flight_activity_intervals(600, 590, True)
+
+def test_short_towable_stay_in_schedule_instance(load_instance):
+    # flight 1 stays 30 minutes but is towable (arrival, parking, departure)
+    eta = BASE_TIME + datetime.timedelta(minutes=60)
+    overrides = {1: {'ETA': eta, 'ETD': eta + datetime.timedelta(minutes=30), 'Turnaround est': 'No'}}
+    int_data = load_instance(TimeSource='Schedule', flight_overrides=overrides)[-1]
+    flight = int_data['flight_names'].index(1)
+    activities = list(int_data['flight_activities'][flight])
+    assert len(activities) == 3
+    assert np.all(int_data['act_start'] <= int_data['act_end'])
+    time_diff = int_data['time_diff']
+    for i in activities:
+        for j in activities:
+            if i != j:
+                assert time_diff[i, j] >= 0     # the activities of a flight never overlap
+
+def test_times_of_day_over_midnight():
+    flights = pd.DataFrame({'ETA': [datetime.time(23, 0), datetime.time(8, 0)],
+                            'ETD': [datetime.time(1, 0), datetime.time(9, 0)]}, index=[1, 2])
+    flights_to_activities = {1: ['arr_1', 'dep_1', 'par_1'], 2: ['arr_2', 'dep_2']}
+    activities_to_flights = {'arr_1': 1, 'dep_1': 1, 'par_1': 1, 'arr_2': 2, 'dep_2': 2}
+    act_start, act_end = Instance.build_activity_intervals(flights, flights_to_activities, activities_to_flights, 'Estimated')
+    assert act_start.tolist() == [23 * 60, 25 * 60 - Instance.DEPARTURE_DURATION, 23 * 60 + Instance.ARRIVAL_DURATION, 8 * 60, 8 * 60 + 30]
+    assert act_end.tolist() == [23 * 60 + Instance.ARRIVAL_DURATION, 25 * 60, 25 * 60 - Instance.DEPARTURE_DURATION, 8 * 60 + 30, 9 * 60]
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_subset_shadow_constraints(load_instance, TimeSource):
+    int_data = load_instance(TimeSource=TimeSource)[-1]
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    rnd = np.random.default_rng(5)
+    for gate_ids in [None, num_activities + np.sort(rnd.choice(num_gates, 6, replace=False))]:
+        flight_ids = np.sort(rnd.choice(int_data['num_flights'], 12, replace=False))
+        sub = Instance.subset_integer_ids(int_data, flight_ids, gate_ids)
+
+        # expected: all constraints of the full instance with both pairs in the subset
+        vertex_ids = np.concatenate([sub['activity_ids'], sub['gate_ids']])
+        local_vertex = np.full(num_activities + num_gates, -1)
+        local_vertex[vertex_ids] = np.arange(len(vertex_ids))
+        expected = local_vertex[int_data['shadow_constraints']]
+        expected = np.unique(expected[(expected >= 0).all(axis=1)], axis=0)
+        assert len(expected)
+        assert np.array_equal(sub['shadow_constraints'], expected)
+        assert sub['act_flight'].tolist() == [flight_ids.tolist().index(f) for f in int_data['act_flight'][sub['activity_ids']]]
+        for local_flight, flight in enumerate(flight_ids.tolist()):
+            assert {vertex_ids[g] for g in sub['valid_gates'][local_flight]} == int_data['valid_gates'][flight] & set(vertex_ids.tolist())
+
+def test_cache_keeps_entries_of_other_workbooks(tmp_path):
+    cache_dir = str(tmp_path)
+    hash_a, hash_b = '0123456789abcdef' * 4, 'fedcba9876543210' * 4
+    Instance.store_cached_instance('Brussels_Real.xlsx', 'Estimated', hash_a, 'a', cache_dir)
+    Instance.store_cached_instance('Brussels.xlsx', 'Real', hash_a, 'b', cache_dir)
+    assert Instance.load_cached_instance('Brussels_Real.xlsx', 'Estimated', hash_a, cache_dir) == 'a'
+    assert Instance.load_cached_instance('Brussels.xlsx', 'Real', hash_a, cache_dir) == 'b'
+
+    # a new version of a workbook replaces only its own entry
+    Instance.store_cached_instance('Brussels.xlsx', 'Real', hash_b, 'c', cache_dir)
+    assert Instance.load_cached_instance('Brussels.xlsx', 'Real', hash_a, cache_dir) is None
+    assert Instance.load_cached_instance('Brussels.xlsx', 'Real', hash_b, cache_dir) == 'c'
+    assert Instance.load_cached_instance('Brussels_Real.xlsx', 'Estimated', hash_a, cache_dir) == 'a'
+    assert len(os.listdir(cache_dir)) == 2
+
+@pytest.mark.parametrize('content', [b'', b'\x80\x05\x95 truncated', pickle.dumps(['not', 'a', 'dict']),
+                                     pickle.dumps({'data': 1}), pickle.dumps(object)])
+def test_broken_cache_entry_is_a_miss(tmp_path, content):
+    content_hash = '0123456789abcdef' * 4
+    with open(Instance.cache_path('Test.xlsx', 'Estimated', content_hash, str(tmp_path)), 'wb') as f:
+        f.write(content)
+    assert Instance.load_cached_instance('Test.xlsx', 'Estimated', content_hash, str(tmp_path)) is None
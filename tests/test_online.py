@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+import Online
+from conftest import gate_assignment, assert_feasible
+
+ALPHA1, ALPHA2, ALPHA3, T_MAX = 10, 3, 100, 30
+
+@pytest.fixture
+def schedule(load_instance):
+    data = load_instance(TimeSource='Schedule')
+    return data[5], data[-1]
+
+def flight_events(int_data):
+    events = []
+    for flight, activities in enumerate(int_data['flight_activities']):
+        events.append({'time': int(int_data['act_start'][activities].min()) - 60, 'flight': int_data['flight_names'][flight],
+                       'arrival': int(int_data['act_start'][activities].min()),
+                       'departure': int(int_data['act_end'][activities].max())})
+    return sorted(events, key=lambda event: event['time'])
+
+def assert_timelines_sorted(assigner):
+    for timeline in assigner.timeline.values():
+        assert timeline == sorted(timeline)
+        assert [end for (_, end, _) in timeline] == sorted(end for (_, end, _) in timeline)
+        for (start, end, _) in timeline:
+            assert start <= end
+
+def test_online_assignment_is_feasible(schedule):
+    Gates_N, int_data = schedule
+    assigner = Online.OnlineGateAssigner(int_data, Gates_N, ALPHA1, ALPHA2, ALPHA3, T_MAX)
+    stats = Online.run_online_assignment(flight_events(int_data), assigner)
+    assert stats['events'] == int_data['num_flights']
+    assert_timelines_sorted(assigner)
+    assert_feasible(gate_assignment(assigner.to_solution(), int_data), int_data)
+
+def test_short_towable_and_invalid_events(schedule):
+    Gates_N, int_data = schedule
+    assigner = Online.OnlineGateAssigner(int_data, Gates_N, ALPHA1, ALPHA2, ALPHA3, T_MAX)
+    for event in flight_events(int_data):
+        assigner.process(event)
+    flight = next(f for f, activities in enumerate(int_data['flight_activities']) if len(activities) == 3)
+    name = int_data['flight_names'][flight]
+    gates = [assigner.gate_of[act] for act in int_data['flight_activities'][flight]]
+
+    # departure before arrival: ignored
+    assert assigner.process({'time': 0, 'flight': name, 'arrival': 700, 'departure': 650}) is None
+    assert [assigner.gate_of[act] for act in int_data['flight_activities'][flight]] == gates
+
+    # a towable flight staying 30 minutes
+    assert assigner.process({'time': 0, 'flight': name, 'arrival': 700, 'departure': 730}) is not None
+    for act in int_data['flight_activities'][flight]:
+        start, end = assigner.interval[act]
+        assert 700 <= start <= end <= 730
+    assert_timelines_sorted(assigner)
+
+def test_own_activities_must_not_overlap(schedule):
+    Gates_N, int_data = schedule
+    assigner = Online.OnlineGateAssigner(int_data, Gates_N, ALPHA1, ALPHA2, ALPHA3, T_MAX)
+    flight = next(f for f, activities in enumerate(int_data['flight_activities']) if len(activities) == 3)
+    activities = int_data['flight_activities'][flight]
+    gate = min(int_data['valid_gates'][flight])
+    placement = {act: gate for act in activities}
+    for act, interval in zip(activities, [(600, 640), (620, 660), (640, 700)]):
+        assigner.interval[act] = interval
+    assert not assigner.is_feasible(flight, placement)
+    for act, interval in zip(activities, [(600, 620), (650, 640), (620, 650)]):
+        assigner.interval[act] = interval
+    assert not assigner.is_feasible(flight, placement)
+    for act, interval in zip(activities, [(600, 620), (680, 700), (620, 680)]):
+        assigner.interval[act] = interval
+    assert assigner.is_feasible(flight, placement)
+
+def test_bounded_placement(schedule):
+    Gates_N, int_data = schedule
+    assigner = Online.OnlineGateAssigner(int_data, Gates_N, ALPHA1, ALPHA2, ALPHA3, T_MAX, tow_gates=2)
+    flight = max((f for f, activities in enumerate(int_data['flight_activities']) if len(activities) == 3),
+                 key=lambda f: len(int_data['valid_gates'][f]))
+    num_gates = len(int_data['valid_gates'][flight])
+    assert num_gates > 2
+    for act, interval in zip(int_data['flight_activities'][flight], [(600, 620), (680, 700), (620, 680)]):
+        assigner.interval[act] = interval
+    # the tows only use the 2 most preferred gates
+    assert len(list(assigner.candidate_placements(flight))) == num_gates + 2
+    # after the deadline, the first feasible placement is taken: the whole flight at its most preferred gate
+    best_gate = max(int_data['valid_gates'][flight], key=lambda gate: (int_data['preferences'][flight][gate], -gate))
+    placement = assigner.best_placement(flight, deadline=time.perf_counter() - 1)
+    assert placement == {act: best_gate for act in int_data['flight_activities'][flight]}
@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import Heuristic
+import Instance
+import Repair
+import vertices_weights as vw
+from conftest import BASE_TIME, gate_assignment, assert_feasible
+
+ALPHA1, ALPHA2, ALPHA3, T_MAX = 10, 3, 100, 30
+LARGE_NEGATIVE = -20000
+
+def new_flight_times(int_data):
+    """ {flight ID: (arrival, departure)}: a few flights arrive later and stay longer or shorter """
+    flight_times = {}
+    for flight, (delay, stay_change) in {2: (25, 40), 7: (-10, -5), 11: (60, 0)}.items():
+        activities = int_data['flight_activities'][flight]
+        arrival, departure = int_data['act_start'][activities].min().item(), int_data['act_end'][activities].max().item()
+        flight_times[flight] = (arrival + delay, departure + delay + stay_change)
+    return flight_times
+
+def workbook_overrides(int_data, flight_times):
+    """ the same times as ETA/ETD overrides of write_workbook (the T matrix sheets count minutes from midnight) """
+    return {int_data['flight_names'][flight]: {'ETA': BASE_TIME + datetime.timedelta(minutes=arrival - 5 * 60),
+                                               'ETD': BASE_TIME + datetime.timedelta(minutes=departure - 5 * 60)}
+            for flight, (arrival, departure) in flight_times.items()}
+
+def weight_array(int_data, near_pairs):
+    return vw.get_weight_array(int_data['num_activities'], int_data['num_gates'], int_data['act_flight'], int_data['time_diff'],
+                               int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                               ALPHA1, ALPHA2, ALPHA3, T_MAX, LARGE_NEGATIVE, near_pairs)
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_update_matches_rebuild(load_instance, TimeSource):
+    data = load_instance(TimeSource=TimeSource)
+    Gates_N, int_data = data[5], data[-1]
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    weights = weight_array(int_data, near_pairs)
+    flight_times = new_flight_times(int_data)
+    rebuilt = load_instance(TimeSource=TimeSource, flight_overrides=workbook_overrides(int_data, flight_times))[-1]
+
+    changed = Instance.update_flight_times(int_data, near_pairs, Gates_N, flight_times)
+    vw.update_weight_rows(weights, changed, int_data['time_diff'], int_data['act_successor'], ALPHA2, ALPHA3, T_MAX,
+                          LARGE_NEGATIVE)
+    rebuilt_near_pairs = Instance.build_near_pair_index(rebuilt['time_diff'], T_MAX)
+
+    assert int_data['vertex_names'] == rebuilt['vertex_names']
+    assert np.array_equal(int_data['act_start'], rebuilt['act_start']) and np.array_equal(int_data['act_end'], rebuilt['act_end'])
+    A = int_data['num_activities']
+    everything = np.arange(A)
+    assert np.array_equal(int_data['time_diff'][everything[:, None], everything[None, :]],
+                          rebuilt['time_diff'][everything[:, None], everything[None, :]])
+    assert np.array_equal(near_pairs.indptr, rebuilt_near_pairs.indptr)
+    assert np.array_equal(near_pairs.neighbours, rebuilt_near_pairs.neighbours)
+    assert np.array_equal(near_pairs.time_diff, rebuilt_near_pairs.time_diff)
+    assert np.array_equal(np.unique(int_data['shadow_constraints'], axis=0), np.unique(rebuilt['shadow_constraints'], axis=0))
+    assert len(int_data['shadow_constraints']) == len(rebuilt['shadow_constraints'])
+    assert np.array_equal(weights, weight_array(rebuilt, rebuilt_near_pairs))
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_repair_matches_rebuild(load_instance, TimeSource):
+    data = load_instance(TimeSource=TimeSource)
+    Gates_N, int_data = data[5], data[-1]
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    weights = weight_array(int_data, near_pairs)
+    solution, _ = Heuristic.iterative_refinement_gate_optimization(
+        int_data['num_activities'], int_data['num_gates'], weights, int_data['act_successor'], int_data['valid_gates'],
+        int_data['preferences'], int_data['shadow_index'], int_data['num_flights'], int_data['act_flight'],
+        int_data['act_kind'], int_data['flight_activities'], LARGE_NEGATIVE, int_data['gate_kind'], near_pairs,
+        act_start=int_data['act_start'])
+    flight_times = new_flight_times(int_data)
+    rebuilt = load_instance(TimeSource=TimeSource, flight_overrides=workbook_overrides(int_data, flight_times))[-1]
+
+    repaired, score, reassigned = Repair.repair_assignment(solution, flight_times, int_data, weights, near_pairs, Gates_N,
+                                                           ALPHA2, ALPHA3, T_MAX, LARGE_NEGATIVE)
+    # the repaired assignment is feasible and has the same value in the instance built from scratch with the new times
+    gate_of = gate_assignment(repaired, rebuilt)
+    assert_feasible(gate_of, rebuilt)
+    rebuilt_weights = weight_array(rebuilt, Instance.build_near_pair_index(rebuilt['time_diff'], T_MAX))
+    assert score == Heuristic.calculate_total_score(repaired, rebuilt_weights, LARGE_NEGATIVE, rebuilt['num_activities'])[0]
+    old_gate_of = gate_assignment(solution, rebuilt)
+    assert reassigned == [(act, old, new) for act, (old, new) in enumerate(zip(old_gate_of, gate_of)) if old != new]
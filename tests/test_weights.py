@@ -0,0 +1,55 @@
+import random
+
+import numpy as np
+import pytest
+
+import Heuristic
+import Instance
+import vertices_weights as vw
+
+ALPHA1, ALPHA2, ALPHA3, T_MAX = 10, 3, 100, 30
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_weight_array_matches_weight_matrix(load_instance, TimeSource):
+    data = load_instance('Estimated', TimeSource)
+    int_data, no_towable_flights = data[-1], data[21]
+    A, G = int_data['num_activities'], int_data['num_gates']
+    large_negative = vw.calculate_large_negative(A, no_towable_flights, int_data['time_diff'], ALPHA1, ALPHA2, ALPHA3, T_MAX)
+    args = (A, G, int_data['act_flight'], int_data['time_diff'], int_data['preferences'], int_data['act_successor'],
+            int_data['valid_gates'], ALPHA1, ALPHA2, ALPHA3, T_MAX, large_negative)
+    weight_dict = vw.get_weight_matrix(*args)
+    weight_array = vw.get_weight_array(*args)
+
+    expected = np.array([[weight_dict[i][j] for j in range(A + G)] for i in range(A + G)])
+    assert weight_array.shape == (A + G, A + G)
+    assert np.array_equal(weight_array, expected)
+    # the dict-of-dicts view returns the same rows
+    view = vw.WeightMatrix(weight_array)
+    assert all(view[i][j] == weight_dict[i][j] for i in range(0, A + G, 7) for j in range(A + G))
+
+def test_weight_array_with_near_pairs(load_instance):
+    int_data = load_instance()[-1]
+    A, G = int_data['num_activities'], int_data['num_gates']
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    args = (A, G, int_data['act_flight'], int_data['time_diff'], int_data['preferences'], int_data['act_successor'],
+            int_data['valid_gates'], ALPHA1, ALPHA2, ALPHA3, T_MAX, -10 ** 7)
+    assert np.array_equal(vw.get_weight_array(*args), vw.get_weight_array(*args, near_pairs))
+
+@pytest.mark.parametrize('TimeSource', ['Workbook', 'Schedule'])
+def test_solution_score_matches_total_score(load_instance, TimeSource):
+    int_data = load_instance(TimeSource=TimeSource)[-1]
+    num_activities, num_gates = int_data['num_activities'], int_data['num_gates']
+    near_pairs = Instance.build_near_pair_index(int_data['time_diff'], T_MAX)
+    arguments = (num_activities, num_gates, int_data['act_flight'], int_data['preferences'], int_data['act_successor'],
+                 int_data['valid_gates'], ALPHA1, ALPHA2, ALPHA3, T_MAX, -5000)
+    weights = vw.get_weight_array(num_activities, num_gates, int_data['act_flight'], int_data['time_diff'],
+                                  int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                                  ALPHA1, ALPHA2, ALPHA3, T_MAX, -5000, near_pairs)
+    rnd = random.Random(2)
+    for _ in range(20):
+        # random clusters, some with two gates or without gate
+        num_clusters = rnd.randrange(3, num_gates + 6)
+        solution = {cluster_id: [] for cluster_id in range(num_clusters)}
+        for vertex in range(num_activities + num_gates):
+            solution[rnd.randrange(num_clusters)].append(vertex)
+        assert vw.solution_score(solution, *arguments, near_pairs) == Heuristic.calculate_total_score(solution, weights, -5000, num_activities)
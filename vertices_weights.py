@@ -1,30 +1,24 @@
+import numpy as np
 import Instance
-def calculate_large_negative(activities_to_flights, num_activities, no_towable_flights, T_timeDiff, P_preferences, M_validGate, alpha1, alpha2, alpha3, t_max):
-    # Calculate the minimum possible alpha1 preferences by choosing the least preferred gate (alpha1)
-    min_preferences = []
-    for activity in activities_to_flights:
-        flight = activities_to_flights[activity]
-        if activity in P_preferences and flight in M_validGate:
-            flight_min_pref = min(
-                alpha1 * P_preferences[flight][gate] for gate in M_validGate[flight] if gate in P_preferences[activity])
-            min_preferences.append(flight_min_pref)
-        # print(f"Flight {flight}: Min preference = {flight_min_pref}")
-    total_min_preferences = sum(min_preferences)
+def calculate_large_negative(num_activities, no_towable_flights, T_timeDiff, alpha1, alpha2, alpha3, t_max, near_pairs=None):
+    """ Penalty weight that exceeds the objective value of any feasible solution. T_timeDiff is the array of time
+    differences in activity ID order or an Instance.ActivityTimes; only the pairs closer than t_max are visited
+    (near_pairs: Instance.NearPairIndex for t_max, built here if not given). """
+    # Minimum possible alpha1 preferences: the original bound looked activities up in the flight-keyed preference
+    # dictionary, which never matched, so this term has always been 0. It is kept at 0 so that large_negative is unchanged.
+    total_min_preferences = 0
     print(f"Total minimum preferences: {total_min_preferences}")
 
     # Calculate the maximum possible alpha2 rewards assuming every flight needs a tow (alpha2)
     max_tow_rewards = no_towable_flights * alpha2
     print(f"Max tow rewards (all flights): {max_tow_rewards}")
 
-    # Calculate the maximum possible alpha3 penalties when all flights have the least buffer time (alpha3)
-    max_buffer_penalties = 0
-    for i in activities_to_flights:
-        for j in activities_to_flights:
-            if i != j and i in T_timeDiff and j in T_timeDiff[i]:
-                if T_timeDiff[i][j] < t_max and T_timeDiff[i][j] > 0:
-                    penalty_value = alpha3 * (t_max - T_timeDiff[i][j])
-                    max_buffer_penalties += penalty_value
-                    # print(f"Buffer penalty between flight {i} and {j}: {penalty_value}")
+    # Calculate the maximum possible alpha3 penalties when all flights have the least buffer time (alpha3):
+    # all ordered pairs of different activities with 0 < T < t_max
+    if near_pairs is None:
+        near_pairs = Instance.build_near_pair_index(activity_time_diff(T_timeDiff, num_activities), t_max)
+    near_i, near_j, T_near = near_pairs.pairs_below(t_max)
+    max_buffer_penalties = (alpha3 * (t_max - T_near[(T_near > 0) & (near_i != near_j)])).sum().item()
     print(f"Total buffer penalties: {max_buffer_penalties}")
 
     # Sum all components to find the upper bound of any feasible solution's objective value
@@ -36,23 +30,30 @@ def calculate_large_negative(activities_to_flights, num_activities, no_towable_f
     print(f"Large negative value: {large_negative}")
     return large_negative
 
-def get_weight_matrix(num_activities, activities_to_flights, T_timeDiff, P_preferences, U_successor, M_validGate, alpha1, alpha2, alpha3,
-                      t_max, large_negative, gates_to_indices, indices_to_gates):
+def get_weight_matrix(num_activities, num_gates, activities_to_flights, T_timeDiff, P_preferences, U_successor, M_validGate,
+                      alpha1, alpha2, alpha3, t_max, large_negative):
+    """ Builds the weights between all vertices, keyed by vertex ID (see Instance.build_integer_ids):
+    activities are 0..num_activities-1, gates are num_activities..num_activities+num_gates-1.
+    activities_to_flights, U_successor: arrays indexed by activity ID; T_timeDiff: array in activity ID order;
+    P_preferences, M_validGate: indexed by flight ID, containing gate vertex IDs. """
+    activities = range(num_activities)
+    gates = range(num_activities, num_activities + num_gates)
+
     # 0. initialize empty weight matrix
     weights = {}
-    for node_i in list(activities_to_flights.keys()) + list(gates_to_indices.keys()):
+    for node_i in range(num_activities + num_gates):
         weights[node_i] = {}
-        for node_j in list(activities_to_flights.keys()) + list(gates_to_indices.keys()):
+        for node_j in range(num_activities + num_gates):
             if node_i == node_j:
                 weights[node_i][node_j] = 0
             else:
                 weights[node_i][node_j] = None
 
     # 1. create edges between activity nodes
-    for i in activities_to_flights:
-        for j in activities_to_flights:
+    for i in activities:
+        for j in activities:
             # 1.1 If activities belong to different flights and overlap in time: assign large negative
-            if T_timeDiff.loc[i, j] < 0:  # Activities overlap in time
+            if T_timeDiff[i, j] < 0:  # Activities overlap in time
                 weights[i][j] = large_negative
                 weights[j][i] = large_negative
             else:
@@ -63,14 +64,14 @@ def get_weight_matrix(num_activities, activities_to_flights, T_timeDiff, P_prefe
                 # 1.3 if activities do not overlap and do not succeed each other: set weight to -alpha3*excess buffer time#
                 # <=> penalty for having not enough buffer time
                 else:
-                    excess_buffer_time = max(t_max - T_timeDiff.loc[i, j], 0)
+                    excess_buffer_time = max(t_max - T_timeDiff[i, j], 0)
                     weights[i][j] = -alpha3*excess_buffer_time
                     weights[j][i] = -alpha3*excess_buffer_time
 
     # 2. weights between activity and gate nodes
-    for i in activities_to_flights:
+    for i in activities:
         flight_i = activities_to_flights[i]
-        for k in gates_to_indices:
+        for k in gates:
             if k in M_validGate[flight_i]:
                 weights[i][k] = alpha1 * P_preferences[flight_i][k]
                 weights[k][i] = alpha1 * P_preferences[flight_i][k]
@@ -79,13 +80,158 @@ def get_weight_matrix(num_activities, activities_to_flights, T_timeDiff, P_prefe
                 weights[k][i] = large_negative
 #
     # 3. weights between gates (large negative)
-    for g1 in gates_to_indices:  # Change to num_gates if it works
-        for g2 in gates_to_indices:
+    for g1 in gates:
+        for g2 in gates:
             weights[g1][g2] = large_negative
             weights[g2][g1] = large_negative
 
     return weights
 
+def activity_time_diff(T_timeDiff, num_activities):
+    """ The activity block of a dense T array (ActivityTimes are passed through). """
+    if isinstance(T_timeDiff, Instance.ActivityTimes):
+        return T_timeDiff
+    return np.asarray(T_timeDiff)[:num_activities, :num_activities]
+
+def activity_pair_weights(T_pair, are_successors, alpha2, alpha3, t_max, large_negative):
+    """ Weights of activity pairs from their time difference T_pair (T[max, min], see get_weight_array) """
+    return np.where(T_pair < 0, large_negative,                                     # 1.1 overlap
+                    np.where(are_successors, alpha2,                                # 1.2 successors
+                             np.where(T_pair < t_max, -alpha3 * (t_max - T_pair),   # 1.3 buffer time deficit
+                                      0)))
+
+def update_weight_rows(weights, changed, T_timeDiff, U_successor, alpha2, alpha3, t_max, large_negative):
+    """ Recompute the weights between the activities in changed and all activities (rows and columns of the array of
+    get_weight_array, in place) after their times have changed. The weights to the gates do not depend on the times. """
+    num_activities = len(U_successor)
+    successor = np.asarray(U_successor)
+    others = np.arange(num_activities)
+    for act in np.asarray(changed).tolist():
+        T_pair = np.asarray(T_timeDiff[np.maximum(others, act), np.minimum(others, act)])
+        are_successors = (successor == act) | (others == successor[act])
+        row = activity_pair_weights(T_pair, are_successors, alpha2, alpha3, t_max, large_negative)
+        weights[act, :num_activities] = row
+        weights[:num_activities, act] = row
+    return weights
+
+def get_weight_array(num_activities, num_gates, activities_to_flights, T_timeDiff, P_preferences, U_successor, M_validGate,
+                     alpha1, alpha2, alpha3, t_max, large_negative, near_pairs=None):
+    """ Same weights as get_weight_matrix, but as one contiguous (A+G) x (A+G) array indexed by vertex ID, filled with
+    vectorized expressions. The dtype is int32 if all weights are integral and fit, float64 otherwise (float32 would
+    round the large sums of large_negative weights). Wrap the array in WeightMatrix for callers that need the
+    dict-of-dicts interface. T_timeDiff is the array of time differences in activity ID order or an
+    Instance.ActivityTimes; only activity pairs in near_pairs (Instance.NearPairIndex for t_max, built here if not
+    given) get a weight other than 0 or alpha2. """
+    A = num_activities
+    G = num_gates
+    if near_pairs is None:
+        near_pairs = Instance.build_near_pair_index(activity_time_diff(T_timeDiff, A), t_max)
+    weights = np.zeros((A + G, A + G), dtype=np.float64)
+
+    # 1. edges between activity nodes
+    # pairs at least t_max apart: alpha2 if successors, otherwise no buffer penalty (0)
+    act_ids = np.arange(A)
+    successor = np.asarray(U_successor)
+    has_successor = successor >= 0
+    weights[act_ids[has_successor], successor[has_successor]] = alpha2
+    weights[successor[has_successor], act_ids[has_successor]] = alpha2
+    are_successors = weights[:A, :A] != 0
+
+    # pairs closer than t_max (and the diagonal, if listed). get_weight_matrix sets weights[i][j] and weights[j][i] from
+    # T[i, j] for every ordered pair (i, j), so the value of the pair visited last (larger row index) is the one that
+    # remains: use T[max, min]
+    near_i, near_j, T_near = near_pairs.pairs_below(t_max)
+    lower = near_i >= near_j
+    near_i, near_j, T_near = near_i[lower], near_j[lower], T_near[lower]
+    near = activity_pair_weights(T_near, are_successors[near_i, near_j], alpha2, alpha3, t_max, large_negative)
+    weights[near_i, near_j] = near
+    weights[near_j, near_i] = near
+
+    # 2. weights between activity and gate nodes: alpha1 * preference for valid gates, large negative otherwise
+    num_flights = len(M_validGate)
+    flight_prefs = np.full((num_flights, G), large_negative, dtype=np.float64)
+    for flight in range(num_flights):
+        for gate in M_validGate[flight]:
+            flight_prefs[flight, gate - A] = alpha1 * P_preferences[flight][gate]
+    act_gate = flight_prefs[np.asarray(activities_to_flights)]
+    weights[:A, A:] = act_gate
+    weights[A:, :A] = act_gate.T
+
+    # 3. weights between gates (large negative)
+    weights[A:, A:] = large_negative
+
+    int32 = np.iinfo(np.int32)
+    if np.array_equal(weights, np.round(weights)) and int32.min <= weights.min() and weights.max() <= int32.max:
+        return weights.astype(np.int32)
+    return weights
+
+def solution_score(solution, num_activities, num_gates, activities_to_flights, P_preferences, U_successor, M_validGate,
+                   alpha1, alpha2, alpha3, t_max, large_negative, near_pairs):
+    """ Same values as Heuristic.calculate_total_score(solution, weights, large_negative, num_activities) with the
+    weights of get_weight_array (score, score excl. penalties, number of unassigned activities), computed from the
+    near pairs, the successors and the gates of the clusters instead of the (A+G) x (A+G) array. """
+    A = num_activities
+    cluster = np.full(A + num_gates, -1, dtype=np.int64)
+    for cluster_id in solution:
+        cluster[list(solution[cluster_id])] = cluster_id
+    act_cluster = cluster[:A]
+    gate_cluster = cluster[A:]
+
+    # 1. activity pairs in the same cluster: the pairs closer than t_max, and the other successor pairs (alpha2)
+    near_i, near_j, T_near = near_pairs.pairs_below(t_max)
+    lower = near_i > near_j
+    near_i, near_j, T_near = near_i[lower], near_j[lower], T_near[lower]
+    successor = np.asarray(U_successor)
+    are_successors = (successor[near_i] == near_j) | (successor[near_j] == near_i)
+    same = (act_cluster[near_i] == act_cluster[near_j]) & (act_cluster[near_i] >= 0)
+    pair_total = activity_pair_weights(T_near[same], are_successors[same], alpha2, alpha3, t_max, large_negative).sum().item()
+    act_ids = np.nonzero(successor >= 0)[0]
+    successors_together = np.count_nonzero(act_cluster[act_ids] == act_cluster[successor[act_ids]])
+    pair_total += alpha2 * (successors_together - np.count_nonzero(same & are_successors))
+
+    # 2. activities and gates in the same cluster
+    cluster_gates = {}
+    for g in np.nonzero(gate_cluster >= 0)[0].tolist():
+        cluster_gates.setdefault(gate_cluster[g].item(), []).append(A + g)
+    for act in range(A):
+        for gate in cluster_gates.get(act_cluster[act].item(), []):
+            flight = activities_to_flights[act]
+            pair_total += alpha1 * P_preferences[flight][gate] if gate in M_validGate[flight] else large_negative
+
+    # 3. gate pairs in the same cluster
+    for gates in cluster_gates.values():
+        pair_total += large_negative * (len(gates) * (len(gates) - 1) // 2)
+
+    score_excl_penalties = 2 * pair_total
+    no_unassigned_activities = sum(len(solution[cluster_id]) for cluster_id in solution if cluster_id not in cluster_gates)
+    return score_excl_penalties + large_negative * no_unassigned_activities, score_excl_penalties, no_unassigned_activities
+
+class WeightMatrix:
+    """ Dict-of-dicts compatible view of the array returned by get_weight_array: weights[i][j], iterating over the
+    vertex IDs, keys(), items() and len() behave like the dictionary returned by get_weight_matrix. Array-style indexing
+    (weights[i, j], weights[i, cluster], weights[np.ix_(...)]) is passed through to the array. """
+
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, key):
+        return self.array[key]
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(range(len(self.array)))
+
+    def __contains__(self, vertex):
+        return isinstance(vertex, (int, np.integer)) and 0 <= vertex < len(self.array)
+
+    def keys(self):
+        return range(len(self.array))
+
+    def items(self):
+        return ((vertex, self.array[vertex]) for vertex in range(len(self.array)))
+
 # Example usage:
 def TryThingsOut():
     alpha1 = 1  # Preference scaling factor
@@ -99,10 +245,12 @@ def TryThingsOut():
          flights_to_activities, activities_to_flights, U_successor, no_towable_flights, num_activities,
          M_validGate,
          shadow_constraints,
-         gates_to_indices, indices_to_gates) = Instance.createInputData(local_path, False, "Real")
-    large_negative = calculate_large_negative(activities_to_flights, num_activities, no_towable_flights, T_timeDiff, P_preferences, M_validGate, alpha1, alpha2, alpha3, t_max)
-    weights = get_weight_matrix(num_activities, activities_to_flights, T_timeDiff, P_preferences, U_successor, M_validGate, alpha1, alpha2, alpha3,
-                          t_max, large_negative, gates_to_indices, indices_to_gates)
+         gates_to_indices, indices_to_gates,
+         int_data) = Instance.createInputData(local_path, False, "Real")
+    large_negative = calculate_large_negative(int_data['num_activities'], no_towable_flights, int_data['time_diff'], alpha1, alpha2, alpha3, t_max)
+    weights = get_weight_matrix(int_data['num_activities'], int_data['num_gates'], int_data['act_flight'], int_data['time_diff'],
+                                int_data['preferences'], int_data['act_successor'], int_data['valid_gates'],
+                                alpha1, alpha2, alpha3, t_max, large_negative)
 
 
     print(f"Here: {weights}")